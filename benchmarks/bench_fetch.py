@@ -0,0 +1,255 @@
+from __future__ import annotations
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import pandas as pd
+
+from benchmarks.fake_rudata import FakeRuData, REPLAY_DIR
+
+try:
+    import resource
+except ImportError:  # Windows: пиковая память не измеряется
+    resource = None
+
+
+class IdsClient:
+    """
+    Замена ClickHouse в payloads() методов со списками id: на SELECT DISTINCT <колонка> возвращает
+    ids синтетических значений. Выданные значения (keys) - ожидаемые строки ответа для методов с batch_key
+    """
+
+    def __init__(self, ids: int):
+        self.ids = ids
+        self.keys: Set[str] = set()
+
+    def values(self, column: str) -> list:
+        column = column.lower()
+        if column in ('isincode', 'isin'):
+            return [f'RU{i:010d}' for i in range(self.ids)]
+        if column == 'inn':
+            return [str(7700000000 + i) for i in range(self.ids)]
+        if column == 'currency':
+            return [f'C{i:02d}' for i in range(min(self.ids, 100))]
+        return list(range(1, self.ids + 1))
+
+    def query_df(self, query: str, parameters: Optional[dict] = None) -> pd.DataFrame:
+        match = re.search(r'SELECT\s+DISTINCT\s+(\w+)', query, re.IGNORECASE)
+        if match is None:
+            raise ValueError(f"IdsClient supports only SELECT DISTINCT <column>: {query}")
+        values: list = self.values(match.group(1))
+        self.keys.update(str(value) for value in values)
+        return pd.DataFrame({match.group(1): values})
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss - килобайты в Linux, байты в macOS
+    scale: int = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def method_names() -> List[str]:
+    """
+    Все методы RuDataMethod, кроме Account
+    """
+    from src.sources.rudata import RuDataMethod
+    from src.sources.rudata.RuDataDF import RuDataDF
+
+    return [
+        name for name, value in vars(RuDataMethod).items()
+        if isinstance(value, type) and issubclass(value, RuDataDF)
+        and value.__module__ == RuDataMethod.__name__ and name != 'Account'
+    ]
+
+
+def fetch_method(name: str, month: str, ids: int, verbose: bool = False) -> dict:
+    """
+    send_requests метода в отдельном процессе (пиковая память - только этого метода), без ClickHouse и журнала
+    """
+    from src.logger.Logger import Logger
+    from src.utils.http_session import run
+    from src.utils.metrics import metrics
+    from src.utils.run_context import RunContext
+    from src.sources.rudata import RuDataMethod
+    from src.sources.rudata.RuData import BASE_URL
+
+    Logger()
+    if not verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+    rss_start: Optional[float] = peak_rss_mb()
+    RuDataMethod.Account()
+    method = getattr(RuDataMethod, name)(context=RunContext.for_month(month))
+    method.checkpoint = ''
+    method.client = IdsClient(ids)
+    start: float = time.perf_counter()
+    df: pd.DataFrame = run(method.send_requests())
+    wall: float = time.perf_counter() - start
+    if '_key' in df.columns:
+        keys: List[str] = df['_key'].astype(str).tolist()
+        duplicates: int = len(keys) - len(set(keys))
+    else:
+        # записанные ответы API: дубли - полностью совпадающие строки
+        keys = []
+        duplicates = int(df.astype(str).duplicated().sum()) if not df.empty else 0
+    return {
+        'endpoint': method.url.removeprefix(BASE_URL + '/'),
+        'rows': len(df),
+        'wall_s': wall,
+        'peak_rss_mb': peak_rss_mb(),
+        'start_rss_mb': rss_start,
+        'duplicates': duplicates,
+        'keys': keys,
+        'ids': sorted(method.client.keys) if method.batch_key else [],
+        # повторы, ожидание лимитера, гистограмма времени ответа и время конвертации (см. RunMetrics)
+        'metrics': metrics.summary()['endpoints'].get(name),
+    }
+
+
+def bench(
+        server: FakeRuData,
+        methods: List[str],
+        month: str,
+        ids: int,
+        verbose: bool = False,
+) -> Dict[str, dict]:
+    """
+    Методы по очереди, каждый в новом процессе. По каждому методу: запросы в секунду, время,
+    пиковая память процесса, строки, дубли и пропуски (строки, которые сервер отдавал, но их нет в результате)
+    """
+    results: Dict[str, dict] = {}
+    for name in methods:
+        server.reset()
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            try:
+                result: dict = pool.submit(fetch_method, name, month, ids, verbose).result()
+            except Exception as e:
+                results[name] = {'error': f'{type(e).__name__}: {e}'}
+                print(f'{name:<24} FAILED {type(e).__name__}: {e}')
+                continue
+        stats = server.stats.get(result['endpoint'])
+        keys: List[str] = result.pop('keys')
+        expected: Set[str] = server.expected(result['endpoint']) | set(result.pop('ids'))
+        result['missing'] = len(expected - set(keys)) if keys or not result['rows'] else None
+        if stats is not None:
+            result.update(stats.as_dict())
+            result['requests_per_s'] = stats.requests / result['wall_s'] if result['wall_s'] else None
+        results[name] = result
+        print(format_result(name, result))
+    return results
+
+
+def format_result(name: str, result: dict) -> str:
+    def value(key: str, spec: str) -> str:
+        return 'n/a' if result.get(key) is None else format(result[key], spec)
+
+    return (
+        f"{name:<24} {value('requests_per_s', '8.1f')} req/s {value('wall_s', '7.2f')} s "
+        f"{value('requests', '6d')} req {value('rows', '8d')} rows {value('peak_rss_mb', '7.1f')} MB "
+        f"dup {value('duplicates', 'd')} miss {value('missing', 'd')} "
+        f"401 {value('unauthorized', 'd')} injected {result.get('injected', {})}"
+    )
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Регрессии относительно прошлого прогона: запросов в секунду меньше на tolerance и больше,
+    ошибки метода, дубли или пропуски строк
+    """
+    problems: List[str] = []
+    for name, result in results.items():
+        if 'error' in result:
+            problems.append(f"{name}: {result['error']}")
+            continue
+        if result.get('duplicates') or result.get('missing'):
+            problems.append(f"{name}: {result['duplicates']} duplicate and {result['missing']} missing rows")
+        before: Optional[float] = baseline.get(name, {}).get('requests_per_s')
+        after: Optional[float] = result.get('requests_per_s')
+        if before and after is not None and after < before * (1 - tolerance):
+            problems.append(f"{name}: {after:.1f} req/s, baseline {before:.1f} req/s")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    python -m benchmarks.bench_fetch --latency 0.05 --error-rate 0.05 --output data/Benchmarks/today.json
+    python -m benchmarks.bench_fetch EndOfDayOnExchanges FloaterData --baseline data/Benchmarks/today.json
+    """
+    parser = argparse.ArgumentParser(description='Бенчмарк загрузки методов RuData на локальном сервере')
+    parser.add_argument('methods', nargs='*', help='методы RuDataMethod, по умолчанию все')
+    parser.add_argument('--month', default='2025-06', help='отчетный месяц payloads, YYYY-MM')
+    parser.add_argument('--rows', type=int, default=3000, help='строк в постраничных методах')
+    parser.add_argument('--ids', type=int, default=500, help='id в методах со списком id')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа, секунд')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 429/503')
+    parser.add_argument('--token-ttl', type=float, default=None, help='через сколько секунд токен получает 401')
+    parser.add_argument('--seed', type=int, default=1, help='seed ошибок сервера: прогоны с одним seed повторяемы')
+    parser.add_argument('--rps', type=float, default=200, help='RUDATA_RPS клиента')
+    parser.add_argument('--replay-dir', type=Path, default=None, help=f'записанные ответы, например {REPLAY_DIR}')
+    parser.add_argument('--record-from', default=None, help='URL API: записать ответы в replay-dir')
+    parser.add_argument('--output', type=Path, default=None, help='результаты в JSON')
+    parser.add_argument('--baseline', type=Path, default=None, help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое падение запросов в секунду')
+    parser.add_argument('--verbose', action='store_true', help='логи загрузки')
+    args = parser.parse_args(argv)
+    if args.record_from and args.replay_dir is None:
+        args.replay_dir = REPLAY_DIR
+
+    server = FakeRuData(
+        rows=args.rows,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        token_ttl=args.token_ttl,
+        replay_dir=args.replay_dir,
+        record_from=args.record_from,
+        seed=args.seed,
+    ).start()
+    state = tempfile.TemporaryDirectory()
+    # переменные наследуют процессы методов
+    os.environ.update({
+        'RUDATA_BASE_URL': server.base_url,
+        'RUDATA_TOKEN_CACHE': str(Path(state.name, 'token.json')),
+        'RUDATA_RPS': str(args.rps),
+        'RUDATA_CHECKPOINT': '',
+        'RUDATA_BATCH_STATE': '',
+        'RUDATA_HTTP_CACHE': '0',
+        'RUDATA_INCREMENTAL': '0',
+        'RUDATA_DELTA': '0',
+    })
+    if not args.record_from:
+        os.environ.setdefault('LOGIN', 'benchmark')
+        os.environ.setdefault('PASSWORD', 'benchmark')
+    try:
+        start: float = time.perf_counter()
+        results: Dict[str, dict] = bench(server, args.methods or method_names(), args.month, args.ids, args.verbose)
+        print(f'{len(results)} methods in {time.perf_counter() - start:.1f}s')
+    finally:
+        server.stop()
+        state.cleanup()
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        config: dict = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+        args.output.write_text(json.dumps({'config': config, 'results': results}, indent=2, ensure_ascii=False))
+    if args.baseline is not None:
+        problems: List[str] = compare(results, json.loads(args.baseline.read_text())['results'], args.tolerance)
+        for problem in problems:
+            print(f'REGRESSION {problem}')
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
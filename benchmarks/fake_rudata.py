@@ -0,0 +1,346 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import aiohttp
+from aiohttp import web
+
+from src.utils.path import get_project_root
+from src.utils.response_cache import cache_key
+
+
+REPLAY_DIR: Path = Path.joinpath(get_project_root(), 'data/Benchmarks/replay')
+
+
+class EndpointStats:
+    """
+    Счетчики одного endpoint (путь после /v2, например Info/Emitents)
+    """
+
+    def __init__(self):
+        self.requests: int = 0
+        self.injected: Dict[int, int] = {}
+        self.unauthorized: int = 0
+        self.replayed: int = 0
+        self.bytes: int = 0
+        # ключи строк, которые сервер отдает на полученные payloads (см. FakeRuData.expected)
+        self.keys: Set[str] = set()
+        self.total: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'injected': {str(status): count for status, count in sorted(self.injected.items())},
+            'unauthorized': self.unauthorized,
+            'replayed': self.replayed,
+            'bytes': self.bytes,
+        }
+
+
+class FakeRuData:
+    """
+    Локальная замена dh2.efir-net.ru/v2 для бенчмарков и отладки загрузки без платного API.
+    Клиент направляется на сервер через RUDATA_BASE_URL=http://127.0.0.1:<port>/v2.
+
+    Ответы:
+    - записанные: файл <replay_dir>/<endpoint>/<cache_key(endpoint, payload)>.json. record_from=<URL API> -
+      запросы, которых нет в replay_dir, проксируются в настоящий API, ответ записывается
+    - синтетические (если записи нет): страницы pageNum/pageSize или pager из rows строк, строка на каждый id
+      списка в payload, объект курса на пару from/to, одна строка на isin, для остальных - dictionary_rows строк.
+      В каждой строке _key - ключ для подсчета дублей и пропусков на стороне клиента
+
+    latency и jitter - задержка ответа в секундах, error_rate - доля ответов со статусом из error_statuses
+    (с Retry-After), token_ttl - через сколько секунд токен, выданный Account/Login, отклоняется с 401.
+    Ошибка выбирается по seed, payload и номеру попытки, а не по порядку запросов, поэтому прогоны
+    с одним seed воспроизводимы. Каждый payload получает не больше max_errors ошибок: ошибки
+    моделируют временный сбой, который повторы клиента переживают.
+
+    server = FakeRuData(latency=0.02, error_rate=0.05).start()
+    os.environ['RUDATA_BASE_URL'] = server.base_url
+    ...
+    server.stats['Info/Emitents'].requests
+    server.stop()
+    """
+
+    def __init__(
+            self,
+            rows: int = 3000,
+            dictionary_rows: int = 100,
+            latency: float = 0.02,
+            jitter: float = 0.01,
+            error_rate: float = 0.0,
+            error_statuses: Sequence[int] = (429, 503),
+            retry_after: float = 0.1,
+            token_ttl: Optional[float] = None,
+            row_bytes: int = 200,
+            replay_dir: Optional[Path] = None,
+            record_from: Optional[str] = None,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            seed: int = 1,
+            max_errors: int = 2,
+    ):
+        self.rows = rows
+        self.dictionary_rows = dictionary_rows
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.row_bytes = row_bytes
+        self.replay_dir: Optional[Path] = Path(replay_dir) if replay_dir else None
+        self.record_from: Optional[str] = record_from.rstrip('/') if record_from else None
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.max_errors = max_errors
+        self._random = random.Random(seed)
+        # номер попытки по cache_key(endpoint, payload) для выбора ошибок
+        self._attempts: Dict[str, int] = {}
+        self._tokens: Dict[str, float] = {}
+        self.stats: Dict[str, EndpointStats] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._upstream: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}/v2'
+
+    def reset(self) -> None:
+        """
+        Обнуление счетчиков перед следующим прогоном, выданные токены сохраняются
+        """
+        self.stats = {}
+        self._attempts = {}
+
+    def expected(self, endpoint: str) -> Set[str]:
+        """
+        Ключи строк, которые должен получить клиент: все страницы endpoint и ответы на все полученные payloads
+        (в том числе на запросы, отклоненные ошибкой, - клиент должен был их повторить)
+        """
+        stats: Optional[EndpointStats] = self.stats.get(endpoint)
+        if stats is None:
+            return set()
+        return stats.keys | ({str(i) for i in range(stats.total)} if stats.total is not None else set())
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 2 ** 20)
+        app.router.add_post('/v2/Account/Login', self.login)
+        app.router.add_post('/v2/{endpoint:.+}', self.handle)
+        app.on_cleanup.append(self._close_upstream)
+        return app
+
+    def start(self) -> FakeRuData:
+        """
+        Запуск в отдельном потоке со своим event loop, port=0 - свободный порт
+        """
+        started = threading.Event()
+
+        def serve() -> None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='FakeRuData', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    async def _close_upstream(self, app: web.Application) -> None:
+        if self._upstream is not None:
+            await self._upstream.close()
+
+    async def login(self, request: web.Request) -> web.Response:
+        if self.record_from:
+            return await self.proxy(request, 'Account/Login', await request.json(), record=False)
+        token: str = uuid.uuid4().hex
+        self._tokens[token] = time.monotonic()
+        return web.json_response({'token': token})
+
+    def _authorized(self, request: web.Request) -> bool:
+        token: str = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        issued: Optional[float] = self._tokens.get(token)
+        if issued is None:
+            return False
+        return self.token_ttl is None or time.monotonic() - issued < self.token_ttl
+
+    async def handle(self, request: web.Request) -> web.Response:
+        endpoint: str = request.match_info['endpoint']
+        stats: EndpointStats = self.stats.setdefault(endpoint, EndpointStats())
+        stats.requests += 1
+        payload = await request.json()
+        if not self.record_from and not self._authorized(request):
+            stats.unauthorized += 1
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+
+        recorded: Optional[bytes] = self._replay(endpoint, payload)
+        if recorded is None and self.record_from is None:
+            body, keys, total = self.synthesize(endpoint, payload)
+            stats.keys.update(keys)
+            if total is not None:
+                stats.total = total
+        await asyncio.sleep(max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0))
+        status: Optional[int] = self.injected_error(endpoint, payload)
+        if status is not None:
+            stats.injected[status] = stats.injected.get(status, 0) + 1
+            return web.json_response(
+                {'message': 'injected error'}, status=status, headers={'Retry-After': str(self.retry_after)}
+            )
+        if recorded is not None:
+            stats.replayed += 1
+            stats.bytes += len(recorded)
+            return web.Response(body=recorded, content_type='application/json')
+        if self.record_from is not None:
+            return await self.proxy(request, endpoint, payload)
+        data: bytes = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        stats.bytes += len(data)
+        return web.Response(body=data, content_type='application/json')
+
+    def injected_error(self, endpoint: str, payload) -> Optional[int]:
+        """
+        Статус ошибки для очередной попытки payload или None. Зависит только от seed, payload и попытки
+        """
+        if not self.error_rate:
+            return None
+        key: str = cache_key(endpoint, payload)
+        attempt: int = self._attempts.get(key, 0)
+        if attempt >= self.max_errors:
+            return None
+        rng = random.Random(f'{self.seed}:{key}:{attempt}')
+        if rng.random() >= self.error_rate:
+            self._attempts[key] = self.max_errors
+            return None
+        self._attempts[key] = attempt + 1
+        return rng.choice(self.error_statuses)
+
+    def _record_path(self, endpoint: str, payload) -> Path:
+        return Path.joinpath(self.replay_dir, endpoint, f'{cache_key(endpoint, payload)}.json')
+
+    def _replay(self, endpoint: str, payload) -> Optional[bytes]:
+        if self.replay_dir is None:
+            return None
+        try:
+            return self._record_path(endpoint, payload).read_bytes()
+        except OSError:
+            return None
+
+    async def proxy(self, request: web.Request, endpoint: str, payload, record: bool = True) -> web.Response:
+        """
+        Запрос в настоящий API. Успешный ответ записывается в replay_dir (токен логина не записывается)
+        """
+        if self._upstream is None:
+            self._upstream = aiohttp.ClientSession()
+        headers: Dict[str, str] = {
+            key: value for key, value in request.headers.items() if key in ('Authorization', 'Content-Type')
+        }
+        async with self._upstream.post(f'{self.record_from}/{endpoint}', json=payload, headers=headers) as response:
+            body: bytes = await response.read()
+            if record and response.ok and self.replay_dir is not None:
+                path: Path = self._record_path(endpoint, payload)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(body)
+            return web.Response(body=body, status=response.status, content_type='application/json')
+
+    def synthesize(self, endpoint: str, payload) -> Tuple[object, List[str], Optional[int]]:
+        """
+        Синтетический ответ на payload: (тело, ключи строк, общее количество строк для постраничных методов)
+        """
+        payload = payload if isinstance(payload, dict) else {}
+        date: str = next((payload[key] for key in ('date', 'dateTo', 'endDate', 'actualDate') if payload.get(key)), '')
+        page = payload.get('pageNum') or (payload.get('pager') or {}).get('page')
+        if page is not None:
+            size: int = payload.get('pageSize') or (payload.get('pager') or {}).get('size') or 100
+            keys = [str(i) for i in range((page - 1) * size, min(page * size, self.rows))]
+            return [self.row(endpoint, key, date) for key in keys], keys, self.rows
+        # список id - первый непустой список payload, кроме списка колонок fields
+        ids: Optional[list] = next(
+            (value for key, value in payload.items() if key != 'fields' and isinstance(value, list) and value), None
+        )
+        if ids is not None:
+            keys = [str(value['id'] if isinstance(value, dict) else value) for value in ids]
+            return [self.row(endpoint, key, date) for key in keys], keys, None
+        if 'from' in payload and 'to' in payload:
+            key: str = f"{payload['from']}/{payload['to']}"
+            rate: float = 1 + self._random.random()
+            return {'_key': key, 'rate': rate, 'date': date}, [key], None
+        if payload.get('isin'):
+            key = str(payload['isin'])
+            return [self.row(endpoint, key, date)], [key], None
+        prefix: str = cache_key(endpoint, payload)[:8]
+        keys = [f'{prefix}:{i}' for i in range(self.dictionary_rows)]
+        return [self.row(endpoint, key, date) for key in keys], keys, None
+
+    def row(self, endpoint: str, key: str, date: str) -> dict:
+        return {
+            '_key': key,
+            'endpoint': endpoint,
+            'name': f'{endpoint} {key}',
+            'value': round(self._random.random() * 100, 4),
+            'date': date,
+            'comment': 'x' * self.row_bytes,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    python -m benchmarks.fake_rudata --port 8085 --latency 0.05 --error-rate 0.02
+    python -m benchmarks.fake_rudata --port 8085 --record-from https://dh2.efir-net.ru/v2  # запись ответов API
+    """
+    parser = argparse.ArgumentParser(description='Локальный сервер вместо API RuData')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--rows', type=int, default=3000, help='строк в постраничных методах')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа, секунд')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 429/503')
+    parser.add_argument('--token-ttl', type=float, default=None, help='время жизни токена, секунд')
+    parser.add_argument('--seed', type=int, default=1, help='seed ошибок и значений ответов')
+    parser.add_argument('--replay-dir', type=Path, default=None, help=f'записанные ответы, например {REPLAY_DIR}')
+    parser.add_argument('--record-from', default=None, help='URL API, ответы которого записываются в replay-dir')
+    args = parser.parse_args(argv)
+    if args.record_from and args.replay_dir is None:
+        args.replay_dir = REPLAY_DIR
+    server = FakeRuData(
+        rows=args.rows,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        token_ttl=args.token_ttl,
+        replay_dir=args.replay_dir,
+        record_from=args.record_from,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    print(f'RUDATA_BASE_URL={server.base_url}')
+    web.run_app(server.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
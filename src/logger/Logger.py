@@ -59,9 +59,10 @@ class Logger(logging.Logger):
         """
         @wraps(func)
         def wrapper(*args, **kwargs):
-            cls._instance.info(f"{args[0].key} started")
+            name: str = getattr(args[0], 'name', func.__qualname__)
+            cls._instance.info(f"{name} started")
             result: DataFrame = func(*args, **kwargs)
-            cls._instance.info(f"{args[0].key} finished. {args[0].key} shape {result.shape}")
+            cls._instance.info(f"{name} finished. {name} shape {result.shape}")
             time.sleep(1)
             return result
         return wrapper
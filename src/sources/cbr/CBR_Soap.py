@@ -1,4 +1,4 @@
-import requests
+import tempfile
 import pandas as pd
 from pysimplesoap.client import SoapClient
 from collections import OrderedDict
@@ -6,6 +6,9 @@ import xmltodict
 import xml.etree.ElementTree as ET
 from contextlib import suppress
 from datetime import datetime as dt
+from pathlib import Path
+from src.utils.http_session import http_pool
+from src.utils.response_cache import cache_ttl, get_response_cache
 
 
 class CBR_Soap:
@@ -54,27 +57,47 @@ class CBR_Soap:
                                         'MosPrime 3M', 'MosPrime 6M']},
                }
     tags = {'GetCursDynamic': 'ValuteData'}
+    # время жизни ответов в кэше на диске (RUDATA_HTTP_CACHE), секунд: по умолчанию 12 часов,
+    # справочники и описание WSDL - 30 дней. RUDATA_CACHE_TTL_CBR_<ОПЕРАЦИЯ> заменяет значение
+    cache_ttl = 12 * 3600
+    cache_ttls = {'EnumValutes': 30 * 24 * 3600, 'EnumValutesXML': 30 * 24 * 3600, 'wsdl': 30 * 24 * 3600}
 
     def __init__(self):
-        client = SoapClient(wsdl=self.wsdl_url_daily, namespace=self.cbr_namespace, trace=False)
-        wsdl_info = client.wsdl_parse(self.wsdl_url_daily)['DailyInfo']['ports']['DailyInfoSoap']['operations']
-
         def modify_wsdl_info(wsdl_info, url):
             for op in wsdl_info:
                 pointer = wsdl_info[op]['input']
                 for x in pointer:
                     pointer[x] = OrderedDict(pointer[x])
-                # 'outputs' are unpicklable and not used here, delete them from
+                # 'outputs' are not used here, delete them
                 del wsdl_info[op]['output']
                 wsdl_info[op]['url'] = url
             return wsdl_info
 
+        wsdl_info = self.wsdl_parse(self.wsdl_url_daily)['DailyInfo']['ports']['DailyInfoSoap']['operations']
         self.wsdl_info = modify_wsdl_info(wsdl_info, self.url_daily)
-        client = SoapClient(wsdl=self.wsdl_url_sec, namespace=self.cbr_namespace, trace=False)
-        wsdl_info = client.wsdl_parse(self.wsdl_url_sec)['SecInfo']['ports']['SecInfoSoap']['operations']
+        wsdl_info = self.wsdl_parse(self.wsdl_url_sec)['SecInfo']['ports']['SecInfoSoap']['operations']
         wsdl_info = modify_wsdl_info(wsdl_info, self.url_sec)
         self.wsdl_info.update(wsdl_info)
 
+    def wsdl_parse(self, wsdl_url):
+        """
+        Разбор описания WSDL. В кэше на диске (RUDATA_HTTP_CACHE) хранится только исходный XML,
+        разобранное описание каждый раз строится заново: из общего каталога кэша ничего не десериализуется
+        """
+        cache = get_response_cache()
+        ttl = cache_ttl('CBR_wsdl', self.cache_ttls['wsdl'])
+        content = cache.get('wsdl', wsdl_url, ttl) if cache is not None and ttl else None
+        if content is None:
+            response = http_pool.requests_session().get(wsdl_url)
+            response.raise_for_status()
+            content = response.content
+            if cache is not None and ttl:
+                cache.put('wsdl', wsdl_url, content)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'service.wsdl')
+            path.write_bytes(content)
+            return SoapClient(namespace=self.cbr_namespace, trace=False).wsdl_parse(path.as_uri())
+
     def show_operations(self):
         for op in self.wsdl_info:
             print(op, self.wsdl_info[op]['documentation'])
@@ -129,6 +152,22 @@ class CBR_Soap:
             'SOAPAction': 'http://web.cbr.ru/%s' % self.operation
         }
 
+    def post(self):
+        """
+        Запрос операции self.operation с телом self.body, ответ (bytes) берется из кэша на диске, если он включен
+        """
+        url = self.wsdl_info[self.operation]['url']
+        cache = get_response_cache()
+        ttl = cache_ttl('CBR_' + self.operation, self.cache_ttls.get(self.operation, self.cache_ttl))
+        if cache is not None and ttl:
+            content = cache.get(url, self.body, ttl)
+            if content is not None:
+                return content
+        response = http_pool.requests_session().post(url, data=self.body, headers=self.headers)
+        if cache is not None and ttl and response.ok:
+            cache.put(url, self.body, response.content)
+        return response.content
+
     def get_data(self, operation, *args, tag=""):
         """SOAP call to CBR backend"""
 
@@ -140,19 +179,19 @@ class CBR_Soap:
         self.make_xml_param_string(self.operation)
         self.body = self.make_body()
         self.headers = self.make_headers()
-        response = requests.post(self.wsdl_info[self.operation]['url'], data=self.body, headers=self.headers)
+        content = self.post()
 
         if len(tag) > 0:
             name = tag
         elif name in self.tags.keys():
             name = self.tags[name]
         try:
-            df = pd.read_xml(response.content, xpath=f".//{name}/*")
+            df = pd.read_xml(content, xpath=f".//{name}/*")
         except ValueError:
             try:
-                df = pd.read_xml(response.content, xpath=f".//{name}")
+                df = pd.read_xml(content, xpath=f".//{name}")
             except ValueError:
-                return response.content
+                return content
         name = operation[:-3] if operation[-3:] == "XML" else operation
         if name in self.tr_dict.keys():
             df = self.simple_transform(df, name)
@@ -165,8 +204,8 @@ class CBR_Soap:
         self.make_xml_param_string(self.operation)
         self.body = self.make_body()
         self.headers = self.make_headers()
-        response = requests.post(self.wsdl_info[self.operation]['url'], data=self.body, headers=self.headers)
-        df = pd.read_xml(response.content, xpath=f".//ValuteData/*")
+        content = self.post()
+        df = pd.read_xml(content, xpath=f".//ValuteData/*")
         df['Vcurs'] /= df.loc[0, 'Vnom']
         df['CursDate'] = df['CursDate'].apply(lambda x: dt.strptime(x[:10], "%Y-%m-%d"))
         df = df.loc[:, ['CursDate', 'Vcurs']].set_index('CursDate').sort_index()
@@ -192,8 +231,8 @@ class CBR_Soap:
         self.make_xml_param_string(self.operation)
         self.body = self.make_body()
         self.headers = self.make_headers()
-        response = requests.post(self.wsdl_info[self.operation]['url'], data=self.body, headers=self.headers)
-        root = ET.fromstring(response.content)
+        content = self.post()
+        root = ET.fromstring(content)
         di = xmltodict.parse(root.findall(".//SRC")[0].text)
         cols = []
         for col in di['InfoDirectRepo' + currency]['head']['dt']:
@@ -1,10 +1,15 @@
 from __future__ import annotations
+import os
 from collections.abc import Iterable
 import pandas as pd
 from abc import ABC, abstractmethod
 from typing import List
 
 
+# адрес API RuData. RUDATA_BASE_URL - другой сервер, например локальный benchmarks/fake_rudata.py
+BASE_URL: str = os.environ.get('RUDATA_BASE_URL', 'https://dh2.efir-net.ru/v2').rstrip('/')
+
+
 class RuDataStrategy(ABC):
 
     @abstractmethod
@@ -12,5 +17,5 @@ class RuDataStrategy(ABC):
         pass
 
     @abstractmethod
-    async def send_requests(self) -> pd.DataFrame:
+    async def send_requests(self, session=None) -> pd.DataFrame:
         pass
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence
+
+from src.logger.Logger import Logger
+
+
+logger = Logger()
+
+
+def load_month(
+        month: str,
+        methods: Sequence[str],
+        rps: Optional[float] = None,
+        reload: bool = False,
+) -> Dict[str, float]:
+    """
+    Загрузка методов за отчетный месяц 'YYYY-MM' в отдельном процессе: каждый месяц пишет свою партицию.
+    reload=True - уже загруженные партиции методов загружаются заново и заменяются атомарно.
+    Возвращает время загрузки методов
+    """
+    # инкрементальные режимы считаются от последней загрузки, для прошлых месяцев выгружается партиция целиком
+    os.environ['RUDATA_INCREMENTAL'] = '0'
+    os.environ['RUDATA_DELTA'] = '0'
+    if rps:
+        os.environ['RUDATA_RPS'] = str(rps)
+    from src.utils.run_context import RunContext
+    from src.sources.rudata.RuDataMethod import Account
+    from src.sources.rudata.RuDataScheduler import RuDataScheduler
+
+    scheduler = RuDataScheduler(methods, context=RunContext.for_month(month), read=False, reload=reload)
+    Account()
+    scheduler.run()
+    return scheduler.timings
+
+
+def backfill(
+        months: Sequence[str],
+        methods: Sequence[str],
+        workers: Optional[int] = None,
+        reload: bool = False,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Загрузка нескольких месяцев в параллельных процессах (по умолчанию - процесс на месяц, не больше числа CPU).
+    Общий лимит RUDATA_RPS делится между процессами, токен RuData берется из общего кэша на диске.
+    Упавшие месяцы перечисляются в исключении после завершения остальных
+    """
+    workers = min(workers or os.cpu_count() or 1, len(months))
+    rps: float = float(os.environ.get('RUDATA_RPS', 5)) / workers
+    timings: Dict[str, Dict[str, float]] = {}
+    errors: Dict[str, BaseException] = {}
+    start: float = time.monotonic()
+    # spawn: процессы не наследуют подключения и event loop родителя
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(load_month, month, list(methods), rps, reload): month for month in months}
+        for future in as_completed(futures):
+            month: str = futures[future]
+            try:
+                timings[month] = future.result()
+                logger.info(f"Backfill {month} finished in {max(timings[month].values(), default=0):.1f}s")
+            except BaseException as e:
+                logger.error(f"Backfill {month} failed: {type(e).__name__}: {e}")
+                errors[month] = e
+    logger.info(f"Backfill {len(timings)}/{len(months)} months in {time.monotonic() - start:.1f}s")
+    if errors:
+        raise RuntimeError(f"Backfill failed for months {sorted(errors)}") from next(iter(errors.values()))
+    return timings
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    python -m src.sources.rudata.RuDataBackfill 2024-01 2024-12 FintoolReferenceData EndOfDay --workers 4
+    """
+    parser = argparse.ArgumentParser(description='Загрузка методов RuData за несколько отчетных месяцев')
+    parser.add_argument('start', help='первый отчетный месяц, YYYY-MM')
+    parser.add_argument('end', help='последний отчетный месяц, YYYY-MM')
+    parser.add_argument('methods', nargs='+', help='методы RuData, зависимости добавляются автоматически')
+    parser.add_argument('--workers', type=int, default=None, help='количество процессов')
+    parser.add_argument('--reload', action='store_true', help='заменить уже загруженные месяцы')
+    args = parser.parse_args(argv)
+    from src.utils.run_context import RunContext
+
+    months: List[str] = [context.month for context in RunContext.months(args.start, args.end)]
+    backfill(months, args.methods, workers=args.workers, reload=args.reload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.utils.path import get_project_root
+
+
+def payload_key(payload) -> str:
+    """
+    Ключ payload для журнала: хэш канонического JSON, не зависит от порядка ключей
+    """
+    canonical: str = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class Checkpoint(ABC):
+    """
+    Журнал выполненных запросов одной загрузки (метод + report_yearmonth).
+    Для каждого payload хранится ответ, поэтому после падения уже полученные страницы
+    берутся из журнала, а запрашиваются только оставшиеся.
+    Журнал существует, пока загрузка не завершена: после успешной записи в ClickHouse вызывается clear().
+    Для запросов со списком id сохраняется и payload: размер списков подбирается заново при каждом запуске,
+    поэтому при продолжении ответы сопоставляются с id (payloads()), а не с ключом payload.
+    Методы блокирующие и потокобезопасные: RuDataDF вызывает их через asyncio.to_thread, чтобы запись
+    ответа на диск или в ClickHouse не останавливала остальные запросы event loop.
+    """
+
+    def __init__(self, endpoint: str, report_yearmonth: str):
+        self.endpoint = endpoint
+        self.report_yearmonth = report_yearmonth
+
+    @abstractmethod
+    def exists(self) -> bool:
+        pass
+
+    @abstractmethod
+    def keys(self) -> set:
+        pass
+
+    @abstractmethod
+    def body(self, key: str):
+        pass
+
+    @abstractmethod
+    def payloads(self) -> Dict[str, dict]:
+        """
+        {key: payload} записей, сохраненных с payload
+        """
+
+    @abstractmethod
+    def save(self, key: str, body, payload: Optional[dict] = None) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """
+        Освобождение ресурсов журнала в конце загрузки, записи журнала остаются
+        """
+
+
+class FileCheckpoint(Checkpoint):
+    """
+    Журнал в JSONL файле data/Checkpoints/<endpoint>_<report_yearmonth>.jsonl.
+    В памяти держатся только смещения строк, ответы читаются с диска по одному.
+    """
+
+    def __init__(self, endpoint: str, report_yearmonth: str, directory: Optional[Path] = None):
+        super().__init__(endpoint, report_yearmonth)
+        directory = Path(directory or os.environ.get(
+            'RUDATA_CHECKPOINT_DIR', Path.joinpath(get_project_root(), 'data/Checkpoints')
+        ))
+        self.path: Path = Path.joinpath(directory, f'{endpoint}_{report_yearmonth}.jsonl')
+        self._offsets: Optional[Dict[str, int]] = None
+        self._payloads: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def keys(self) -> set:
+        with self._lock:
+            return self._keys()
+
+    def payloads(self) -> Dict[str, dict]:
+        with self._lock:
+            self._keys()
+            return dict(self._payloads)
+
+    def _keys(self) -> set:
+        if self._offsets is None:
+            self._offsets = {}
+            self._payloads = {}
+            offset: int = 0
+            if self.path.exists():
+                with open(self.path, 'rb') as f:
+                    for line in iter(f.readline, b''):
+                        try:
+                            entry: dict = json.loads(line)
+                            key: str = entry['key']
+                        except (ValueError, KeyError):
+                            key = ''
+                        if not key or not line.endswith(b'\n'):
+                            # последняя строка могла не дописаться при падении - отрезаем ее
+                            break
+                        self._offsets[key] = offset
+                        if entry.get('payload') is not None:
+                            self._payloads[key] = entry['payload']
+                        offset = f.tell()
+                self._truncate(offset)
+        return set(self._offsets)
+
+    def _truncate(self, size: int) -> None:
+        if self.path.exists() and self.path.stat().st_size > size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(size)
+
+    def body(self, key: str):
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[key])
+            return json.loads(f.readline())['body']
+
+    def save(self, key: str, body, payload: Optional[dict] = None) -> None:
+        entry: dict = {'key': key, 'body': body}
+        if payload is not None:
+            entry['payload'] = payload
+        line: bytes = json.dumps(entry, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'ab') as f:
+                offset: int = f.tell()
+                f.write(line)
+            if self._offsets is not None:
+                self._offsets[key] = offset
+                if payload is not None:
+                    self._payloads[key] = json.loads(json.dumps(payload, default=str))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.path.unlink(missing_ok=True)
+            self._offsets = None
+
+
+class ClickHouseCheckpoint(Checkpoint):
+    """
+    Журнал в служебной таблице ClickHouse rudata_checkpoints, ключ (endpoint, report_yearmonth, key).
+    Использует отдельное подключение, чтобы не пересекаться с запросами основного client.
+    Запросы к подключению из разных потоков выполняются по одному.
+    Подключение, открытое журналом (client не передан), закрывает close()
+    """
+    table: str = 'rudata_checkpoints'
+
+    def __init__(self, endpoint: str, report_yearmonth: str, client=None):
+        super().__init__(endpoint, report_yearmonth)
+        self._owns_client: bool = client is None
+        if client is None:
+            from src.utils.clickhouse_client import connect
+            client = connect()
+        self.client = client
+        self.client.command(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table}
+            (
+                endpoint LowCardinality(String),
+                report_yearmonth String,
+                key String,
+                body String CODEC(ZSTD(3)),
+                payload String DEFAULT '' CODEC(ZSTD(3)),
+                created_at DateTime DEFAULT now()
+            )
+            ENGINE = ReplacingMergeTree(created_at)
+            ORDER BY (endpoint, report_yearmonth, key)
+            """
+        )
+        # таблица, созданная до появления payload
+        self.client.command(f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS payload String DEFAULT '' CODEC(ZSTD(3))")
+        self._parameters: dict = {'endpoint': endpoint, 'report_yearmonth': report_yearmonth}
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        with self._lock:
+            return bool(self.client.command(
+                f"""
+                SELECT count()
+                FROM {self.table}
+                WHERE endpoint = %(endpoint)s AND report_yearmonth = %(report_yearmonth)s
+                """,
+                parameters=self._parameters
+            ))
+
+    def keys(self) -> set:
+        with self._lock:
+            result = self.client.query(
+                f"""
+                SELECT DISTINCT key
+                FROM {self.table}
+                WHERE endpoint = %(endpoint)s AND report_yearmonth = %(report_yearmonth)s
+                """,
+                parameters=self._parameters
+            )
+        return {row[0] for row in result.result_rows}
+
+    def body(self, key: str):
+        with self._lock:
+            result = self.client.query(
+                f"""
+                SELECT body
+                FROM {self.table}
+                WHERE endpoint = %(endpoint)s AND report_yearmonth = %(report_yearmonth)s AND key = %(key)s
+                LIMIT 1
+                """,
+                parameters={**self._parameters, 'key': key}
+            )
+        return json.loads(result.first_row[0])
+
+    def payloads(self) -> Dict[str, dict]:
+        with self._lock:
+            result = self.client.query(
+                f"""
+                SELECT key, any(payload)
+                FROM {self.table}
+                WHERE endpoint = %(endpoint)s AND report_yearmonth = %(report_yearmonth)s AND payload != ''
+                GROUP BY key
+                """,
+                parameters=self._parameters
+            )
+        return {key: json.loads(payload) for key, payload in result.result_rows}
+
+    def save(self, key: str, body, payload: Optional[dict] = None) -> None:
+        row: list = [
+            self.endpoint,
+            self.report_yearmonth,
+            key,
+            json.dumps(body, ensure_ascii=False),
+            json.dumps(payload, ensure_ascii=False, default=str) if payload is not None else '',
+        ]
+        with self._lock:
+            self.client.insert(
+                self.table,
+                [row],
+                column_names=['endpoint', 'report_yearmonth', 'key', 'body', 'payload'],
+                settings={'async_insert': 1, 'wait_for_async_insert': 1},
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self.client.command(
+                f"""
+                DELETE FROM {self.table}
+                WHERE endpoint = %(endpoint)s AND report_yearmonth = %(report_yearmonth)s
+                """,
+                parameters=self._parameters
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._owns_client:
+                self.client.close()
+                self._owns_client = False
+
+    def __del__(self):
+        if getattr(self, '_owns_client', False):
+            self.client.close()
+
+
+def get_checkpoint(kind: Optional[str], endpoint: str, report_yearmonth: str) -> Optional[Checkpoint]:
+    """
+    kind: 'file', 'clickhouse' или пусто (журнал выключен). По умолчанию RUDATA_CHECKPOINT
+    """
+    kind = os.environ.get('RUDATA_CHECKPOINT', 'file') if kind is None else kind
+    if kind == 'file':
+        return FileCheckpoint(endpoint, report_yearmonth)
+    if kind == 'clickhouse':
+        return ClickHouseCheckpoint(endpoint, report_yearmonth)
+    if not kind:
+        return None
+    raise ValueError(f"Unknown checkpoint kind {kind}. Use 'file', 'clickhouse' or ''")
@@ -1,69 +1,345 @@
 from __future__ import annotations
 import asyncio
-from time import sleep
+import json
+import os
+import time
+from math import ceil
 import aiohttp
-import socket
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
-from src.utils.get_date import last_day_month
-from src.utils.clickhouse_client import client as clickhouse_client, prepare_for_clickhouse
-from src.utils.retries import retry
+from src.utils.divide_chunks import divide_chunks
+from src.utils.run_context import RunContext
+from src.utils.clickhouse_client import LazyClient, insert_df, arrow_query_df, table_types, TableSchema
+from src.utils.clickhouse_sink import ClickHouseSink
+from src.utils.adaptive_batch import AdaptiveBatcher, BatchTooLargeError, get_batcher
+from src.utils.http_session import http_pool, run
+from src.utils.metrics import metrics
+from src.utils.profiling import profiled
+from src.utils.rate_limiter import RateLimiter, get_rate_limiter
+from src.utils.response_cache import ResponseCache, cache_ttl, get_response_cache
+from src.utils.retries import retry, retry_after_seconds, RetryableError
 from src.logger.Logger import Logger
 from src.sources.rudata.RuData import RuDataStrategy
+from src.sources.rudata.RuDataCheckpoint import Checkpoint, get_checkpoint, payload_key
+from src.sources.rudata.RuDataManifest import LoadManifest, COMPLETE, LOADING
+from src.sources.rudata.RuDataSchema import get_schema
+from src.sources.rudata.RuDataToken import token_manager
 
 
 LIMIT = 5
 logger = Logger()
 
+
+class UnexpectedStatusError(Exception):
+    """
+    Ответ RuData с ошибкой, после которой запрос не повторяется (4xx, кроме 401, 413 и 429).
+    Загрузка метода прерывается, а не продолжается с пустым ответом
+    """
+
+
 class RuDataDF(RuDataStrategy):
 
-    client = clickhouse_client
-    report_date = pd.to_datetime(last_day_month)
-    report_yearmonth: str = last_day_month.strftime("%Y%m")
+    client = LazyClient()
     headers: Dict[str, str] = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) '
                       'Chrome/39.0.2171.95 Safari/537.36',
         'content-type': 'application/json',
         'Accept': 'application/json',
     }
-    semaphore: asyncio.Semaphore = asyncio.Semaphore(LIMIT)
+    # методы, из таблиц которых берутся payloads (см. RuDataScheduler)
+    depends_on: Tuple[str, ...] = ()
+    # собственное ограничение запросов в секунду для метода, поверх общего лимитера процесса
+    rate_limit: Optional[float] = None
+    # stream=True - каждая готовая пачка строк конвертируется и пишется в ClickHouse, пока идут следующие запросы
+    stream: bool = False
+    batch_rows: int = 50_000
+    # журнал выполненных запросов для продолжения упавшей загрузки: 'file', 'clickhouse', '' - выключен,
+    # None - берется из RUDATA_CHECKPOINT
+    checkpoint: Optional[str] = None
+    # arrow=True - чтение из ClickHouse через Arrow в компактные типы (см. arrow_query_df),
+    # None - берется из RUDATA_ARROW
+    arrow: Optional[bool] = None
+    categories: Tuple[str, ...] = ('fintooltype', 'faceftname', 'agency', 'currency')
+    # поле payload со списком id: количество id в запросе подбирается по времени и размеру ответов
+    # и ошибкам сервера (см. AdaptiveBatcher), batch_size - начальное значение
+    batch_key: Optional[str] = None
+    batch_size: int = 100
+    max_batch: int = 1000
+    # время жизни ответов в кэше на диске в секундах для редко меняющихся справочников, None - не кэшировать.
+    # Кэш включается RUDATA_HTTP_CACHE (см. get_response_cache), RUDATA_CACHE_TTL_<МЕТОД> заменяет значение
+    cache_ttl: Optional[float] = None
 
-    def __init__(self):
+    def __init__(self, stream: Optional[bool] = None, context: Optional[RunContext] = None):
         self.name = self.__class__.__name__
+        # отчетный месяц: report_date, report_yearmonth и даты в payloads
+        self.context: RunContext = context or RunContext()
+        if stream is not None:
+            self.stream = stream
+        if self.arrow is None:
+            self.arrow = os.environ.get('RUDATA_ARROW', '0') == '1'
         self._list_json: List[dict] = []
         self._df: pd.DataFrame = pd.DataFrame()
+        self._sink: Optional[ClickHouseSink] = None
+        self._journal: Optional[Checkpoint] = None
+        self._journal_keys: set = set()
+        # продолжение запросов со списком id: записи журнала по payload без batch_key и уже полученные id
+        self._journal_batches: Dict[str, List[Tuple[str, dict]]] = {}
+        self._journal_ids: Dict[str, set] = {}
 
     @classmethod
     def set_headers(cls, headers: dict):
         cls.headers.update(headers)
 
-    def _select_df(self) -> pd.DataFrame:
-        try:
-            df: pd.DataFrame = self.client.query_df(
-                f"""
-                SELECT *
-                FROM "{self.name}"
-                WHERE _partition_id = '{self.report_yearmonth}'
-                """
-            )
-        except Exception:
-            df: pd.DataFrame = pd.DataFrame()
-        return df
+    def check_authorization(self) -> None:
+        if 'Authorization' not in self.headers or self.headers['Authorization'] is None or self.headers['Authorization'] == 'Bearer ':
+            raise ValueError("Authorization header is not set. Run Account()")
+
+    @property
+    def report_date(self) -> pd.Timestamp:
+        return self.context.report_date
+
+    @property
+    def report_yearmonth(self) -> str:
+        return self.context.report_yearmonth
+
+    @property
+    def limiter(self) -> RateLimiter:
+        return get_rate_limiter(self.name, self.rate_limit)
+
+    @property
+    def batcher(self) -> AdaptiveBatcher:
+        return get_batcher(self.name, self.batch_size, self.max_batch)
+
+    @property
+    def response_cache(self) -> Optional[ResponseCache]:
+        return get_response_cache() if cache_ttl(self.name, self.cache_ttl) else None
 
     @property
+    def schema(self) -> TableSchema:
+        return get_schema(self.name)
+
+    @property
+    def journal(self) -> Optional[Checkpoint]:
+        if self._journal is None:
+            self._journal = get_checkpoint(self.checkpoint, self.name, self.report_yearmonth)
+        return self._journal
+
+    def _select_df(
+            self,
+            columns: Optional[List[str]] = None,
+            filters: Optional[Dict[str, object]] = None,
+            where: Optional[str] = None,
+            parameters: Optional[dict] = None,
+    ) -> pd.DataFrame:
+        """
+        Партиция report_yearmonth из ClickHouse. Отбор колонок и строк выполняется в ClickHouse:
+        columns - список колонок (по умолчанию все),
+        filters - {колонка: значение} или {колонка: [значения]} для IN, значения передаются параметрами запроса,
+        where - произвольное условие ClickHouse, параметры в нем - %(name)s из parameters (символ % - %%)
+        """
+        return self._query_df(
+            f'"{self.name}"',
+            [f"_partition_id = '{self.report_yearmonth}'"],
+            columns=columns,
+            filters=filters,
+            where=where,
+            parameters=parameters,
+        )
+
+    def _query_df(
+            self,
+            source: str,
+            conditions: List[str],
+            columns: Optional[List[str]] = None,
+            filters: Optional[Dict[str, object]] = None,
+            where: Optional[str] = None,
+            parameters: Optional[dict] = None,
+            tail: str = '',
+    ) -> pd.DataFrame:
+        select: str = ', '.join(f'"{column}"' for column in columns) if columns else '*'
+        conditions = list(conditions)
+        parameters = dict(parameters or {})
+        for i, (column, value) in enumerate((filters or {}).items()):
+            key: str = f'_filter_{i}'
+            if value is None:
+                conditions.append(f'"{column}" IS NULL')
+            elif isinstance(value, (list, tuple, set)):
+                conditions.append(f'"{column}" IN %({key})s')
+                parameters[key] = tuple(value)
+            else:
+                conditions.append(f'"{column}" = %({key})s')
+                parameters[key] = value
+        if where:
+            conditions.append(f'({where})')
+        query: str = f"""
+            SELECT {select}
+            FROM {source}
+            WHERE {' AND '.join(conditions)}
+            {tail}
+            """
+        if self.arrow:
+            return arrow_query_df(self.client, query, parameters=parameters or None, categories=self.categories)
+        return self.client.query_df(query, parameters=parameters or None)
+
+    @property
+    @profiled()
     def df(self) -> pd.DataFrame:
-        if 'Authorization' not in self.headers or self.headers['Authorization'] is None or self.headers['Authorization'] == 'Bearer ':
-            raise ValueError("Authorization header is not set. Run Account()")
-        df = self._select_df()
-        if df.empty:
-            df: pd.DataFrame = asyncio.run(self.send_requests())
-            df = prepare_for_clickhouse(df.copy())
-            df['report_date'] = RuDataDF.report_date
-            self.client.insert_df(self.name, df)
+        return run(self.load())
+
+    def read(
+            self,
+            columns: Optional[List[str]] = None,
+            where: Optional[str] = None,
+            parameters: Optional[dict] = None,
+            **filters,
+    ) -> pd.DataFrame:
+        """
+        Как df, но в pandas попадают только нужные колонки и строки (см. _select_df)
+
+        FintoolReferenceData().read(['isincode', 'fintoolid'], fintooltype=['Акция', 'Выпуск акции'])
+        """
+        return run(self.load(columns=columns, filters=filters, where=where, parameters=parameters))
+
+    def is_loaded(self) -> bool:
+        """
+        Загружен ли report_yearmonth полностью - по rudata_load_manifest, без чтения данных
+        """
+        return LoadManifest(self.client).status(self.name, self.report_yearmonth) == COMPLETE
+
+    def _prepare_partition(self) -> bool:
+        """
+        True, если партиция report_yearmonth уже загружена. Иначе удаляет недописанные данные
+        прошлой загрузки, отмечает в manifest начало новой и возвращает False
+        """
+        manifest: LoadManifest = LoadManifest(self.client)
+        status: Optional[str] = manifest.status(self.name, self.report_yearmonth)
+        interrupted: bool = self.journal is not None and self.journal.exists()
+        if status == COMPLETE:
+            if interrupted:
+                # упали между записью в manifest и очисткой журнала
+                self.journal.clear()
+            return True
+        rows: int = manifest.partition_rows(self.name, self.report_yearmonth)
+        if rows and status is None and not interrupted:
+            # партиция загружена до появления manifest
+            manifest.record(self.name, self.report_yearmonth, COMPLETE, rows)
+            return True
+        if interrupted:
+            # полученные ответы берутся из журнала, запрашивается только остальное
+            logger.info(f"{self.name} resuming from checkpoint")
+        # данные пишутся в staging таблицу, в таблице метода до публикации остается прошлая полная партиция
+        manifest.record(self.name, self.report_yearmonth, LOADING)
+        return False
+
+    @property
+    def staging_table(self) -> str:
+        return f'{self.name}Staging'
+
+    def _begin_staging(self) -> None:
+        """
+        Пустая партиция report_yearmonth в staging таблице. Если таблица метода уже есть,
+        staging создается по ее структуре (нужно для REPLACE PARTITION), иначе - первой записью по schema
+        """
+        if table_types(self.client, self.name):
+            self.client.command(f'CREATE TABLE IF NOT EXISTS "{self.staging_table}" AS "{self.name}"')
+        self._discard_staging()
+
+    def _discard_staging(self) -> None:
+        """
+        Удаление партиции report_yearmonth из staging таблицы без публикации
+        """
+        if table_types(self.client, self.staging_table):
+            self.client.command(
+                f'ALTER TABLE "{self.staging_table}" DROP PARTITION ID \'{self.report_yearmonth}\''
+            )
+
+    def _publish_partition(self) -> None:
+        """
+        Атомарная замена партиции report_yearmonth таблицы метода данными из staging.
+        Читатели видят либо прошлую партицию, либо новую целиком
+        """
+        if not table_types(self.client, self.staging_table):
+            return
+        self.client.command(f'CREATE TABLE IF NOT EXISTS "{self.name}" AS "{self.staging_table}"')
+        self.client.command(
+            f'ALTER TABLE "{self.name}" REPLACE PARTITION ID \'{self.report_yearmonth}\' FROM "{self.staging_table}"'
+        )
+        self.client.command(f'ALTER TABLE "{self.staging_table}" DROP PARTITION ID \'{self.report_yearmonth}\'')
+
+    async def load(
+            self,
+            session: Optional[aiohttp.ClientSession] = None,
+            read: bool = True,
+            reload: bool = False,
+            **select,
+    ) -> pd.DataFrame:
+        """
+        Данные метода за report_yearmonth: из ClickHouse, а если их нет - запросами к RuData с записью в ClickHouse.
+        read=False - только загрузить в ClickHouse, уже загруженная партиция не читается.
+        reload=True - загрузить заново и заменить уже загруженную партицию, читатели до замены видят прежние данные.
+        select - отбор колонок и строк для чтения (аргументы _select_df).
+        Запросы к ClickHouse выполняются в отдельном потоке, чтобы не останавливать загрузку других методов
+        в том же event loop (см. RuDataScheduler)
+        """
+        self.check_authorization()
+        select = {key: value for key, value in select.items() if value}
+        try:
+            if not reload and await asyncio.to_thread(self._prepare_partition):
+                df: pd.DataFrame = await asyncio.to_thread(self._select_df, **select) if read else pd.DataFrame()
+            else:
+                df, rows = await self.fetch_partition(session=session, read=read, **select)
+                if rows:
+                    await asyncio.to_thread(
+                        LoadManifest(self.client).record, self.name, self.report_yearmonth, COMPLETE, rows
+                    )
+                if self.journal is not None:
+                    await asyncio.to_thread(self.journal.clear)
+        finally:
+            # журнал ClickHouse держит свое подключение
+            if self._journal is not None:
+                await asyncio.to_thread(self._journal.close)
+                self._journal = None
         self._df = df.loc[:, df.columns != 'report_date']
         return self._df
 
+    async def fetch_partition(
+            self,
+            session: Optional[aiohttp.ClientSession] = None,
+            read: bool = True,
+            **select,
+    ) -> Tuple[pd.DataFrame, int]:
+        """
+        Запросы к RuData, запись в staging таблицу и публикация партиции report_yearmonth
+        в таблицу метода. Возвращает данные (если read) и количество записанных строк.
+        Пустой ответ не публикуется: остается прежняя партиция (если она есть)
+        """
+        await asyncio.to_thread(self._begin_staging)
+        if self.stream:
+            rows: int = await self.stream_requests(session=session, table=self.staging_table)
+            df: pd.DataFrame = pd.DataFrame()
+        else:
+            df = await self.send_requests(session=session)
+            df = await asyncio.to_thread(self._insert_df, df, self.staging_table)
+            rows = len(df)
+        if not rows:
+            # пустой ответ не заменяет опубликованную партицию, manifest не меняется
+            logger.warning(f"{self.name} returned no rows for {self.report_yearmonth}, partition is not replaced")
+            await asyncio.to_thread(self._discard_staging)
+            if read and await asyncio.to_thread(table_types, self.client, self.name):
+                df = await asyncio.to_thread(self._select_df, **select)
+            return df, rows
+        await asyncio.to_thread(self._publish_partition)
+        if read and (self.stream or select or self.arrow):
+            df = await asyncio.to_thread(self._select_df, **select)
+        return df, rows
+
+    @profiled()
+    def _insert_df(self, df: pd.DataFrame, table: Optional[str] = None) -> pd.DataFrame:
+        df = df.copy()
+        df['report_date'] = self.report_date
+        return insert_df(self.client, table or self.name, df, schema=self.schema, endpoint=self.name)
+
     @df.setter
     def df(self, value) -> None:
         self._df = value
@@ -73,79 +349,280 @@ class RuDataDF(RuDataStrategy):
 
     def create_tasks(self, chunk_payloads: List[dict], session: aiohttp.ClientSession) -> List[asyncio.Task]:
         return [asyncio.create_task(
-            self.post(session=session, payload=payload)
+            self.fetch_rows(session=session, payload=payload)
             ) for payload in chunk_payloads]
 
-    @staticmethod
-    async def safe_task(task, timeout=120):
-        try:
-            return await asyncio.wait_for(task, timeout=timeout)
-        except asyncio.TimeoutError:
-            return "Timed out"
+    async def fetch_rows(self, session: aiohttp.ClientSession, payload: dict) -> List[dict]:
+        return self.response_rows(payload, await self.fetch_payload(session=session, payload=payload))
 
-    @retry(
-        exceptions=(TimeoutError, ConnectionError, Exception),
-        tries=5,
-        delay=100,
-        logger=logger
-    )
+    def response_rows(self, payload: dict, body) -> List[dict]:
+        """
+        Строки ответа на payload: список как есть, объект - одна строка
+        """
+        if isinstance(body, dict):
+            return [body]
+        return body if isinstance(body, list) else []
 
     async def execute_tasks(self, tasks: List[asyncio.Task]) -> bool:
-        resAll: List[List[dict]] = await asyncio.gather(*(self.safe_task(t, 60) for t in tasks))
+        # повторы выполняются внутри post для каждого payload, поэтому каждая страница попадает в результат один раз
+        try:
+            resAll: List[List[dict]] = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
         result: List[dict] = [row for task_res in resAll for row in task_res]
-        self._list_json.extend(result)
+        await self.collect(result)
         logger.info(f"Chunk done {len(result)}" )
         return bool(result)
 
+    @profiled()
+    async def send_requests(self, session: Optional[aiohttp.ClientSession] = None) -> pd.DataFrame:
+        session = session or http_pool.session()
+        self._journal_keys = await asyncio.to_thread(self.journal.keys) if self.journal is not None else set()
+        self._journal_batches, self._journal_ids = {}, {}
+        if self._journal_keys:
+            logger.info(f"{self.name} {len(self._journal_keys)} payloads restored from checkpoint")
+            if self.batch_key is not None:
+                for key, payload in (await asyncio.to_thread(self.journal.payloads)).items():
+                    self._journal_batches.setdefault(self.batch_template(payload), []).append((key, payload))
+        await self.fetch(session)
+        logger.info(f"{self.name} rate limits {self.limiter.rates()}, http {http_pool.stats()}")
+        if self.batch_key is not None:
+            self.batcher.save()
+            logger.info(f"{self.name} {self.batcher}")
+        with metrics.timer(self.name, 'conversion_seconds'):
+            return pd.DataFrame(self._list_json)
+
+    async def stream_requests(
+            self,
+            session: Optional[aiohttp.ClientSession] = None,
+            table: Optional[str] = None,
+    ) -> int:
+        async with ClickHouseSink(
+                self.client,
+                table or self.name,
+                report_date=self.report_date,
+                batch_rows=self.batch_rows,
+                schema=self.schema,
+                endpoint=self.name,
+        ) as self._sink:
+            await self.send_requests(session=session)
+        logger.info(f"{self.name} streamed {self._sink.rows} rows")
+        return self._sink.rows
+
+    async def collect(self, rows: List[dict]) -> None:
+        metrics.add(self.name, 'rows', len(rows))
+        if self._sink is not None:
+            await self._sink.put(rows)
+        else:
+            self._list_json.extend(rows)
+
+    async def fetch(self, session: aiohttp.ClientSession) -> None:
+        # payloads() читает списки id из ClickHouse, поэтому генератор продвигается в отдельном потоке,
+        # а event loop в это время выполняет запросы других методов
+        chunks = iter(self.payloads())
+        while (chunk_payloads := await asyncio.to_thread(next, chunks, None)) is not None:
+            if self._journal_batches or self._journal_ids:
+                chunk_payloads = await self.resume_batches(chunk_payloads)
+            tasks: List[asyncio.Task] = self.create_tasks(chunk_payloads, session)
+            if tasks:
+                await self.execute_tasks(tasks)
+
+    def batch_template(self, payload: dict) -> str:
+        """
+        Ключ payload без списка id: запросы одной загрузки, которые отличаются только id
+        """
+        return payload_key({key: value for key, value in payload.items() if key != self.batch_key})
+
+    async def resume_batches(self, chunk_payloads: List[dict]) -> List[dict]:
+        """
+        Продолжение по журналу запросов со списком id. Пачки прошлого запуска могли быть другого размера,
+        поэтому их ответы добавляются целиком при первом payload с тем же шаблоном, а из payloads
+        убираются уже полученные id
+        """
+        remaining: List[dict] = []
+        for payload in chunk_payloads:
+            if not isinstance(payload.get(self.batch_key), list):
+                remaining.append(payload)
+                continue
+            template: str = self.batch_template(payload)
+            for key, journaled in self._journal_batches.pop(template, []):
+                body = await asyncio.to_thread(self.journal.body, key)
+                await self.collect(self.response_rows(journaled, body))
+                self._journal_ids.setdefault(template, set()).update(
+                    payload_key(value) for value in journaled[self.batch_key]
+                )
+            done: set = self._journal_ids.get(template, set())
+            ids: list = [value for value in payload[self.batch_key] if payload_key(value) not in done]
+            if ids:
+                remaining.append({**payload, self.batch_key: ids})
+        return remaining
+
+    async def fetch_payload(self, session: aiohttp.ClientSession, payload: dict):
+        """
+        post через журнал: ответ, сохраненный при прошлом запуске, повторно не запрашивается.
+        Чтение и запись журнала выполняются в отдельном потоке
+        """
+        if self.journal is None:
+            return await self.post_batch(session=session, payload=payload)
+        key: str = payload_key(payload)
+        if key in self._journal_keys:
+            return await asyncio.to_thread(self.journal.body, key)
+        body = await self.post_batch(session=session, payload=payload)
+        batched: bool = self.batch_key is not None and isinstance(payload.get(self.batch_key), list)
+        await asyncio.to_thread(self.journal.save, key, body, payload if batched else None)
+        return body
+
     @retry(
-        exceptions=(TimeoutError, ConnectionError, Exception),
-        tries=3,
-        delay=600,
+        exceptions=(aiohttp.ClientError, asyncio.TimeoutError, RetryableError),
+        tries=6,
+        delay=1,
+        backoff=2,
+        max_delay=60,
+        jitter=True,
         logger=logger
     )
-    async def send_requests(self) -> pd.DataFrame:
-        async with aiohttp.ClientSession(
-                connector=aiohttp.TCPConnector(limit=LIMIT,
-                                               family=socket.AF_INET),
-                trust_env=True,
-                timeout=aiohttp.ClientTimeout(7200)
-        ) as session:
-
-            for chunk_payloads in self.payloads():
-                tasks: List[asyncio.Task] = self.create_tasks(chunk_payloads, session)
-                if tasks:
-                    code: bool = await self.execute_tasks(tasks)
-                    if not code and isinstance(self, RuDataPagesDF):
-                        return pd.DataFrame(self._list_json)
-            return pd.DataFrame(self._list_json)
-
     async def post(self, session, payload):
-        async with self.semaphore, session.post(
-                self.url,
-                json=payload,
-                headers=self.headers,
-                timeout=60
-        ) as response:
-            if response.ok:
-                try:
-                    response_body = await response.json()
-                    await asyncio.sleep(1.1)
-                except aiohttp.client_exceptions.ClientConnectorError as e:
-                    logger.exception(str(e))
-                    sleep(10)
-                    raise ConnectionError("Restart")
-                except asyncio.exceptions.TimeoutError as e:
-                    logger.exception(str(e))
-                    sleep(10)
-                    await self.post(session, payload)
-                except Exception as e:
-                    logger.exception(str(e))
-                    sleep(60)
-                    raise Exception("Restart")
-                finally:
-                    return response_body
-            else:
-                return []
+        cache: Optional[ResponseCache] = self.response_cache
+        if cache is not None:
+            cached: Optional[bytes] = await asyncio.to_thread(
+                cache.get, self.url, payload, cache_ttl(self.name, self.cache_ttl)
+            )
+            if cached is not None:
+                metrics.add(self.name, 'cache_hits')
+                return json.loads(cached)
+        queued: float = time.perf_counter()
+        async with self.limiter:
+            start: float = time.perf_counter()
+            metrics.throttled(self.name, start - queued)
+            headers: Dict[str, str] = dict(self.headers)
+            try:
+                async with session.post(
+                        self.url,
+                        json=payload,
+                        headers=headers,
+                        timeout=60
+                ) as response:
+                    body: bytes = await response.read()
+                    metrics.request(self.name, response.status, time.perf_counter() - start, len(body))
+                    retry_after: Optional[float] = retry_after_seconds(response.headers.get('Retry-After'))
+                    throttled: bool = self.limiter.feedback(response.status, retry_after)
+                    metrics.rate_limit(self.name, self.limiter.effective_rate, throttled)
+                    if response.status == 401:
+                        await self.reauthorize(headers.get('Authorization'))
+                        # новый токен действует сразу: пауза перед повтором только дала бы ему истечь
+                        raise RetryableError(f"{self.name} HTTP 401, token refreshed", backoff=False)
+                    if response.status == 413 or response.status >= 500:
+                        self.observe_batch(payload, start, failed=True)
+                        if self.oversized(payload):
+                            raise BatchTooLargeError(f"{self.name} HTTP {response.status}")
+                    if response.status == 429 or response.status >= 500:
+                        raise RetryableError(f"{self.name} HTTP {response.status}", retry_after)
+                    if not response.ok:
+                        raise UnexpectedStatusError(
+                            f"{self.name} HTTP {response.status} payload {payload}: {body[:500].decode(errors='replace')}"
+                        )
+                    self.observe_batch(payload, start, response_bytes=len(body))
+                    result = await response.json()
+                    if cache is not None:
+                        await asyncio.to_thread(cache.put, self.url, payload, body)
+                    return result
+            except RetryableError:
+                metrics.add(self.name, 'retries')
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                timeout: bool = isinstance(e, asyncio.TimeoutError)
+                metrics.request(self.name, 'timeout' if timeout else 'error', time.perf_counter() - start)
+                metrics.add(self.name, 'retries')
+                self.observe_batch(payload, start, failed=True)
+                if self.oversized(payload):
+                    raise BatchTooLargeError(f"{self.name} {e!r}") from e
+                raise
+
+    async def reauthorize(self, authorization: Optional[str]) -> None:
+        """
+        Новый токен вместо отклоненного (401), запрос повторяется декоратором retry
+        """
+        stale: Optional[str] = authorization.removeprefix('Bearer ') if authorization else None
+        token: str = await asyncio.to_thread(token_manager.refresh, stale)
+        self.set_headers({'Authorization': 'Bearer ' + token})
+
+    async def post_batch(self, session, payload):
+        """
+        post, который делит не выполненный список id (BatchTooLargeError) на пачки текущего размера
+        и объединяет ответы частей
+        """
+        try:
+            return await self.post(session=session, payload=payload)
+        except BatchTooLargeError as e:
+            ids: list = payload[self.batch_key]
+            size: int = min(self.batcher.size, ceil(len(ids) / 2))
+            logger.warning(f"{e}, {len(ids)} ids split by {size}")
+            bodies = await asyncio.gather(*(
+                self.post_batch(session=session, payload={**payload, self.batch_key: part})
+                for part in divide_chunks(ids, size)
+            ))
+            return [row for body in bodies for row in body]
+
+    def oversized(self, payload: dict) -> bool:
+        return (
+            self.batch_key is not None
+            and isinstance(payload.get(self.batch_key), list)
+            and len(payload[self.batch_key]) > max(self.batcher.size, 1)
+        )
+
+    def observe_batch(self, payload: dict, start: float, failed: bool = False, response_bytes: int = 0) -> None:
+        """
+        Время, размер ответа или ошибка запроса со списком id (batch_key) для подбора batch_size
+        """
+        if self.batch_key is None or not isinstance(payload.get(self.batch_key), list):
+            return
+        self.batcher.observe(
+            len(payload[self.batch_key]),
+            time.perf_counter() - start,
+            failed=failed,
+            response_bytes=response_bytes,
+        )
 
 class RuDataPagesDF(RuDataDF):
-    pass
+    """
+    Постраничные методы. Наследник задает page_size и payload(page_num) для одной страницы.
+    Страницы запрашиваются скользящим окном (max_in_flight лимитера), загрузка останавливается
+    на первой неполной (или пустой) странице. Ответ с ошибкой не считается пустой страницей:
+    post поднимает исключение, поэтому данные не обрезаются молча.
+    """
+    page_size: int = 300
+    max_pages: int = 10_000
+
+    def payload(self, page_num: int) -> dict:
+        raise NotImplemented
+
+    def payloads(self):
+        for page_num in range(1, self.max_pages, LIMIT):
+            yield [self.payload(page_num + i) for i in range(LIMIT)]
+
+    async def fetch(self, session: aiohttp.ClientSession) -> None:
+        pending: Dict[int, Tuple[dict, asyncio.Task]] = {}
+        window: int = self.limiter.max_in_flight
+        next_page: int = 1
+        page: int = 1
+        try:
+            while page < self.max_pages:
+                while len(pending) < window and next_page < self.max_pages:
+                    payload: dict = self.payload(next_page)
+                    pending[next_page] = payload, asyncio.create_task(
+                        self.fetch_payload(session=session, payload=payload)
+                    )
+                    next_page += 1
+                payload, task = pending.pop(page)
+                rows: List[dict] = self.response_rows(payload, await task)
+                await self.collect(rows)
+                if len(rows) < self.page_size:
+                    break
+                page += 1
+        finally:
+            for _, task in pending.values():
+                task.cancel()
+            await asyncio.gather(*(task for _, task in pending.values()), return_exceptions=True)
+        logger.info(f"{self.name} done {page} pages")
@@ -0,0 +1,179 @@
+from __future__ import annotations
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+import pandas as pd
+
+from src.utils.clickhouse_client import TableSchema, table_types
+from src.utils.clickhouse_sink import ClickHouseSink
+from src.sources.rudata.RuDataDF import logger
+from src.sources.rudata.RuDataManifest import LoadManifest, COMPLETE
+
+
+class RuDataDelta:
+    """
+    Справочники, которые выгружаются целиком. Подмешивается перед RuDataDF/RuDataPagesDF:
+
+    class Emitents(RuDataDelta, RuDataPagesDF)
+
+    delta=True (или RUDATA_DELTA=1): запрашиваются только записи, у которых delta_column не раньше
+    последней уже загруженной (фильтр delta_filter() в payload). Они пишутся в таблицу версий <метод>Versions
+    (ReplacingMergeTree по delta_key и report_date), а срез на конец месяца - последняя версия каждой записи,
+    параметризованное представление <метод>Snapshot(report_date=...) - копируется в партицию report_yearmonth
+    таблицы метода на стороне ClickHouse. Методы, которые строят payloads из этой таблицы, работают как раньше.
+    Удаленные в RuData записи в срезе остаются.
+    Граница since - watermark таблицы версий в rudata_load_manifest. Он сдвигается только после того,
+    как выгрузка получена целиком, поэтому повтор упавшей загрузки запрашивает те же payloads
+    (и продолжается по журналу), а не пропускает недополученные изменения.
+    """
+    delta_key: Tuple[str, ...] = ('fintoolid',)
+    delta_column: str = 'update_date'
+    delta: Optional[bool] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.delta is None:
+            self.delta = os.environ.get('RUDATA_DELTA', '0') == '1'
+        self.since: Optional[pd.Timestamp] = None
+        self._full: bool = False
+
+    @property
+    def versions_table(self) -> str:
+        return f'{self.name}Versions'
+
+    @property
+    def snapshot_view(self) -> str:
+        return f'{self.name}Snapshot'
+
+    @property
+    def versions_schema(self) -> TableSchema:
+        return TableSchema(
+            order_by=(*self.delta_key, 'report_date'),
+            types={**self.schema.types, self.delta_column: 'Nullable(DateTime64(3))'},
+            engine='ReplacingMergeTree',
+        )
+
+    def delta_filter(self) -> str:
+        """
+        Значение filter в payload: пусто при полной выгрузке
+        """
+        if not self.delta or self.since is None:
+            return ''
+        return f"{self.delta_column} >= '{self.since:%Y-%m-%d}'"
+
+    def last_update(self) -> Optional[pd.Timestamp]:
+        """
+        delta_column, по которую таблица версий загружена полностью (watermark в rudata_load_manifest),
+        None - загрузка целиком: полной выгрузки еще не было или report_yearmonth раньше месяца watermark
+        (изменения после watermark не покрывают более ранний месяц)
+        """
+        watermark: Optional[str] = LoadManifest(self.client).watermark(self.versions_table)
+        if not watermark:
+            return None
+        since: pd.Timestamp = pd.Timestamp(watermark)
+        if self.report_yearmonth < f'{since:%Y%m}':
+            logger.info(f"{self.name} {self.report_yearmonth} is older than watermark {watermark}")
+            return None
+        return since
+
+    def _record_update(self, rows: int) -> None:
+        """
+        После полученной целиком выгрузки - последняя delta_column таблицы версий как since следующей загрузки
+        """
+        types: Dict[str, str] = table_types(self.client, self.versions_table)
+        if not types:
+            return
+        if self.delta_column not in types:
+            raise ValueError(f"{self.versions_table} has no {self.delta_column} column. Check {self.name}.delta_column")
+        last = pd.to_datetime(
+            self.client.command(f'SELECT max(`{self.delta_column}`) FROM "{self.versions_table}"'),
+            errors='coerce'
+        )
+        if pd.isna(last) or last.year < 1971:
+            return
+        LoadManifest(self.client).record(self.versions_table, '', COMPLETE, rows, last.isoformat())
+
+    async def load(
+            self,
+            session: Optional[aiohttp.ClientSession] = None,
+            read: bool = True,
+            reload: bool = False,
+            **select,
+    ) -> pd.DataFrame:
+        """
+        reload=True - полная выгрузка без since, как при первой загрузке, и замена партиции среза
+        """
+        self._full = reload
+        return await super().load(session=session, read=read, reload=reload, **select)
+
+    async def fetch_partition(
+            self,
+            session: Optional[aiohttp.ClientSession] = None,
+            read: bool = True,
+            **select,
+    ) -> Tuple[pd.DataFrame, int]:
+        if not self.delta:
+            return await super().fetch_partition(session=session, read=read, **select)
+        self.since = None if self._full else await asyncio.to_thread(self.last_update)
+        logger.info(f"{self.name} delta since {self.since}" if self.since is not None else f"{self.name} full load")
+        async with ClickHouseSink(
+                self.client,
+                self.versions_table,
+                report_date=self.report_date,
+                batch_rows=self.batch_rows,
+                schema=self.versions_schema,
+                endpoint=self.name,
+        ) as self._sink:
+            await self.send_requests(session=session)
+        logger.info(f"{self.name} {self._sink.rows} changed rows written to {self.versions_table}")
+        await asyncio.to_thread(self._record_update, self._sink.rows)
+        rows: int = await asyncio.to_thread(self._publish_snapshot)
+        df: pd.DataFrame = await asyncio.to_thread(self._select_df, **select) if read else pd.DataFrame()
+        return df, rows
+
+    async def collect(self, rows: List[dict]) -> None:
+        if self.delta and rows:
+            missing: List[str] = [column for column in self.delta_key if column not in rows[0]]
+            if missing:
+                raise ValueError(f"{self.name} rows have no key columns {missing}. Check {self.name}.delta_key")
+        await super().collect(rows)
+
+    def _publish_snapshot(self) -> int:
+        """
+        Срез таблицы версий на report_date через staging в партицию report_yearmonth таблицы метода
+        """
+        key: str = ', '.join(f'`{column}`' for column in self.delta_key)
+        self.client.command(
+            f"""
+            CREATE VIEW IF NOT EXISTS "{self.snapshot_view}" AS
+            SELECT *
+            FROM "{self.versions_table}" FINAL
+            WHERE report_date <= {{report_date:Date}}
+            ORDER BY report_date DESC
+            LIMIT 1 BY {key}
+            """
+        )
+        self.client.command(f'CREATE TABLE IF NOT EXISTS "{self.name}" AS "{self.versions_table}"')
+        self._begin_staging()
+        versions: Dict[str, str] = table_types(self.client, self.versions_table)
+        columns: str = ', '.join(
+            f'`{column}`' for column in table_types(self.client, self.name)
+            if column in versions and column != 'report_date'
+        )
+        report_date: str = self.report_date.strftime('%Y-%m-%d')
+        self.client.command(
+            f"""
+            INSERT INTO "{self.staging_table}" ({columns}, report_date)
+            SELECT {columns}, toDate('{report_date}')
+            FROM "{self.snapshot_view}"(report_date = '{report_date}')
+            """
+        )
+        self._publish_partition()
+        return int(self.client.command(
+            f"""
+            SELECT count()
+            FROM "{self.name}"
+            WHERE _partition_id = '{self.report_yearmonth}'
+            """
+        ))
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import asyncio
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+import pandas as pd
+
+from src.utils.clickhouse_client import TableSchema, table_types
+from src.utils.clickhouse_sink import ClickHouseSink
+from src.sources.rudata.RuDataDF import logger
+from src.sources.rudata.RuDataManifest import LoadManifest, COMPLETE
+
+
+class RuDataHistory:
+    """
+    Методы с историей цен за период (dateFrom - dateTo). Подмешивается перед RuDataDF/RuDataPagesDF:
+
+    class RUPriceHistory(RuDataHistory, RuDataPagesDF)
+
+    Наследник задает history_period() - окно загрузки за месяц, history_date - колонку даты торгов
+    и history_key - колонки инструмента. В payload даты берутся из date_from и date_to.
+    incremental=True (или RUDATA_INCREMENTAL=1): запрашиваются только даты после последней полностью загруженной,
+    строки дописываются в непрерывную дневную таблицу <метод>Daily (ReplacingMergeTree по ключу и дате),
+    а load возвращает последнее наблюдение по каждому инструменту на конец окна (см. latest).
+    Строки пишутся в <метод>DailyStaging и переносятся в дневную таблицу (ATTACH PARTITION) только после
+    всех запросов, затем в rudata_load_manifest записывается watermark - дата, по которую загружено.
+    Упавшая загрузка в дневную таблицу не попадает и при следующем запуске повторяется с той же даты.
+    """
+    history_date: str = 'tradedate'
+    history_key: Tuple[str, ...] = ('isin',)
+    history_days: int = 30
+    incremental: Optional[bool] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.incremental is None:
+            self.incremental = os.environ.get('RUDATA_INCREMENTAL', '0') == '1'
+        self.date_from, self.date_to = self.history_period()
+
+    def history_period(self) -> Tuple[date, date]:
+        raise NotImplementedError
+
+    @property
+    def history_table(self) -> str:
+        return f'{self.name}Daily'
+
+    @property
+    def history_schema(self) -> TableSchema:
+        return TableSchema(
+            order_by=(*self.history_key, self.history_date),
+            types={**self.schema.types, self.history_date: 'Date32'},
+            engine='ReplacingMergeTree',
+            partition_by=f'toYYYYMM(`{self.history_date}`)',
+        )
+
+    @property
+    def history_staging_table(self) -> str:
+        return f'{self.history_table}Staging'
+
+    def last_stored_date(self) -> Optional[date]:
+        """
+        Дата, по которую дневная таблица загружена полностью (watermark в rudata_load_manifest),
+        None - завершенных загрузок еще не было
+        """
+        watermark: Optional[str] = LoadManifest(self.client).watermark(self.history_table)
+        return date.fromisoformat(watermark) if watermark else None
+
+    def _begin_history_staging(self) -> None:
+        """
+        Пустая staging таблица по структуре дневной (если ее еще нет - создается первой записью по history_schema)
+        """
+        if table_types(self.client, self.history_table):
+            self.client.command(f'CREATE TABLE IF NOT EXISTS "{self.history_staging_table}" AS "{self.history_table}"')
+        if table_types(self.client, self.history_staging_table):
+            self.client.command(f'TRUNCATE TABLE "{self.history_staging_table}"')
+
+    def _publish_history(self, last: Optional[date], rows: int) -> None:
+        """
+        Перенос партиций staging в дневную таблицу и watermark загрузки. Повтор после падения между ними
+        безопасен: строки с тем же ключом и датой схлопывает ReplacingMergeTree
+        """
+        if table_types(self.client, self.history_staging_table):
+            self.client.command(f'CREATE TABLE IF NOT EXISTS "{self.history_table}" AS "{self.history_staging_table}"')
+            partitions = self.client.query(
+                """
+                SELECT DISTINCT partition_id
+                FROM system.parts
+                WHERE active AND database = currentDatabase() AND table = %(table)s
+                """,
+                parameters={'table': self.history_staging_table}
+            ).result_rows
+            for (partition,) in partitions:
+                self.client.command(
+                    f'ALTER TABLE "{self.history_table}" ATTACH PARTITION ID \'{partition}\' '
+                    f'FROM "{self.history_staging_table}"'
+                )
+            self.client.command(f'TRUNCATE TABLE "{self.history_staging_table}"')
+        # загрузка более раннего окна не сдвигает watermark назад
+        watermark: date = max(last, self.date_to) if last else self.date_to
+        LoadManifest(self.client).record(self.history_table, '', COMPLETE, rows, watermark.isoformat())
+
+    async def load(
+            self,
+            session: Optional[aiohttp.ClientSession] = None,
+            read: bool = True,
+            reload: bool = False,
+            **select,
+    ) -> pd.DataFrame:
+        """
+        reload=True - окно history_period() запрашивается целиком, без учета watermark: новые строки
+        заменяют прежние с тем же ключом и датой (ReplacingMergeTree), watermark назад не сдвигается
+        """
+        if not self.incremental:
+            return await super().load(session=session, read=read, reload=reload, **select)
+        self.check_authorization()
+        start, end = self.history_period()
+        last: Optional[date] = await asyncio.to_thread(self.last_stored_date)
+        self.date_from, self.date_to = (last + timedelta(days=1) if last and not reload else start), end
+        if self.date_from <= self.date_to:
+            logger.info(f"{self.name} loading {self.date_from} - {self.date_to} into {self.history_table}")
+            await asyncio.to_thread(self._begin_history_staging)
+            async with ClickHouseSink(
+                    self.client,
+                    self.history_staging_table,
+                    batch_rows=self.batch_rows,
+                    schema=self.history_schema,
+                    endpoint=self.name,
+            ) as self._sink:
+                await self.send_requests(session=session)
+            await asyncio.to_thread(self._publish_history, last, self._sink.rows)
+            logger.info(f"{self.name} appended {self._sink.rows} rows to {self.history_table}")
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.clear)
+        else:
+            logger.info(f"{self.name} history is up to date ({last})")
+        if not read:
+            return pd.DataFrame()
+        self._df = await asyncio.to_thread(self.latest, self.date_to, **select)
+        return self._df
+
+    async def collect(self, rows: List[dict]) -> None:
+        if self.incremental and rows and self.history_date not in rows[0]:
+            raise ValueError(f"{self.name} rows have no {self.history_date} column. Check {self.name}.history_date")
+        await super().collect(rows)
+
+    def latest(
+            self,
+            as_of: Optional[date] = None,
+            columns: Optional[List[str]] = None,
+            filters: Optional[Dict[str, object]] = None,
+            where: Optional[str] = None,
+            parameters: Optional[dict] = None,
+    ) -> pd.DataFrame:
+        """
+        Последнее наблюдение по каждому инструменту (history_key) на дату as_of (по умолчанию date_to)
+        из дневной таблицы. Отбор колонок и строк - как в _select_df
+        """
+        key: str = ', '.join(f'`{column}`' for column in self.history_key)
+        if columns:
+            columns = list(dict.fromkeys([*self.history_key, self.history_date, *columns]))
+        return self._query_df(
+            f'"{self.history_table}" FINAL',
+            [f'`{self.history_date}` <= %(_as_of)s'],
+            columns=columns,
+            filters=filters,
+            where=where,
+            parameters={**(parameters or {}), '_as_of': as_of or self.date_to},
+            tail=f'ORDER BY `{self.history_date}` DESC LIMIT 1 BY {key}',
+        )
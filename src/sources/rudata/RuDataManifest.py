@@ -0,0 +1,102 @@
+from __future__ import annotations
+import threading
+from typing import Optional
+
+
+LOADING: str = 'loading'
+COMPLETE: str = 'complete'
+
+
+class LoadManifest:
+    """
+    Служебная таблица rudata_load_manifest: по строке на (endpoint, partition) со статусом последней загрузки.
+    В начале загрузки пишется статус loading, после записи всех данных в ClickHouse - complete и количество строк.
+    Проверка "данные за месяц уже загружены" - один запрос к этой таблице вместо чтения всей партиции.
+    Инкрементальные загрузки (RuDataHistory, RuDataDelta) хранят в watermark значение, по которое данные
+    загружены полностью. Оно записывается только после успешной загрузки, поэтому упавшая загрузка
+    при следующем запуске начинается с того же места.
+
+    manifest = LoadManifest(client)
+    manifest.status('FintoolReferenceData', '202409')  # 'complete', 'loading' или None
+    manifest.watermark('RUPriceHistoryDaily')  # '2024-09-30' или None
+    """
+    table: str = 'rudata_load_manifest'
+    _created: bool = False
+    _create_lock = threading.Lock()
+
+    def __init__(self, client):
+        self.client = client
+        self._create_table()
+
+    def _create_table(self) -> None:
+        with LoadManifest._create_lock:
+            if LoadManifest._created:
+                return
+            self.client.command(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table}
+                (
+                    endpoint LowCardinality(String),
+                    partition String,
+                    rows UInt64,
+                    status LowCardinality(String),
+                    watermark String DEFAULT '',
+                    completed_at DateTime64(3) DEFAULT now64(3)
+                )
+                ENGINE = ReplacingMergeTree(completed_at)
+                ORDER BY (endpoint, partition)
+                """
+            )
+            # таблица, созданная до появления watermark
+            self.client.command(f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS watermark String DEFAULT ''")
+            LoadManifest._created = True
+
+    def status(self, endpoint: str, partition: str) -> Optional[str]:
+        result = self.client.query(
+            f"""
+            SELECT argMax(status, completed_at)
+            FROM {self.table}
+            WHERE endpoint = %(endpoint)s AND partition = %(partition)s
+            GROUP BY endpoint, partition
+            """,
+            parameters={'endpoint': endpoint, 'partition': partition}
+        )
+        return result.first_row[0] if result.result_rows else None
+
+    def partition_rows(self, table: str, partition: str) -> int:
+        """
+        Количество строк в партиции по метаданным system.parts, без чтения данных.
+        Для несуществующей таблицы - 0
+        """
+        return int(self.client.command(
+            """
+            SELECT sum(rows)
+            FROM system.parts
+            WHERE active AND database = currentDatabase() AND table = %(table)s AND partition_id = %(partition)s
+            """,
+            parameters={'table': table, 'partition': partition}
+        ) or 0)
+
+    def watermark(self, endpoint: str, partition: str = '') -> Optional[str]:
+        """
+        watermark последней завершенной загрузки, None - завершенных загрузок не было
+        """
+        result = self.client.query(
+            f"""
+            SELECT argMax(watermark, completed_at)
+            FROM {self.table}
+            WHERE endpoint = %(endpoint)s AND partition = %(partition)s AND status = %(status)s
+            GROUP BY endpoint, partition
+            """,
+            parameters={'endpoint': endpoint, 'partition': partition, 'status': COMPLETE}
+        )
+        if not result.result_rows:
+            return None
+        return result.first_row[0] or None
+
+    def record(self, endpoint: str, partition: str, status: str, rows: int = 0, watermark: str = '') -> None:
+        self.client.insert(
+            self.table,
+            [[endpoint, partition, rows, status, watermark]],
+            column_names=['endpoint', 'partition', 'rows', 'status', 'watermark'],
+        )
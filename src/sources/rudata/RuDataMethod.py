@@ -1,30 +1,32 @@
 import os
 from pathlib import Path
-from time import sleep
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Tuple
 import pandas as pd
-import requests
 from dotenv import load_dotenv
 
 from src.utils.divide_chunks import divide_chunks
-from src.utils.get_date import (
-    last_day_month_str,
-    last_work_date_month,
-    last_work_date_month_str,
-    last_day_month,
-    first_day_month_str,
-)
+from src.utils.http_session import run
 from src.utils.path import get_project_root
-from datetime import datetime as dt, timedelta
+from src.utils.run_context import RunContext
+from datetime import date, timedelta
+from src.sources.rudata.RuData import BASE_URL
 from src.sources.rudata.RuDataDF import RuDataDF, RuDataPagesDF, LIMIT
+from src.sources.rudata.RuDataHistory import RuDataHistory
+from src.sources.rudata.RuDataDelta import RuDataDelta
+from src.sources.rudata.RuDataToken import TokenManager, token_manager
+
+
+# время жизни кэша ответов справочников (cache_ttl), секунд
+WEEK: int = 7 * 24 * 3600
 
 
 class Account(RuDataDF):
     """
     https://docs.efir-net.ru/dh2/#/Account/Login
     Авторизация пользователя. Получить авторизационный токен.
+    Токен берется из кэша на диске и обновляется при истечении или 401 (см. TokenManager)
     """
-    url: str = "https://dh2.efir-net.ru/v2/Account/Login"
+    url: str = TokenManager.url
     _instance = None
 
     def __init__(self):
@@ -32,11 +34,8 @@ class Account(RuDataDF):
         if self._instance.__initialized:
             return
         self._instance.__initialized = True
-        self.__payload = self.payloads()
-        response: Dict[str, str] = self.send_requests()
-        self._token_str: str = response["token"]
+        self._token_str: str = self.send_requests()
         self.set_headers({"Authorization": "Bearer " + self._token_str})
-        sleep(1)
 
     @staticmethod
     def __new__(cls, *args, **kwargs):
@@ -56,8 +55,8 @@ class Account(RuDataDF):
     async def execute_tasks(self, tasks):
         raise NotImplemented
 
-    def send_requests(self):
-        return requests.post(self.url, json=self.__payload).json()
+    def send_requests(self) -> str:
+        return token_manager.token()
 
     @property
     def instance(self):
@@ -69,35 +68,35 @@ class ExchangeTree(RuDataPagesDF):
     https://docs.efir-net.ru/dh2/#/Info/ExchangeTree?id=post-exchangetree
     Получить иерархию торговых площадок/источников, используемых Интерфакс
     """
-    url = "https://dh2.efir-net.ru/v2/Info/ExchangeTree"
+    url = f"{BASE_URL}/Info/ExchangeTree"
+    cache_ttl = WEEK
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 300,
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
 
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+        }
 
-class Emitents(RuDataPagesDF):
+
+class Emitents(RuDataDelta, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Info/Emitents?id=post-emitents
     Получить краткий справочник по эмитентам.
     """
-    url: str = "https://dh2.efir-net.ru/v2/Info/Emitents"
+    url: str = f"{BASE_URL}/Info/Emitents"
+    delta_key = ('fininstid',)
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 300,
-                    'filter': '',
-                    'inn_as_string': True
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'filter': self.delta_filter(),
+            'inn_as_string': True
+        }
 
 
 class OfferorsGuarants(RuDataPagesDF):
@@ -105,46 +104,45 @@ class OfferorsGuarants(RuDataPagesDF):
     https://docs.efir-net.ru/dh2/#/Bond/OfferorsGuarants?id=post-offerorsguarants
     Возвращает список гарантов/оферентов для инструмента
     """
-    url: str = "https://dh2.efir-net.ru/v2/Bond/OfferorsGuarants"
+    url: str = f"{BASE_URL}/Bond/OfferorsGuarants"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 100,
-                    'fintoolIds': [],
-                    'date': last_day_month_str
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 100
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'fintoolIds': [],
+            'date': self.context.last_day_month_str
+        }
 
 class CurrencyRateHistory(RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Archive/CurrencyRate?id=post-currencyrate
     Получить кросс-курс двух валют.
     """
-    url: str = "https://dh2.efir-net.ru/v2/Archive/CurrencyRate"
+    url: str = f"{BASE_URL}/Archive/CurrencyRate"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 100,
-                    'dateFrom': '',
-                    'dateTo': last_day_month_str,
-                    'withHolidays': True,
-                    'baseCurrency': 'RUB',
-                    'quotedCurrency': '',
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 100
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'dateFrom': '',
+            'dateTo': self.context.last_day_month_str,
+            'withHolidays': True,
+            'baseCurrency': 'RUB',
+            'quotedCurrency': '',
+        }
 
 class ListScaleValues(RuDataDF):
     """
     https://docs.efir-net.ru/dh2/#/Rating/ListScaleValues?id=post-Listscalevalues
     Список шкал значений рейтингов
     """
-    url: str = "https://dh2.efir-net.ru/v2/Rating/ListScaleValues"
+    url: str = f"{BASE_URL}/Rating/ListScaleValues"
+    cache_ttl = WEEK
 
     def payloads(self):
         yield [
@@ -154,46 +152,48 @@ class ListScaleValues(RuDataDF):
         ]
 
 
-class InfoSecurities(RuDataPagesDF):
+class InfoSecurities(RuDataDelta, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Info/Securities?id=post-securities
     Получить краткий справочник по финансовым инструментам.
     Для акций метод возвращает только основные выпуски (по колонке SecurityKind).
     Для получения данных по дополнительным выпускам необходимо использовать метод FintoolRefrenceData.
     """
-    url = "https://dh2.efir-net.ru/v2/Info/Securities"
+    url = f"{BASE_URL}/Info/Securities"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 300,
-                    'filter': ''
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'filter': self.delta_filter()
+        }
 
 
-class RUPriceHistory(RuDataPagesDF):
+class RUPriceHistory(RuDataHistory, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/RuPrice/History
     Позволяет получить таблицу с историческими данными по одному или нескольким инструментам за заданный период времени.
     """
-    url = "https://dh2.efir-net.ru/v2/RUPrice/History"
+    url = f"{BASE_URL}/RUPrice/History"
+    stream = True
+    history_date = 'date'
+    history_key = ('isincode',)
 
-    def payloads(self):
-        dateFrom = (dt.strptime(last_day_month_str, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
-        dateTo = last_day_month_str
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                    'ids': [],
-                    'dateFrom': dateFrom,
-                    'dateTo': dateTo
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
+
+    def history_period(self) -> Tuple[date, date]:
+        return self.context.last_day_month - timedelta(days=self.history_days), self.context.last_day_month
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'ids': [],
+            'dateFrom': self.date_from.strftime("%Y-%m-%d"),
+            'dateTo': self.date_to.strftime("%Y-%m-%d")
+        }
 
 
 class CalendarV2(RuDataPagesDF):
@@ -201,148 +201,152 @@ class CalendarV2(RuDataPagesDF):
     https://docs.efir-net.ru/dh2/#/Info/CalendarV2?id=post-calendarv2
     Возвращает календарь событий по инструментам за период.
     """
-    url = "https://dh2.efir-net.ru/v2/Info/CalendarV2"
+    url = f"{BASE_URL}/Info/CalendarV2"
+    stream = True
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                    'fintoolIds': [],
-                    'eventTypes': [],
-                    'fields': [],
-                    'startDate': "",
-                    'endDate': ""
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'fintoolIds': [],
+            'eventTypes': [],
+            'fields': [],
+            'startDate': "",
+            'endDate': ""
+        }
 
 
-class CouponsExt(RuDataPagesDF):
+class CouponsExt(RuDataDelta, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Bond/CouponsExt
     """
-    url = "https://dh2.efir-net.ru/v2/Bond/CouponsExt"
+    url = f"{BASE_URL}/Bond/CouponsExt"
+    delta_key = ('fintoolid', 'id_coupon')
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 300,
-                    'filter': ''
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
 
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'filter': self.delta_filter()
+        }
 
-class MoexSecurities(RuDataPagesDF):
+
+class MoexSecurities(RuDataDelta, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Moex/Securities?id=post-securities
     Получить список торгуемых инструментов.
     """
-    url = "https://dh2.efir-net.ru/v2/Moex/Securities"
+    url = f"{BASE_URL}/Moex/Securities"
+    delta_key = ('secid',)
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 300,
-                    'filter': ''
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'filter': self.delta_filter()
+        }
 
 
-class HistoryStockBonds(RuDataPagesDF):
+class HistoryStockBonds(RuDataHistory, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Moex/History
     Получить официальные итоги по набору конкретных инструментов или по всем инструментам заданного рынка, группы режимов или одного режима торгов.
     """
-    url = "https://dh2.efir-net.ru/v2/Moex/History"
+    url = f"{BASE_URL}/Moex/History"
 
-    def payloads(self):
-        dateFrom = (last_work_date_month - timedelta(days=30)).strftime("%Y-%m-%d")
-        dateTo = last_work_date_month_str
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                    'engine': "stock",
-                    'market': "bonds",
-                    'dateFrom': dateFrom,
-                    'dateTo': dateTo
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
 
+    def history_period(self) -> Tuple[date, date]:
+        last_work_date_month: date = self.context.last_work_date_month
+        return last_work_date_month - timedelta(days=self.history_days), last_work_date_month
 
-class HistoryStockShares(RuDataPagesDF):
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'engine': "stock",
+            'market': "bonds",
+            'dateFrom': self.date_from.strftime("%Y-%m-%d"),
+            'dateTo': self.date_to.strftime("%Y-%m-%d")
+        }
+
+
+class HistoryStockShares(RuDataHistory, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Moex/History
     Получить официальные итоги по набору конкретных инструментов или по всем инструментам заданного рынка, группы режимов или одного режима торгов.
     """
-    url = "https://dh2.efir-net.ru/v2/Moex/History"
+    url = f"{BASE_URL}/Moex/History"
 
-    def payloads(self):
-        dateFrom = (last_work_date_month - timedelta(days=30)).strftime("%Y-%m-%d")
-        dateTo = last_work_date_month_str
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                    'engine': "stock",
-                    'market': "shares",
-                    'dateFrom': dateFrom,
-                    'dateTo': dateTo
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
+
+    def history_period(self) -> Tuple[date, date]:
+        last_work_date_month: date = self.context.last_work_date_month
+        return last_work_date_month - timedelta(days=self.history_days), last_work_date_month
 
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'engine': "stock",
+            'market': "shares",
+            'dateFrom': self.date_from.strftime("%Y-%m-%d"),
+            'dateTo': self.date_to.strftime("%Y-%m-%d")
+        }
 
-class HistoryStockNdm(RuDataPagesDF):
+
+class HistoryStockNdm(RuDataHistory, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Moex/History
     Получить официальные итоги по набору конкретных инструментов или по всем инструментам заданного рынка, группы режимов или одного режима торгов.
     """
-    url = "https://dh2.efir-net.ru/v2/Moex/History"
+    url = f"{BASE_URL}/Moex/History"
 
-    def payloads(self):
-        dateFrom = (last_work_date_month - timedelta(days=30)).strftime("%Y-%m-%d")
-        dateTo = last_work_date_month_str
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                    'engine': "stock",
-                    'market': "ndm",
-                    'dateFrom': dateFrom,
-                    'dateTo': dateTo
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
+
+    def history_period(self) -> Tuple[date, date]:
+        last_work_date_month: date = self.context.last_work_date_month
+        return last_work_date_month - timedelta(days=self.history_days), last_work_date_month
 
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'engine': "stock",
+            'market': "ndm",
+            'dateFrom': self.date_from.strftime("%Y-%m-%d"),
+            'dateTo': self.date_to.strftime("%Y-%m-%d")
+        }
 
-class HistoryStockCcp(RuDataPagesDF):
+
+class HistoryStockCcp(RuDataHistory, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Moex/History
     Получить официальные итоги по набору конкретных инструментов или по всем инструментам заданного рынка, группы режимов или одного режима торгов.
     """
-    url = "https://dh2.efir-net.ru/v2/Moex/History"
+    url = f"{BASE_URL}/Moex/History"
 
-    def payloads(self):
-        dateFrom = (last_work_date_month - timedelta(days=30)).strftime("%Y-%m-%d")
-        dateTo = last_work_date_month_str
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                    'engine': "stock",
-                    'market': "ccp",
-                    'dateFrom': dateFrom,
-                    'dateTo': dateTo
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
+
+    def history_period(self) -> Tuple[date, date]:
+        last_work_date_month: date = self.context.last_work_date_month
+        return last_work_date_month - timedelta(days=self.history_days), last_work_date_month
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'engine': "stock",
+            'market': "ccp",
+            'dateFrom': self.date_from.strftime("%Y-%m-%d"),
+            'dateTo': self.date_to.strftime("%Y-%m-%d")
+        }
 
 
 class CompanyGroupRelations(RuDataPagesDF):
@@ -350,17 +354,16 @@ class CompanyGroupRelations(RuDataPagesDF):
     https://docs.efir-net.ru/dh2/#/Affiliate/CompanyGroupRelations
     Возвращает описание отношений в группах компаний
     """
-    url = "https://dh2.efir-net.ru/v2/Affiliate/CompanyGroupRelations"
+    url = f"{BASE_URL}/Affiliate/CompanyGroupRelations"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 100,
-                    'actualDate': last_day_month_str
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 100
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'actualDate': self.context.last_day_month_str
+        }
 
 
 class MoexStocks(RuDataPagesDF):
@@ -368,31 +371,29 @@ class MoexStocks(RuDataPagesDF):
     https://docs.efir-net.ru/v2/Moex/Stocks
     Возвращает краткое описание ценных бумаг фондового рынка
     """
-    url = "https://dh2.efir-net.ru/v2/Moex/Stocks"
+    url = f"{BASE_URL}/Moex/Stocks"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 300,
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+        }
 
 
 class NsdCommonData(RuDataPagesDF):
     """
     """
-    url = "https://dh2.efir-net.ru/v2/Nsd/CommonData"
+    url = f"{BASE_URL}/Nsd/CommonData"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 100,
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 100
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+        }
 
 
 class Multipliers(RuDataPagesDF):
@@ -400,35 +401,33 @@ class Multipliers(RuDataPagesDF):
     https://docs.efir-net.ru/v2/Emitent/Multipliers
     Возвращает краткое описание ценных бумаг фондового рынка
     """
-    url = "https://dh2.efir-net.ru/v2/Nsd/CommonData"
+    url = f"{BASE_URL}/Nsd/CommonData"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'pageNum': pageNum + i,
-                    'pageSize': 100,
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 100
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+        }
 
 
-class FintoolReferenceData(RuDataPagesDF):
+class FintoolReferenceData(RuDataDelta, RuDataPagesDF):
     """
     https://docs.efir-net.ru/dh2/#/Info/FintoolReferenceData?id=post-fintoolreferencedata
     Получить расширенный справочник по финансовым инструментам.
     """
-    url = "https://dh2.efir-net.ru/v2/Info/FintoolReferenceData"
+    url = f"{BASE_URL}/Info/FintoolReferenceData"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'id': '',
-                    'fields': [],
-                    'filter': '',
-                    'pager': {'page': pageNum + i, 'size': 300}
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 300
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'id': '',
+            'fields': [],
+            'filter': self.delta_filter(),
+            'pager': {'page': page_num, 'size': self.page_size}
+        }
 
 
 class ListRatings(RuDataDF):
@@ -436,7 +435,8 @@ class ListRatings(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Dictionary/ListRatings?id=post-listratings
     Список рейтингов
     """
-    url = "https://dh2.efir-net.ru/v2/Rating/ListRatings"
+    url = f"{BASE_URL}/Rating/ListRatings"
+    cache_ttl = WEEK
 
     def payloads(self):
         yield [
@@ -452,7 +452,9 @@ class CompanyRatingsTable(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Rating/CompanyRatingsTable?id=post-companyratingstable
     Получить рейтинги нескольких компаний на заданную дату.
     """
-    url = "https://dh2.efir-net.ru/v2/Rating/CompanyRatingsTable"
+    url = f"{BASE_URL}/Rating/CompanyRatingsTable"
+    depends_on = ('Emitents',)
+    batch_key = 'ids'
 
     def payloads(self):
         fininstids: List[int] = (
@@ -468,15 +470,15 @@ class CompanyRatingsTable(RuDataDF):
         if not fininstids:
             raise ValueError('finintids must not be empty. Please check the Emitents table for data.')
 
-        for chunk_fininstid in divide_chunks(fininstids, 100*LIMIT):
+        for chunk_fininstids in self.batcher.chunks(fininstids, LIMIT):
             yield [
                 {
                     'count': 10000000,
-                    'ids': [{"id": fininstid, "idType": "FININSTID"} for fininstid in chunk_fininstid[100*i:100*(i+1)]],
-                    'date': last_day_month_str,
+                    'ids': [{"id": fininstid, "idType": "FININSTID"} for fininstid in part],
+                    'date': self.context.last_day_month_str,
                     'companyName': '',
                     'filter': ''
-                } for i in range(LIMIT)
+                } for part in chunk_fininstids
             ]
 
 
@@ -485,7 +487,9 @@ class SecurityRatingTable(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Rating/SecurityRatingTable?id=post-securityratingtable
     Получить рейтинги нескольких бумаг и связанных с ними компаний на заданную дату.
     """
-    url = "https://dh2.efir-net.ru/v2/Rating/SecurityRatingTable"
+    url = f"{BASE_URL}/Rating/SecurityRatingTable"
+    depends_on = ('FintoolReferenceData',)
+    batch_key = 'ids'
 
     def payloads(self):
         isins: List[int] = (
@@ -501,13 +505,13 @@ class SecurityRatingTable(RuDataDF):
         if not isins:
             raise ValueError('isins must not be empty. Please check the Emitents table for data.')
 
-        for chunk_isins in divide_chunks(isins, 100*LIMIT):
+        for chunk_isins in self.batcher.chunks(isins, LIMIT):
             yield [
                 {
                     'count': 10000000,
-                    'ids': chunk_isins[100*i:100*(i+1)],
-                    'date': last_day_month_str,
-                } for i in range(LIMIT)
+                    'ids': part,
+                    'date': self.context.last_day_month_str,
+                } for part in chunk_isins
             ]
 
 
@@ -515,38 +519,66 @@ class CurrencyRate(RuDataDF):
     """
     https://docs.efir-net.ru/dh2/#/Archive/CurrencyRate?id=post-currencyrate
     Получить кросс-курс двух валют.
-    """
-    url = "https://dh2.efir-net.ru/v2/Archive/CurrencyRate"
+    По умолчанию - курсы к рублю всех валют из таблицы currencies на конец месяца.
+    Произвольные пары (from, to) на дату без записи в ClickHouse - CurrencyRate.rates(pairs, date)
+    """
+    url = f"{BASE_URL}/Archive/CurrencyRate"
+
+    def __init__(
+            self,
+            pairs: Optional[Iterable[Tuple[str, str]]] = None,
+            date: Optional[str] = None,
+            stream: Optional[bool] = None,
+            context: Optional[RunContext] = None,
+    ):
+        super().__init__(stream=stream, context=context)
+        self.pairs: Optional[List[Tuple[str, str]]] = list(pairs) if pairs is not None else None
+        self.date: str = date or self.context.last_day_month_str
+
+    @classmethod
+    def rates(cls, pairs: Iterable[Tuple[str, str]], date: Optional[str] = None) -> pd.DataFrame:
+        """
+        Курсы пар (from, to) на дату date (по умолчанию конец месяца) одним DataFrame с колонками from и to
+        """
+        currency_rate = cls(pairs=pairs, date=date)
+        currency_rate.checkpoint = ''
+        currency_rate.check_authorization()
+        return run(currency_rate.send_requests())
 
     def payloads(self):
-        currencies: List[str] = (
-            self.client.query_df(
-                f"""
-                        SELECT DISTINCT currency
-                        FROM currencies
-                        """
-            )['currency']
-            .to_list()
-        )
-        if not currencies:
-            raise ValueError('currencies must not be empty. Please check the currencies table for data.')
-
-        for currency in currencies:
-            yield {
-                    'from': currency,
-                    'to': 'RUB',
-                    'date': last_day_month_str,
-                }
-
-    async def send_requests(self):
-        currencies_rudata = []
-        for payload in CurrencyRate().payloads():
-            ans = requests.post(self.url, json=payload, headers=self.headers)
-            result: dict = ans.json()
-            result["currency"] = payload['from']
-            currencies_rudata.append(result)
-            sleep(1)
-        return pd.DataFrame(currencies_rudata)
+        if self.pairs is None:
+            currencies: List[str] = (
+                self.client.query_df(
+                    f"""
+                            SELECT DISTINCT currency
+                            FROM currencies
+                            """
+                )['currency']
+                .to_list()
+            )
+            if not currencies:
+                raise ValueError('currencies must not be empty. Please check the currencies table for data.')
+            pairs: List[Tuple[str, str]] = [(currency, 'RUB') for currency in currencies]
+        else:
+            pairs = self.pairs
+
+        # запросы всех пар отправляются вместе, одновременность и частоту ограничивает limiter
+        yield [
+            {
+                'from': currency_from,
+                'to': currency_to,
+                'date': self.date,
+            } for currency_from, currency_to in pairs
+        ]
+
+    def response_rows(self, payload: dict, body) -> List[dict]:
+        rows: List[dict] = super().response_rows(payload, body)
+        for row in rows:
+            if self.pairs is None:
+                row['currency'] = payload['from']
+            else:
+                row['from'], row['to'] = payload['from'], payload['to']
+        return rows
 
 
 class AccruedInterestOnDate(RuDataDF):
@@ -554,7 +586,9 @@ class AccruedInterestOnDate(RuDataDF):
     https://docs.efir-net.ru/dh2/#/AccruedInterest/AccruedInterestOnDate?id=post-accruedinterestondate
     Расчет НКД на дату
     """
-    url = "https://dh2.efir-net.ru/v2/AccruedInterest/AccruedInterestOnDate"
+    url = f"{BASE_URL}/AccruedInterest/AccruedInterestOnDate"
+    depends_on = ('FintoolReferenceData',)
+    batch_key = 'fintoolIds'
 
     def payloads(self):
         fintoolids: List[int] = (
@@ -570,13 +604,13 @@ class AccruedInterestOnDate(RuDataDF):
         if not fintoolids:
             raise ValueError('fintoolids must not be empty. Please check the FintoolReferenceData table for data.')
 
-        for chunk_fintoolids in divide_chunks(fintoolids, 100 * LIMIT):
+        for chunk_fintoolids in self.batcher.chunks(fintoolids, LIMIT):
             yield [
                 {
-                    'fintoolIds': chunk_fintoolids[100 * i:100 * (i + 1)],
-                    'endDate': last_day_month_str,
-                    'cashFlowCalcDate': last_day_month_str,
-                } for i in range(LIMIT)
+                    'fintoolIds': part,
+                    'endDate': self.context.last_day_month_str,
+                    'cashFlowCalcDate': self.context.last_day_month_str,
+                } for part in chunk_fintoolids
             ]
 
 
@@ -585,7 +619,12 @@ class FloatersOnPeriod(RuDataDF):
     https://docs.efir-net.ru/dh2/#/AccruedInterest/floaters-on-period
     Расчет НКД для флоатеров за период
     """
-    url = "https://dh2.efir-net.ru/v2/AccruedInterest/floaters-on-period"
+    url = f"{BASE_URL}/AccruedInterest/floaters-on-period"
+    depends_on = ('FloaterData',)
+    batch_key = 'fintoolIds'
+    batch_size = 10
+    # ответ не постраничный (pageSize на одну бумагу), поэтому список id не больше pageSize
+    max_batch = 100
 
     def payloads(self):
         fintoolids: List[int] = (
@@ -600,15 +639,15 @@ class FloatersOnPeriod(RuDataDF):
         )
         if not fintoolids:
             raise ValueError('fintoolids must not be empty. Please check the FintoolReferenceData table for data.')
-        for chunk_fintoolids in divide_chunks(fintoolids, 10 * LIMIT):
+        for chunk_fintoolids in self.batcher.chunks(fintoolids, LIMIT):
             yield [
                 {
-                    'fintoolIds': chunk_fintoolids[10 * i:10 * (i + 1)],
-                    'beginDate': last_day_month_str,
-                    'endDate': last_day_month_str,
-                    'cashFlowCalcDate': last_day_month_str,
+                    'fintoolIds': part,
+                    'beginDate': self.context.last_day_month_str,
+                    'endDate': self.context.last_day_month_str,
+                    'cashFlowCalcDate': self.context.last_day_month_str,
                     'pageSize': 100
-                } for i in range(LIMIT)
+                } for part in chunk_fintoolids
             ]
 
 
@@ -617,7 +656,8 @@ class EndOfDay(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Archive/EndOfDay?id=post-endofday
     Получить данные по результатам торгов на заданную дату.
     """
-    url = "https://dh2.efir-net.ru/v2/Archive/EndOfDay"
+    url = f"{BASE_URL}/Archive/EndOfDay"
+    depends_on = ('FintoolReferenceData',)
 
     def payloads(self):
         # isins = pd.read_excel('/Users/alexander/PycharmProjects/insurance_mine/data/Input/ISIN_072025.xlsx', dtype=str)['code_isin'].tolist()
@@ -643,11 +683,12 @@ class EndOfDay(RuDataDF):
         if not isins:
             raise ValueError('isins must not be empty. Please check the ISIN table for data.')
 
+        # метод принимает один isin, списком ISIN (batch_key) торги запрашивает EndOfDayOnExchanges
         for chunk_isins in divide_chunks(isins, LIMIT):
             yield [
                 {
                     'isin': isin,
-                    'date': first_day_month_str,
+                    'date': self.context.first_day_month_str,
                     'dateType': 'LAST_TRADE_DATE',
                     'fields': [
                         "isin", "seccode", "secname", "name", "fintoolId", "id_iss", "id_trade_site",
@@ -662,12 +703,22 @@ class EndOfDay(RuDataDF):
             ]
 
 
-class EndOfDayOnExchanges(RuDataDF):
+class EndOfDayOnExchanges(RuDataHistory, RuDataDF):
     """
     https://docs.efir-net.ru/dh2/#/Archive/EndOfDayOnExchanges?id=post-endofdayonexchanges
     Получить данные по результатам торгов на заданную дату.
     """
-    url = "https://dh2.efir-net.ru/v2/Archive/EndOfDayOnExchanges"
+    url = f"{BASE_URL}/Archive/EndOfDayOnExchanges"
+    depends_on = ('FintoolReferenceData',)
+    stream = True
+    history_date = 'date'
+    history_key = ('isin', 'id_trade_site')
+    batch_key = 'codes'
+    batch_size = 20
+    max_batch = 500
+
+    def history_period(self) -> Tuple[date, date]:
+        return self.context.last_day_month - timedelta(days=self.history_days), self.context.first_day_month
 
     def payloads(self):
         isins: List[str] = (
@@ -690,12 +741,12 @@ class EndOfDayOnExchanges(RuDataDF):
         if not isins:
             raise ValueError('isins must not be empty. Please check the ISIN table for data.')
 
-        for chunk_isins in divide_chunks(isins, 20 * LIMIT):
+        for chunk_isins in self.batcher.chunks(isins, LIMIT):
             yield [
                 {
-                    'codes': chunk_isins[20*i:20*(i+1)],
-                    'dateFrom': (last_day_month - timedelta(days=30)).strftime("%Y-%m-%d"),
-                    'dateTo': first_day_month_str,
+                    'codes': part,
+                    'dateFrom': self.date_from.strftime("%Y-%m-%d"),
+                    'dateTo': self.date_to.strftime("%Y-%m-%d"),
                     'fields': [
                         "isin", "seccode", "secname", "name", "fintoolId", "id_iss", "id_trade_site",
                         "add_date", "update_date", "mat_date", "last_time",
@@ -705,7 +756,7 @@ class EndOfDayOnExchanges(RuDataDF):
                         "duration", "pvbp", "convexity", "spread",
                         "boardid", "boardname", "exch", "currency"
                     ]
-                } for i in range(LIMIT)
+                } for part in chunk_isins
             ]
 
 
@@ -714,7 +765,9 @@ class FloaterData(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Bond/FloaterData?id=post-floaterdata
     Возвращает описания правил расчета ставок для бумаг с плавающей купонной ставкой
     """
-    url = "https://dh2.efir-net.ru/v2/Bond/FloaterData"
+    url = f"{BASE_URL}/Bond/FloaterData"
+    depends_on = ('FintoolReferenceData',)
+    batch_key = 'fintoolIds'
 
     def payloads(self):
         fintoolids: List[int] = (
@@ -730,13 +783,13 @@ class FloaterData(RuDataDF):
         if not fintoolids:
             raise ValueError('fintoolids must not be empty. Please check the FintoolReferenceData table for data.')
 
-        for chunk_fintoolids in divide_chunks(fintoolids, 100 * LIMIT):
+        for chunk_fintoolids in self.batcher.chunks(fintoolids, LIMIT):
             yield [
                 {
-                    'fintoolIds': chunk_fintoolids[100 * i:100 * (i + 1)],
-                    'date': last_day_month_str,
+                    'fintoolIds': part,
+                    'date': self.context.last_day_month_str,
                     'showFuturePeriods': True,
-                } for i in range(LIMIT)
+                } for part in chunk_fintoolids
             ]
 
 
@@ -745,7 +798,8 @@ class AffiliateTypes(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Affiliate/types
     Возвращает справочник типов аффилированности
     """
-    url = "https://dh2.efir-net.ru/v2/Affiliate/types"
+    url = f"{BASE_URL}/Affiliate/types"
+    cache_ttl = WEEK
 
     def payloads(self):
         yield [{}]
@@ -756,7 +810,10 @@ class CompanyGroupMembers(RuDataDF):
     https://docs.efir-net.ru/dh2/#/Affiliate/CompanyGroupMembers
     Получить информацию о принадлежности компаний к группам компаний
     """
-    url = "https://dh2.efir-net.ru/v2/Affiliate/CompanyGroupMembers"
+    url = f"{BASE_URL}/Affiliate/CompanyGroupMembers"
+    depends_on = ('Emitents',)
+    batch_key = 'memberInns'
+    batch_size = 20
 
     def payloads(self):
         inns: List[int] = (
@@ -772,12 +829,12 @@ class CompanyGroupMembers(RuDataDF):
         if not inns:
             raise ValueError('inns must not be empty. Please check the Emitents table for data.')
 
-        for chunk_inns in divide_chunks(inns, LIMIT):
+        for chunk_inns in self.batcher.chunks(inns, LIMIT):
             yield [
                 {
-                    'memberInns': chunk_inns[i],
-                    'actualDate': last_day_month_str,
-                } for i in range(LIMIT)
+                    'memberInns': part,
+                    'actualDate': self.context.last_day_month_str,
+                } for part in chunk_inns
             ]
 
 
@@ -786,15 +843,14 @@ class CompanyGroups(RuDataPagesDF):
     https://docs.efir-net.ru/dh2/#/Affiliate/CompanyGroups
     Получить состав групп по идентификаторам групп
     """
-    url = "https://dh2.efir-net.ru/v2/Affiliate/CompanyGroups"
+    url = f"{BASE_URL}/Affiliate/CompanyGroups"
 
-    def payloads(self):
-        for pageNum in range(1, 10_000, LIMIT):
-            yield [
-                {
-                    'groupIds': [],
-                    'actualDate': last_day_month_str,
-                    'pageNum': pageNum + i,
-                    'pageSize': 1000,
-                } for i in range(LIMIT)
-            ]
+    page_size: int = 1000
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'groupIds': [],
+            'actualDate': self.context.last_day_month_str,
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+        }
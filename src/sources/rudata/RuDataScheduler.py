@@ -0,0 +1,161 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Type, Union
+import aiohttp
+import pandas as pd
+
+from src.utils.clickhouse_client import connect
+from src.utils.http_session import http_pool, run
+from src.utils.metrics import metrics
+from src.utils.run_context import RunContext
+from src.sources.rudata.RuDataDF import RuDataDF, logger
+from src.sources.rudata import RuDataMethod
+
+
+def endpoints() -> Dict[str, Type[RuDataDF]]:
+    """
+    Все методы RuData по имени класса
+    """
+    result: Dict[str, Type[RuDataDF]] = {}
+    stack: List[Type[RuDataDF]] = [RuDataDF]
+    while stack:
+        cls = stack.pop()
+        for sub in cls.__subclasses__():
+            stack.append(sub)
+            if getattr(sub, 'url', None) and sub is not RuDataMethod.Account:
+                result[sub.__name__] = sub
+    return result
+
+
+class RuDataScheduler:
+    """
+    Загружает набор методов в одном event loop с общим пулом соединений и общим лимитером запросов.
+    Зависимости берутся из RuDataDF.depends_on: метод стартует, как только в ClickHouse записаны
+    все методы, из которых строятся его payloads, независимые методы загружаются одновременно.
+
+    Account()
+    frames = RuDataScheduler([FintoolReferenceData, EndOfDay, CompanyRatingsTable]).run()
+    frames['EndOfDay'].head()
+
+    select={'EndOfDay': {'columns': ['fintoolId', 'last'], 'filters': {'id_trade_site': [170, 183]}}}
+    отбирает колонки и строки в ClickHouse, до передачи в pandas.
+    context=RunContext.for_month('2024-09') - загрузка другого отчетного месяца,
+    read=False - только запись в ClickHouse, без чтения результатов (см. RuDataBackfill),
+    reload=True - запрошенные методы (не зависимости) загружаются заново с атомарной заменой партиции
+    """
+
+    def __init__(
+            self,
+            methods: Iterable[Union[str, Type[RuDataDF]]],
+            include_dependencies: bool = True,
+            select: Optional[Dict[str, dict]] = None,
+            context: Optional[RunContext] = None,
+            read: bool = True,
+            reload: bool = False,
+    ):
+        registry: Dict[str, Type[RuDataDF]] = endpoints()
+        names: List[str] = [m if isinstance(m, str) else m.__name__ for m in methods]
+        # зависимости, добавленные автоматически, только загружаются в ClickHouse и не читаются обратно
+        self.requested: set = set(names)
+        # отбор колонок и строк при чтении метода из ClickHouse: {метод: аргументы RuDataDF._select_df}
+        self.select: Dict[str, dict] = select or {}
+        self.context: RunContext = context or RunContext()
+        self.read: bool = read
+        self.reload: bool = reload
+        unknown: List[str] = [name for name in names if name not in registry]
+        if unknown:
+            raise ValueError(f"Unknown RuData methods {unknown}")
+        if include_dependencies:
+            i = 0
+            while i < len(names):
+                names.extend(dep for dep in registry[names[i]].depends_on if dep not in names)
+                i += 1
+        self.methods: Dict[str, Type[RuDataDF]] = {name: registry[name] for name in names}
+        self.order: List[str] = self._topological_order()
+        self.timings: Dict[str, float] = {}
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        visiting: set = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle at {name}")
+            visiting.add(name)
+            for dep in self.methods[name].depends_on:
+                if dep in self.methods:
+                    visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.methods:
+            visit(name)
+        return order
+
+    async def _load(
+            self,
+            name: str,
+            tasks: Dict[str, asyncio.Task],
+            session: aiohttp.ClientSession,
+    ) -> pd.DataFrame:
+        deps: List[asyncio.Task] = [tasks[dep] for dep in self.methods[name].depends_on if dep in tasks]
+        if deps:
+            await asyncio.gather(*deps)
+        method: RuDataDF = self.methods[name](context=self.context)
+        # у каждого метода свое подключение: clickhouse_connect не допускает параллельных запросов в одной сессии
+        method.client = await asyncio.to_thread(connect)
+        start: float = time.monotonic()
+        logger.info(f"{name} {self.context.month} started")
+        try:
+            df: pd.DataFrame = await method.load(
+                session=session,
+                read=self.read and name in self.requested,
+                reload=self.reload and name in self.requested,
+                **self.select.get(name, {})
+            )
+        finally:
+            method.client.close()
+        self.timings[name] = time.monotonic() - start
+        metrics.add(name, 'load_seconds', self.timings[name])
+        logger.info(f"{name} finished in {self.timings[name]:.1f}s. {name} shape {df.shape}")
+        return df
+
+    async def run_async(self) -> Dict[str, pd.DataFrame]:
+        metrics.reset()
+        session: aiohttp.ClientSession = http_pool.session()
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self.order:
+            tasks[name] = asyncio.create_task(self._load(name, tasks, session))
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        logger.info(f"RuDataScheduler http {http_pool.stats()}")
+        self.write_metrics()
+        frames: Dict[str, pd.DataFrame] = {}
+        errors: Dict[str, BaseException] = {}
+        for name, result in zip(tasks, results):
+            if isinstance(result, BaseException):
+                logger.error(f"{name} failed: {type(result).__name__}: {result}")
+                errors[name] = result
+            elif name in self.requested:
+                frames[name] = result
+        if errors:
+            raise RuntimeError(f"RuData methods failed: {list(errors)}") from next(iter(errors.values()))
+        return frames
+
+    def write_metrics(self) -> None:
+        """
+        Отчет запуска по методам (см. RunMetrics): JSON в logs и textfile Prometheus rudata_metrics_<YYYYMM>.prom
+        """
+        try:
+            report, textfile = metrics.write(
+                labels={'month': self.context.month},
+                name=f'rudata_metrics_{self.context.report_yearmonth}',
+            )
+            logger.info(f"RuData metrics written to {report} and {textfile}")
+        except OSError as e:
+            logger.error(f"RuData metrics not written: {e}")
+
+    def run(self) -> Dict[str, pd.DataFrame]:
+        return run(self.run_async())
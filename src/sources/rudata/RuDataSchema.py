@@ -0,0 +1,65 @@
+from __future__ import annotations
+from typing import Dict
+
+from src.utils.clickhouse_client import TableSchema
+
+
+LOW_CARDINALITY: str = 'LowCardinality(String)'
+DATE: str = 'Nullable(Date32)'
+
+# Таблицы методов RuData: ключ сортировки по id, по которым из таблиц строятся payloads и делаются выборки,
+# даты и строки с малым числом значений. Остальные колонки получают тип по данным первой загрузки
+SCHEMAS: Dict[str, TableSchema] = {
+    'FintoolReferenceData': TableSchema(
+        order_by=('fintooltype', 'fintoolid'),
+        types={
+            'fintooltype': LOW_CARDINALITY,
+            'faceftname': LOW_CARDINALITY,
+            'securitykind': LOW_CARDINALITY,
+            'country': LOW_CARDINALITY,
+            'issuercountry': LOW_CARDINALITY,
+            'borrowercountry': LOW_CARDINALITY,
+            'begdistdate': DATE,
+            'endmtydate': DATE,
+        },
+    ),
+    'Emitents': TableSchema(order_by=('fininstid',)),
+    'OfferorsGuarants': TableSchema(order_by=('fintoolId',)),
+    'ExchangeTree': TableSchema(order_by=('id',)),
+    'ListRatings': TableSchema(order_by=('agency', 'id'), types={'agency': LOW_CARDINALITY}),
+    'ListScaleValues': TableSchema(order_by=('scale_id',)),
+    'CompanyRatingsTable': TableSchema(order_by=('fininstid', 'id_rating')),
+    'SecurityRatingTable': TableSchema(order_by=('isin', 'fintoolid', 'id_rating')),
+    'CurrencyRate': TableSchema(order_by=('currency',), types={'currency': LOW_CARDINALITY}),
+    'AccruedInterestOnDate': TableSchema(
+        order_by=('fintoolId',),
+        types={'faceValueCurrency': LOW_CARDINALITY},
+    ),
+    'FloatersOnPeriod': TableSchema(order_by=('fintoolId',)),
+    'FloaterData': TableSchema(
+        order_by=('fintoolId',),
+        types={'beg_period': DATE, 'end_period': DATE},
+    ),
+    'EndOfDay': TableSchema(
+        order_by=('id_trade_site', 'isin'),
+        types={'currency': LOW_CARDINALITY, 'boardid': LOW_CARDINALITY, 'exch': LOW_CARDINALITY},
+    ),
+    'EndOfDayOnExchanges': TableSchema(
+        order_by=('isin', 'id_trade_site'),
+        types={'currency': LOW_CARDINALITY, 'boardid': LOW_CARDINALITY, 'exch': LOW_CARDINALITY},
+    ),
+    'RUPriceHistory': TableSchema(order_by=('isincode',)),
+    'CalendarV2': TableSchema(order_by=('eventType', 'finToolID'), types={'eventType': LOW_CARDINALITY}),
+    'MoexSecurities': TableSchema(order_by=('isin', 'secid')),
+    'HistoryStockBonds': TableSchema(order_by=('isin',)),
+    'HistoryStockShares': TableSchema(order_by=('isin',)),
+    'HistoryStockNdm': TableSchema(order_by=('isin',)),
+    'HistoryStockCcp': TableSchema(order_by=('isin',)),
+}
+
+
+def get_schema(endpoint: str) -> TableSchema:
+    """
+    Схема таблицы метода, для методов без описания - только партиционирование и кодеки
+    """
+    return SCHEMAS.get(endpoint, TableSchema())
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import base64
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+from src.utils.http_session import http_pool
+from src.utils.path import get_project_root
+from src.logger.Logger import Logger
+from src.sources.rudata.RuData import BASE_URL
+
+try:
+    import fcntl
+except ImportError:  # Windows: между процессами файл не блокируется
+    fcntl = None
+
+
+logger = Logger()
+
+
+class TokenManager:
+    """
+    Токен RuData (https://docs.efir-net.ru/dh2/#/Account/Login) с кэшем на диске.
+    Файл data/State/rudata_token.json (RUDATA_TOKEN_CACHE - другой файл) хранит токен и время его истечения:
+    exp из JWT, если токен его содержит, иначе время получения + RUDATA_TOKEN_TTL секунд (по умолчанию 6 часов).
+    Новый процесс берет действующий токен из файла без логина. Логин выполняется под блокировкой
+    (threading.Lock в процессе и flock файла .lock между процессами), поэтому при одновременном 401
+    в нескольких запросах, потоках или notebooks токен обновляется один раз, остальные берут его из файла.
+
+    token = token_manager.token()
+    token = token_manager.refresh(stale=token)  # после 401
+    """
+    url: str = f"{BASE_URL}/Account/Login"
+    # запас до истечения, чтобы токен не истек посреди загрузки
+    margin: float = 60.0
+
+    def __init__(self, path: Optional[Path] = None, ttl: Optional[float] = None):
+        self.path: Path = Path(path or os.environ.get(
+            'RUDATA_TOKEN_CACHE', Path.joinpath(get_project_root(), 'data/State/rudata_token.json')
+        ))
+        self.ttl: float = ttl or float(os.environ.get('RUDATA_TOKEN_TTL', 6 * 3600))
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires: float = 0.0
+        self.logins: int = 0
+
+    def token(self) -> str:
+        """
+        Действующий токен: из памяти, из файла или после логина
+        """
+        if self._valid(self._token, self._expires):
+            return self._token
+        with self._locked():
+            token, expires = self._read()
+            if self._valid(token, expires):
+                self._token, self._expires = token, expires
+                return token
+            return self._login()
+
+    def refresh(self, stale: Optional[str] = None) -> str:
+        """
+        Новый токен после 401 на stale. Если другой поток или процесс уже обновил токен, логин не выполняется
+        """
+        with self._locked():
+            token, expires = self._read()
+            if token and token != stale and self._valid(token, expires):
+                self._token, self._expires = token, expires
+                return token
+            return self._login()
+
+    def _valid(self, token: Optional[str], expires: float) -> bool:
+        return bool(token) and expires - self.margin > time.time()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path.with_suffix('.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> Tuple[Optional[str], float]:
+        try:
+            cache: dict = json.loads(self.path.read_text())
+            return cache['token'], float(cache['expires'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, 0.0
+
+    def _login(self) -> str:
+        load_dotenv(Path.joinpath(get_project_root(), '.venv/.env'))
+        response = http_pool.requests_session().post(
+            self.url,
+            json={'login': os.environ["LOGIN"], 'password': os.environ["PASSWORD"]},
+            timeout=60,
+        )
+        response.raise_for_status()
+        token: str = response.json()["token"]
+        self.logins += 1
+        self._token, self._expires = token, self._expiry(token)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp: Path = self.path.with_suffix('.tmp')
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'token': token, 'expires': self._expires}, f)
+        tmp.replace(self.path)
+        logger.info(f"RuData login, token valid until {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._expires))}")
+        return token
+
+    def _expiry(self, token: str) -> float:
+        """
+        exp из JWT токена, иначе время получения + ttl
+        """
+        try:
+            claims: str = token.split('.')[1]
+            exp = json.loads(base64.urlsafe_b64decode(claims + '=' * (-len(claims) % 4)))['exp']
+            return float(exp)
+        except (IndexError, ValueError, KeyError, TypeError):
+            return time.time() + self.ttl
+
+
+token_manager = TokenManager()
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from src.utils.divide_chunks import divide_chunks
+from src.utils.path import get_project_root
+
+
+class BatchTooLargeError(Exception):
+    """
+    Запрос со списком id не выполнен (413, 5xx, таймаут), а список длиннее текущего размера пачки:
+    вместо повтора того же запроса список делится на части
+    """
+
+
+class AdaptiveBatcher:
+    """
+    Количество id в одном запросе для метода, который принимает список id.
+    После каждого ответа размер пересчитывается:
+    ошибка сервера, таймаут или 413 - уменьшается в decrease раз,
+    ответ дольше target_latency - уменьшается пропорционально превышению,
+    полная пачка быстрее target_latency / 2 - растет в increase раз, но не выше 0.9 размера последней
+    не выполненной пачки (эта граница поднимается на 1% после каждой полной пачки, чтобы со временем проверить ее снова),
+    и не больше, чем помещается в max_response_bytes по среднему размеру ответа на один id.
+    Подобранный размер сохраняется в state_path и используется при следующем запуске.
+
+    batcher = get_batcher('EndOfDayOnExchanges', initial=20)
+    for chunk in batcher.chunks(isins, LIMIT):
+        yield [{'codes': codes} for codes in chunk]
+    """
+
+    def __init__(
+            self,
+            name: str,
+            initial: int,
+            min_size: int = 1,
+            max_size: int = 1000,
+            target_latency: float = 10.0,
+            max_response_bytes: int = 20_000_000,
+            increase: float = 1.5,
+            decrease: float = 0.5,
+            state_path: Optional[Path] = None,
+    ):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_response_bytes = max_response_bytes
+        self.increase = increase
+        self.decrease = decrease
+        self.state_path = state_path
+        self._size: float = float(min(max(initial, min_size), max_size))
+        self._bytes_per_id: Optional[float] = None
+        self._limit: Optional[float] = None
+        self._lock = threading.Lock()
+        self.requests: int = 0
+        self.failures: int = 0
+        self._load()
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    def chunks(self, ids: List, groups: int) -> Iterable[List[List]]:
+        """
+        Группы по groups списков id текущего размера. Размер читается перед каждой группой,
+        поэтому ответы на предыдущие группы уже учтены
+        """
+        start: int = 0
+        while start < len(ids):
+            size: int = self.size
+            window: List = ids[start:start + size * groups]
+            start += len(window)
+            yield list(divide_chunks(window, size))
+
+    def observe(self, ids: int, latency: float, failed: bool = False, response_bytes: int = 0) -> None:
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.failures += 1
+                if ids > self.min_size:
+                    self._limit = float(ids) if self._limit is None else min(self._limit, float(ids))
+                self._size = max(self.min_size, self._size * self.decrease)
+                return
+            if ids and response_bytes:
+                per_id: float = response_bytes / ids
+                self._bytes_per_id = per_id if self._bytes_per_id is None else 0.8 * self._bytes_per_id + 0.2 * per_id
+            if latency > self.target_latency:
+                self._size = max(self.min_size, self._size * max(self.target_latency / latency, self.decrease))
+            elif latency < self.target_latency / 2 and ids >= self.size:
+                self._size = min(self.max_size, self._size * self.increase)
+                if self._limit is not None:
+                    self._limit *= 1.01
+                    self._size = max(self.min_size, min(self._size, 0.9 * self._limit))
+            if self._bytes_per_id:
+                self._size = max(self.min_size, min(self._size, self.max_response_bytes / self._bytes_per_id))
+
+    def _load(self) -> None:
+        if self.state_path is None or not self.state_path.exists():
+            return
+        try:
+            state: dict = json.loads(self.state_path.read_text()).get(self.name, {})
+        except ValueError:
+            return
+        if 'size' in state:
+            self._size = float(min(max(state['size'], self.min_size), self.max_size))
+        self._bytes_per_id = state.get('bytes_per_id', self._bytes_per_id)
+        self._limit = state.get('limit', self._limit)
+
+    def save(self) -> None:
+        if self.state_path is None:
+            return
+        with _batchers_lock:
+            state: dict = {}
+            if self.state_path.exists():
+                try:
+                    state = json.loads(self.state_path.read_text())
+                except ValueError:
+                    state = {}
+            state[self.name] = {'size': self.size, 'bytes_per_id': self._bytes_per_id, 'limit': self._limit}
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp: Path = self.state_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+            tmp.replace(self.state_path)
+
+    def __repr__(self) -> str:
+        return f"AdaptiveBatcher({self.name}, size={self.size}, requests={self.requests}, failures={self.failures})"
+
+
+_batchers: Dict[str, AdaptiveBatcher] = {}
+_batchers_lock = threading.RLock()
+
+
+def get_batcher(name: str, initial: int, max_size: int = 1000) -> AdaptiveBatcher:
+    """
+    Общий для процесса batcher метода. Состояние хранится в data/State/batch_sizes.json
+    (RUDATA_BATCH_STATE - другой файл, пусто - не сохранять)
+    """
+    with _batchers_lock:
+        if name not in _batchers:
+            path: str = os.environ.get(
+                'RUDATA_BATCH_STATE', str(Path.joinpath(get_project_root(), 'data/State/batch_sizes.json'))
+            )
+            _batchers[name] = AdaptiveBatcher(
+                name,
+                initial=initial,
+                max_size=max_size,
+                state_path=Path(path) if path else None,
+            )
+        return _batchers[name]
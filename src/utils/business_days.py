@@ -0,0 +1,114 @@
+from __future__ import annotations
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Set, Union
+import numpy as np
+import pandas as pd
+
+from src.utils.path import get_project_root
+
+
+Dates = Union[date, pd.Timestamp, pd.Series, pd.Index, np.ndarray, list]
+
+
+class BusinessCalendar:
+    """
+    Производственный календарь РФ из data/Input/calendar.csv: строка на год, год;нерабочие дни января;...;декабря.
+    Нерабочие дни файла (включая выходные) загружаются один раз в np.busdaycalendar с рабочей неделей
+    из 7 дней, поэтому календарь совпадает с файлом день в день, в том числе на перенесенных выходных.
+    Годы, которых нет в файле, считаются по неделе понедельник - пятница (covers(year) - есть ли год в файле).
+    Функции принимают дату или колонку дат и работают целиком на колонке, NaT остается NaT:
+
+    calendar = business_calendar()
+    calendar.roll(df['date'])                       # последний рабочий день не позже даты
+    calendar.offset(df['date'], 1, roll='following')  # следующий рабочий день
+    calendar.count(df['prev_date'], df['payment_date'])
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        path = Path(path or Path.joinpath(get_project_root(), 'data/Input/calendar.csv'))
+        calendar: pd.DataFrame = pd.read_csv(path, sep=';', header=None, index_col=0, dtype=str)
+        self.years: Set[int] = set(calendar.index.astype(int))
+        holidays = [
+            f'{year:04d}-{month:02d}-{int(day):02d}'
+            for year, months in zip(calendar.index.astype(int), calendar.itertuples(index=False))
+            for month, days in enumerate(months, start=1)
+            if isinstance(days, str)
+            for day in days.split(',')
+        ]
+        # выходные годов вне файла
+        span = np.arange(np.datetime64('1990-01-01'), np.datetime64('2101-01-01'), dtype='datetime64[D]')
+        span = span[~np.isin(span.astype('datetime64[Y]').astype(int) + 1970, list(self.years))]
+        weekends = span[np.is_busday(span, weekmask='0000011')]
+        self.holidays: np.ndarray = np.union1d(np.array(holidays, dtype='datetime64[D]'), weekends)
+        self.calendar = np.busdaycalendar(weekmask='1111111', holidays=self.holidays)
+
+    def covers(self, year: int) -> bool:
+        return year in self.years
+
+    def is_business_day(self, dates: Dates):
+        values, wrap = _to_days(dates)
+        result = np.zeros(values.shape, dtype=bool)
+        mask = ~np.isnat(values)
+        result[mask] = np.is_busday(values[mask], busdaycal=self.calendar)
+        return wrap(result, dates, as_dates=False)
+
+    def roll(self, dates: Dates, roll: str = 'preceding'):
+        """
+        Рабочий день не позже (preceding) или не раньше (following) даты
+        """
+        return self.offset(dates, 0, roll=roll)
+
+    def offset(self, dates: Dates, days: Union[int, np.ndarray, pd.Series], roll: str = 'preceding'):
+        """
+        Сдвиг на days рабочих дней. Нерабочая дата сначала переносится по roll
+        """
+        values, wrap = _to_days(dates)
+        return wrap(np.busday_offset(values, np.asarray(days), roll=roll, busdaycal=self.calendar), dates)
+
+    def count(self, begin: Dates, end: Dates):
+        """
+        Количество рабочих дней в [begin, end), при end < begin - отрицательное. Для NaT - NaN
+        """
+        begin_values, wrap = _to_days(begin)
+        end_values, _ = _to_days(end)
+        begin_values, end_values = np.broadcast_arrays(begin_values, end_values)
+        result = np.full(begin_values.shape, np.nan)
+        mask = ~(np.isnat(begin_values) | np.isnat(end_values))
+        result[mask] = np.busday_count(begin_values[mask], end_values[mask], busdaycal=self.calendar)
+        return wrap(result, begin, as_dates=False)
+
+
+def _to_days(dates: Dates):
+    """
+    Даты в datetime64[D] и функция, которая возвращает результат в форме исходного аргумента
+    """
+    if isinstance(dates, (date, pd.Timestamp, np.datetime64, str)):
+        value = np.array([pd.Timestamp(dates).to_datetime64()], dtype='datetime64[D]')
+
+        def wrap(result, original, as_dates=True):
+            if not as_dates:
+                return result[0].item()
+            return None if np.isnat(result[0]) else pd.Timestamp(result[0]).date()
+        return value, wrap
+
+    values = pd.to_datetime(dates).to_numpy().astype('datetime64[D]')
+
+    def wrap(result, original, as_dates=True):
+        if as_dates:
+            result = result.astype('datetime64[ns]')
+        if isinstance(original, pd.Series):
+            return pd.Series(result, index=original.index, name=original.name)
+        if isinstance(original, pd.Index):
+            return pd.Index(result, name=original.name)
+        return result
+    return values, wrap
+
+
+@lru_cache(maxsize=None)
+def business_calendar() -> BusinessCalendar:
+    """
+    Календарь процесса, файл читается при первом обращении
+    """
+    return BusinessCalendar()
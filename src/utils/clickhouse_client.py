@@ -1,74 +1,339 @@
 import os
+from functools import lru_cache
 from clickhouse_connect import get_client
 from clickhouse_connect.driver.exceptions import OperationalError
 from dotenv import load_dotenv
 from src.utils.path import get_project_root, Path
+from src.utils.metrics import metrics
 
 env_path: Path = Path.joinpath(get_project_root(), '.venv/.env')
 load_dotenv(env_path)
 
-try:
-    client = get_client(
-        host=os.environ['CLICKHOUSE_HOST'],
-        port=int(os.environ['CLICKHOUSE_PORT']),
-        username=os.environ['CLICKHOUSE_USER'],
-        password=os.environ['CLICKHOUSE_PASSWORD'])
-except ConnectionRefusedError as e:
-    print(e)
-    print('Clickhouse is not running')
-    raise
-except OperationalError as e:
-    print(e)
-    client = get_client(
-        host='localhost',
-        port=int(os.environ['CLICKHOUSE_PORT']),
-        username=os.environ['CLICKHOUSE_USER'],
-        password=os.environ['CLICKHOUSE_PASSWORD'])
+
+def connect():
+    """
+    Новое подключение к ClickHouse. Для параллельных запросов из разных потоков нужен отдельный client
+    """
+    try:
+        return get_client(
+            host=os.environ['CLICKHOUSE_HOST'],
+            port=int(os.environ['CLICKHOUSE_PORT']),
+            username=os.environ['CLICKHOUSE_USER'],
+            password=os.environ['CLICKHOUSE_PASSWORD'])
+    except ConnectionRefusedError as e:
+        print(e)
+        print('Clickhouse is not running')
+        raise
+    except OperationalError as e:
+        print(e)
+        return get_client(
+            host='localhost',
+            port=int(os.environ['CLICKHOUSE_PORT']),
+            username=os.environ['CLICKHOUSE_USER'],
+            password=os.environ['CLICKHOUSE_PASSWORD'])
+
+
+@lru_cache(maxsize=None)
+def default_client():
+    """
+    Общее подключение процесса. Создается при первом обращении, а не при импорте модуля
+    """
+    return connect()
+
+
+class LazyClient:
+    """
+    Атрибут класса, который при обращении возвращает default_client():
+
+    class RuDataDF:
+        client = LazyClient()
+
+    Присваивание client в классе или экземпляре заменяет подключение по умолчанию
+    """
+
+    def __get__(self, instance, owner):
+        return default_client()
+
+
+def __getattr__(name: str):
+    # from src.utils.clickhouse_client import client - подключение по умолчанию при первом обращении
+    if name == 'client':
+        return default_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 import pandas as pd
 import numpy as np
 import json
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, List, Optional, Tuple
 
-def get_type_map():
-    return {
-        'bool': ('UInt8', lambda s: s.astype(np.uint8)),
-        'int8': ('Int8', lambda s: s),
-        'int16': ('Int16', lambda s: s),
-        'int32': ('Int32', lambda s: s),
-        'int64': ('Int64', lambda s: s),
-        'uint8': ('UInt8', lambda s: s),
-        'uint16': ('UInt16', lambda s: s),
-        'uint32': ('UInt32', lambda s: s),
-        'uint64': ('UInt64', lambda s: s),
-        'float32': ('Float32', lambda s: s),
-        'float64': ('Float64', lambda s: s),
-        'category': ('String', lambda s: s.astype(str)),
-        'datetime64[ns]': ('DateTime', lambda s: s),
-        'object': ('String', lambda s: s.apply(
-            lambda x: json.dumps(x) if isinstance(x, (dict, list)) else str(x)
-        )),
-    }
-
-def prepare_for_clickhouse(df: pd.DataFrame):
-    type_map = get_type_map()
-    df_converted = pd.DataFrame()
-    ch_types = {}
+SAMPLE_SIZE = 100
 
+
+def _scalar_type(values: list) -> str:
+    """
+    Тип ClickHouse для значений внутри вложенной структуры (элементы списков, поля словарей)
+    """
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds:
+        return 'Nullable(String)'
+    if all(issubclass(kind, (list, tuple)) for kind in kinds):
+        return f'Array({_scalar_type([x for value in values if value for x in value])})'
+    if all(issubclass(kind, dict) for kind in kinds):
+        return _dict_type([value for value in values if value is not None])
+    if kinds <= {bool}:
+        return 'Nullable(Bool)'
+    if kinds <= {bool, int}:
+        return 'Nullable(Int64)'
+    if kinds <= {bool, int, float}:
+        return 'Nullable(Float64)'
+    return 'Nullable(String)'
+
+
+def _dict_type(values: List[dict]) -> str:
+    """
+    Словари с одинаковым набором полей - именованный Tuple, поля объединяются по всей выборке
+    """
+    keys: List[str] = list(dict.fromkeys(key for value in values for key in value))
+    if not keys:
+        return 'Map(String, String)'
+    fields = ', '.join(f'`{key}` {_scalar_type([value.get(key) for value in values])}' for key in keys)
+    return f'Tuple({fields})'
+
+
+def _is_nested(column: pd.Series) -> bool:
+    if column.dtype != object:
+        return False
+    non_null = column.dropna()
+    return not non_null.empty and isinstance(non_null.iloc[0], (list, tuple, dict))
+
+
+def clickhouse_types(df: pd.DataFrame) -> Dict[str, str]:
+    """
+    Типы колонок ClickHouse для DataFrame. Тип определяется по dtype колонки, для object - один раз
+    по выборке значений: списки - Array(...), списки словарей - Array(Tuple(...)), словари - Tuple(...),
+    остальное - String
+    """
+    types: Dict[str, str] = {}
     for col in df.columns:
-        dtype = str(df[col].dtype)
-
-        # Special fallback for pandas treating dicts/lists as "object"
-        if dtype == 'object':
-            # Check first non-null value
-            sample = df[col].dropna().iloc[0] if not df[col].dropna().empty else ''
-            if isinstance(sample, (dict, list)):
-                dtype = 'object'  # handled by mapping
+        column: pd.Series = df[col]
+        dtype = column.dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            types[col] = 'UInt8'
+        elif pd.api.types.is_integer_dtype(dtype):
+            types[col] = str(dtype).replace('int', 'Int').replace('uInt', 'UInt')
+            if column.hasnans:
+                # pandas Int64 с пропусками
+                types[col] = f'Nullable({types[col]})'
+        elif pd.api.types.is_float_dtype(dtype):
+            types[col] = 'Float32' if dtype == np.float32 else 'Float64'
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            types[col] = 'DateTime'
+        elif _is_nested(column):
+            sample: list = column.dropna().iloc[:SAMPLE_SIZE].tolist()
+            types[col] = _scalar_type(sample)
+        else:
+            types[col] = 'String'
+    return types
+
+
+def _base_type(ch_type: str) -> str:
+    """
+    Тип без Nullable(...) и LowCardinality(...)
+    """
+    while ch_type.startswith(('Nullable(', 'LowCardinality(')):
+        ch_type = ch_type[ch_type.index('(') + 1:-1]
+    return ch_type
+
+
+def _is_nested_type(ch_type: str) -> bool:
+    return ch_type.startswith(('Array', 'Tuple', 'Map', 'Nested'))
+
+
+def prepare_for_clickhouse(df: pd.DataFrame, column_types: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Приводит DataFrame к типам колонок таблицы column_types (по умолчанию - clickhouse_types(df)).
+    Приведение выполняется целыми колонками. Списки и словари остаются python объектами для колонок
+    Array/Tuple/Map/Nested, а в JSON строки переводятся только для таблиц, где такая колонка String
+    """
+    column_types = column_types or clickhouse_types(df)
+    df_converted: Dict[str, pd.Series] = {}
+    for col in df.columns:
+        column: pd.Series = df[col]
+        ch_type: str = column_types.get(col, 'String')
+        dtype = column.dtype
+        base_type: str = _base_type(ch_type)
+        if pd.api.types.is_bool_dtype(dtype):
+            column = column.astype(np.uint8)
+        elif base_type.startswith(('Int', 'UInt')) and pd.api.types.is_float_dtype(dtype):
+            # целые с пропусками приходят из JSON как float
+            if ch_type.startswith('Nullable'):
+                values = np.empty(len(column), dtype=object)
+                mask = column.notna().to_numpy()
+                values[mask] = column.to_numpy()[mask].astype(np.int64).tolist()
+                column = pd.Series(values, index=column.index)
+            else:
+                column = column.fillna(0)
+        elif base_type.startswith(('Date', 'DateTime')):
+            if not pd.api.types.is_datetime64_any_dtype(dtype):
+                column = pd.to_datetime(column, errors='coerce', format='ISO8601')
+            column = column.astype('datetime64[ns]')
+        elif _is_nested_type(ch_type):
+            # пустое значение для Array - пустой список, для Tuple/Map - пустой словарь
+            empty = [] if ch_type.startswith(('Array', 'Nested')) else {}
+            nulls = column.isna()
+            if nulls.any():
+                column = column.copy()
+                column[nulls] = pd.Series([empty] * int(nulls.sum()), index=column.index[nulls], dtype=object)
+        elif ch_type.startswith(('String', 'LowCardinality(String')) and not (
+                pd.api.types.is_string_dtype(dtype) and pd.api.types.infer_dtype(column, skipna=False) == 'string'
+        ):
+            if _is_nested(column):
+                column = pd.Series(
+                    [json.dumps(x) if isinstance(x, (dict, list)) else str(x) for x in column], index=column.index
+                )
             else:
-                dtype = 'object'
+                column = column.astype(str)
+        df_converted[col] = column
+    return pd.DataFrame(df_converted, index=df.index)
+
+
+def table_types(client, table: str) -> Dict[str, str]:
+    """
+    Типы колонок существующей таблицы, для отсутствующей - пустой словарь
+    """
+    if not int(client.command(f'EXISTS TABLE "{table}"')):
+        return {}
+    return {row[0]: row[1] for row in client.query(f'DESCRIBE TABLE "{table}"').result_rows}
+
+
+class TableSchema:
+    """
+    Описание таблицы для CREATE TABLE: типы колонок, которые нельзя определить по данным
+    (даты, LowCardinality, целые id), и ключ сортировки. Остальные колонки получают тип по
+    clickhouse_types. Колонки из types и order_by, которых нет в данных, пропускаются.
+    Таблица партиционируется по месяцу report_date, кодеки: Delta + ZSTD для дат и целых ключей, ZSTD для остального
+    """
+
+    def __init__(
+            self,
+            order_by: Tuple[str, ...] = (),
+            types: Optional[Dict[str, str]] = None,
+            engine: str = 'MergeTree',
+            partition_by: Optional[str] = None,
+    ):
+        self.order_by = order_by
+        self.types: Dict[str, str] = types or {}
+        self.engine = engine
+        # по умолчанию - месяц report_date, если такая колонка есть
+        self.partition_by = partition_by
+
+    def column_types(self, df: pd.DataFrame) -> Dict[str, str]:
+        types: Dict[str, str] = clickhouse_types(df)
+        types.update({col: ch_type for col, ch_type in self.types.items() if col in types})
+        if 'report_date' in types:
+            types['report_date'] = 'Date'
+        return types
+
+    @staticmethod
+    def codec(ch_type: str, key: bool) -> str:
+        base_type: str = _base_type(ch_type)
+        if base_type.startswith('Date') or key and base_type.startswith(('Int', 'UInt')):
+            return 'CODEC(Delta, ZSTD(3))'
+        return 'CODEC(ZSTD(3))'
+
+    def create_sql(self, table: str, df: pd.DataFrame) -> Tuple[str, Dict[str, str]]:
+        types: Dict[str, str] = self.column_types(df)
+        order_by: List[str] = [col for col in self.order_by if col in types]
+        columns: str = ',\n            '.join(
+            f'`{col}` {ch_type} {self.codec(ch_type, col in order_by)}' for col, ch_type in types.items()
+        )
+        partition_by: Optional[str] = self.partition_by or ('toYYYYMM(report_date)' if 'report_date' in types else None)
+        partition: str = f'PARTITION BY {partition_by}' if partition_by else ''
+        order: str = ', '.join(f'`{col}`' for col in order_by) or 'tuple()'
+        settings: str = (
+            'SETTINGS allow_nullable_key = 1'
+            if any(types[col].startswith('Nullable') for col in order_by) else ''
+        )
+        sql: str = f"""
+        CREATE TABLE IF NOT EXISTS "{table}"
+        (
+            {columns}
+        )
+        ENGINE = {self.engine}
+        {partition}
+        ORDER BY ({order})
+        {settings}
+        """
+        return sql, types
+
+
+def ensure_table(client, table: str, df: pd.DataFrame, schema: Optional[TableSchema] = None) -> Dict[str, str]:
+    """
+    Типы колонок таблицы. Если таблицы нет, она создается по schema и типам DataFrame
+    """
+    types: Dict[str, str] = table_types(client, table)
+    if types:
+        return types
+    sql, types = (schema or TableSchema()).create_sql(table, df)
+    client.command(sql)
+    return types
+
+
+def insert_df(
+        client,
+        table: str,
+        df: pd.DataFrame,
+        column_types: Optional[Dict[str, str]] = None,
+        schema: Optional[TableSchema] = None,
+        endpoint: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    prepare_for_clickhouse и insert в таблицу, которая при необходимости создается по schema.
+    endpoint - метод RuData, в метрики которого записывается время конвертации и insert
+    """
+    if df.empty:
+        return df
+    column_types = column_types or ensure_table(client, table, df, schema)
+    with metrics.timer(endpoint, 'conversion_seconds'):
+        df = prepare_for_clickhouse(df, column_types)
+    with metrics.timer(endpoint, 'insert_seconds'):
+        client.insert_df(table, df)
+    return df
+
+
+def _compact_column(column: pa.ChunkedArray, category: bool) -> pa.ChunkedArray:
+    """
+    Целые - в наименьший знаковый тип, в который помещаются значения.
+    Строки - в словарь (pandas category), если колонка указана в category или значений мало
+    """
+    if pa.types.is_integer(column.type) and column.null_count < len(column):
+        bounds = pc.min_max(column)
+        low, high = bounds['min'].as_py(), bounds['max'].as_py()
+        for int_type in (pa.int8(), pa.int16(), pa.int32()):
+            info = np.iinfo(int_type.to_pandas_dtype())
+            if info.min <= low and high <= info.max:
+                return column.cast(int_type)
+    if pa.types.is_string(column.type) and len(column):
+        if category or pc.count_distinct(column).as_py() <= 0.05 * len(column):
+            return column.dictionary_encode()
+    return column
 
-        # Map dtype → (ClickHouse type, conversion function)
-        ch_type, convert_func = type_map.get(dtype, ('String', lambda s: s.astype(str)))
-        df_converted[col] = convert_func(df[col])
-        ch_types[col] = ch_type
 
-    return df_converted
+def arrow_query_df(client, query: str, parameters=None, categories=()) -> pd.DataFrame:
+    """
+    query_df через Arrow: строки - string[pyarrow], колонки из categories и строки с малым числом
+    значений - category, целые - наименьшего подходящего размера. Дробные остаются float64.
+    Буферы Arrow передаются в pandas без копирования (pd.ArrowDtype)
+    """
+    table: pa.Table = client.query_arrow(query, parameters=parameters, use_strings=True)
+    table = pa.table(
+        [_compact_column(table.column(name), name in categories) for name in table.column_names],
+        names=table.column_names,
+    )
+    return table.to_pandas(
+        types_mapper=lambda arrow_type: None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type),
+        self_destruct=True,
+        split_blocks=True,
+    )
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import asyncio
+from typing import Dict, List, Optional
+import pandas as pd
+
+from src.utils.clickhouse_client import TableSchema, ensure_table, insert_df
+from src.utils.metrics import metrics
+
+
+class ClickHouseSink:
+    """
+    Потоковая запись строк в таблицу ClickHouse пачками по batch_rows.
+    Конвертация и insert выполняются в отдельном потоке, пока event loop получает следующие данные.
+    Очередь ограничена max_pending пачками, поэтому память не растет вместе с размером выгрузки.
+
+    async with ClickHouseSink(client, 'CalendarV2', report_date) as sink:
+        await sink.put(rows)
+    """
+
+    def __init__(
+            self,
+            client,
+            table: str,
+            report_date: Optional[pd.Timestamp] = None,
+            batch_rows: int = 50_000,
+            max_pending: int = 2,
+            schema: Optional[TableSchema] = None,
+            endpoint: Optional[str] = None,
+    ):
+        self.client = client
+        self.table = table
+        self.report_date = report_date
+        self.batch_rows = batch_rows
+        self.max_pending = max_pending
+        # схема для создания таблицы, если ее еще нет
+        self.schema = schema
+        # метод RuData для метрик конвертации и insert
+        self.endpoint = endpoint
+        self.rows: int = 0
+        self._column_types: Optional[Dict[str, str]] = None
+        self._buffer: List[dict] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> ClickHouseSink:
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._consumer = asyncio.create_task(self._consume())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.flush()
+            await self._submit(None)
+            await self._consumer
+        else:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+
+    async def put(self, rows: List[dict]) -> None:
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.batch_rows:
+            batch, self._buffer = self._buffer[:self.batch_rows], self._buffer[self.batch_rows:]
+            await self._submit(batch)
+
+    async def flush(self) -> None:
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            await self._submit(batch)
+
+    async def _submit(self, batch: Optional[List[dict]]) -> None:
+        put: asyncio.Future = asyncio.ensure_future(self._queue.put(batch))
+        # если insert упал, поднимаем его исключение вместо бесконечного ожидания очереди
+        await asyncio.wait({put, self._consumer}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            self._consumer.result()
+
+    async def _consume(self) -> None:
+        while True:
+            batch: Optional[List[dict]] = await self._queue.get()
+            if batch is None:
+                return
+            await asyncio.to_thread(self._insert, batch)
+
+    def _insert(self, batch: List[dict]) -> None:
+        with metrics.timer(self.endpoint, 'conversion_seconds'):
+            df: pd.DataFrame = pd.DataFrame(batch)
+            if self.report_date is not None:
+                df['report_date'] = self.report_date
+        if self._column_types is None:
+            self._column_types = ensure_table(self.client, self.table, df, self.schema)
+        insert_df(self.client, self.table, df, self._column_types, endpoint=self.endpoint)
+        self.rows += len(df)
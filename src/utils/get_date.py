@@ -1,27 +1,54 @@
-from datetime import date, timedelta
+import os
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from io import BytesIO
+from typing import Optional
 import pandas as pd
-import requests
-from src.utils.clickhouse_client import client as clickhouse_client
+from src.utils.business_days import BusinessCalendar, business_calendar
+from src.utils.clickhouse_client import default_client
+from src.utils.http_session import http_pool
 
-# for manual run change the varibale first_day_month: date = date(1970, 1, 1)
-first_day_month: date = date.today().replace(day=1)
+
+def month_start(month: Optional[str] = None) -> date:
+    """
+    Первый день месяца, следующего за отчетным. month - отчетный месяц 'YYYY-MM',
+    по умолчанию RUDATA_REPORT_MONTH, а без него - прошлый месяц
+    """
+    month = month or os.environ.get('RUDATA_REPORT_MONTH')
+    if not month:
+        return date.today().replace(day=1)
+    report: date = datetime.strptime(month, '%Y-%m').date()
+    return (report.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# для загрузки другого месяца - RUDATA_REPORT_MONTH=YYYY-MM или RunContext (src/utils/run_context.py)
+first_day_month: date = month_start()
 first_day_month_str: str = first_day_month.strftime('%Y-%m-%d')
 last_day_month: date = first_day_month - timedelta(days=1)
 last_day_month_str: str = last_day_month.strftime("%Y-%m-%d")
 
-def get_last_work_date_month() -> date:
-    last_day_month_copy = last_day_month
+
+@lru_cache(maxsize=None)
+def last_work_date(day: date) -> date:
+    """
+    Последний рабочий день не позже day по календарю data/Input/calendar.csv, для лет, которых в нем нет, -
+    по таблице holidays (при ее отсутствии за год - по xmlcalendar.ru).
+    Вычисляется при первом обращении и кэшируется
+    """
+    calendar: BusinessCalendar = business_calendar()
+    if calendar.covers(day.year):
+        return calendar.roll(day)
+    clickhouse_client = default_client()
     holidays = clickhouse_client.query_df(
         f"""
         SELECT holiday_date
         FROM holidays
-        WHERE holiday_year = {last_day_month.year}
+        WHERE holiday_year = {day.year}
         """
     )
     if holidays.empty:
-        url = f"https://xmlcalendar.ru/data/ru/{last_day_month.year}/calendar.txt"
-        holidays_request = requests.get(
+        url = f"https://xmlcalendar.ru/data/ru/{day.year}/calendar.txt"
+        holidays_request = http_pool.requests_session().get(
             url,
             headers={
                 "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -31,10 +58,23 @@ def get_last_work_date_month() -> date:
         holidays = pd.read_csv(BytesIO(holidays_request.content), header=None).rename(columns={0: 'holiday_date'})
         holidays['holiday_date'] = pd.to_datetime(holidays['holiday_date'])
         clickhouse_client.insert_df('holidays', holidays)
-    while last_day_month_copy in holidays['holiday_date'].dt.date.tolist():
-        last_day_month_copy -= timedelta(days=1)
-    return last_day_month_copy
+    holiday_dates: set = set(holidays['holiday_date'].dt.date)
+    while day in holiday_dates:
+        day -= timedelta(days=1)
+    return day
+
+
+def get_last_work_date_month() -> date:
+    """
+    Последний рабочий день отчетного месяца
+    """
+    return last_work_date(last_day_month)
 
 
-last_work_date_month: date = get_last_work_date_month()
-last_work_date_month_str: str = last_work_date_month.strftime("%Y-%m-%d")
+def __getattr__(name: str):
+    # last_work_date_month и last_work_date_month_str требуют ClickHouse, поэтому считаются при первом обращении
+    if name == 'last_work_date_month':
+        return get_last_work_date_month()
+    if name == 'last_work_date_month_str':
+        return get_last_work_date_month().strftime("%Y-%m-%d")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import asyncio
+import os
+import socket
+import threading
+from typing import Dict, Optional
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import brotli  # noqa: F401 - aiohttp и urllib3 распаковывают br, только если установлен brotli
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class HttpPool:
+    """
+    Общий пул HTTP соединений процесса: keep-alive, кэш DNS, сжатие ответов.
+    session() - aiohttp.ClientSession для текущего event loop (RuDataDF и наследники),
+    requests_session() - requests.Session для синхронного кода (Account, CBR_Soap, get_date).
+    stats() - сколько соединений открыто и сколько запросов ушло по уже открытым.
+    """
+
+    def __init__(self, pool_size: int = 20, dns_ttl: int = 600, keepalive: float = 60):
+        self.pool_size = pool_size
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._requests_session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        def counter(key: str):
+            async def on_signal(session, context, params) -> None:
+                self._stats[key] += 1
+            return on_signal
+
+        trace_config.on_request_end.append(counter('requests'))
+        trace_config.on_connection_create_end.append(counter('connections_created'))
+        trace_config.on_connection_reuseconn.append(counter('connections_reused'))
+        trace_config.on_dns_cache_hit.append(counter('dns_cache_hits'))
+        trace_config.on_dns_cache_miss.append(counter('dns_cache_misses'))
+        return trace_config
+
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    ttl_dns_cache=self.dns_ttl,
+                    keepalive_timeout=self.keepalive,
+                    family=socket.AF_INET,
+                ),
+                headers={'Accept-Encoding': ACCEPT_ENCODING},
+                trust_env=True,
+                timeout=aiohttp.ClientTimeout(7200),
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def requests_session(self) -> requests.Session:
+        with self._lock:
+            if self._requests_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Accept-Encoding': ACCEPT_ENCODING})
+                self._requests_session = session
+            return self._requests_session
+
+    def stats(self) -> Dict[str, int]:
+        stats: Dict[str, int] = dict(self._stats)
+        sync_requests, sync_connections = 0, 0
+        if self._requests_session is not None:
+            for adapter in set(self._requests_session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        sync_requests += pool.num_requests
+                        sync_connections += pool.num_connections
+        stats['sync_requests'] = sync_requests
+        stats['sync_connections_created'] = sync_connections
+        stats['sync_connections_reused'] = max(sync_requests - sync_connections, 0)
+        return stats
+
+
+http_pool = HttpPool(pool_size=int(os.environ.get('HTTP_POOL_SIZE', 20)))
+
+
+def run(coro):
+    """
+    asyncio.run, после которого закрывается aiohttp сессия пула этого event loop
+    """
+    async def main():
+        try:
+            return await coro
+        finally:
+            await http_pool.close()
+    return asyncio.run(main())
@@ -0,0 +1,273 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime as dt
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from src.utils.path import get_project_root
+
+
+# верхние границы корзин гистограммы времени ответа, секунд
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# счетчики EndpointMetrics, которые пишутся в Prometheus как <имя>_total: (имя метрики, описание)
+COUNTERS: Dict[str, Tuple[str, str]] = {
+    'bytes': ('rudata_response_bytes', 'Response body bytes received'),
+    'rows': ('rudata_rows', 'Rows received from responses'),
+    'retries': ('rudata_retries', 'Failed attempts that were retried (429, 5xx, 401, network errors)'),
+    'timeouts': ('rudata_timeouts', 'Requests that timed out'),
+    'cache_hits': ('rudata_cache_hits', 'Responses served from the on-disk cache'),
+    'throttle_waits': ('rudata_throttle_waits', 'Requests that waited for the rate limiter'),
+    'throttle_seconds': ('rudata_throttle_wait_seconds', 'Seconds spent waiting for the rate limiter'),
+    'throttle_events': ('rudata_throttle_events', 'Responses (429, 5xx) that lowered the rate limit'),
+    'conversion_seconds': ('rudata_conversion_seconds', 'Seconds spent building and converting DataFrames'),
+    'insert_seconds': ('rudata_insert_seconds', 'Seconds spent in ClickHouse inserts'),
+    'load_seconds': ('rudata_load_seconds', 'Wall time of the method load'),
+}
+
+
+class EndpointMetrics:
+    """
+    Метрики одного метода RuData за запуск
+    """
+
+    def __init__(self):
+        self.requests: int = 0
+        # ответы по статусу, 'timeout' и 'error' - запрос завершился без ответа
+        self.statuses: Dict[str, int] = {}
+        # количество ответов по корзинам LATENCY_BUCKETS (не накопительно), последняя - больше 60 секунд
+        self.latency_buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_seconds: float = 0.0
+        self.bytes: int = 0
+        self.rows: int = 0
+        self.retries: int = 0
+        self.timeouts: int = 0
+        self.cache_hits: int = 0
+        self.throttle_waits: int = 0
+        self.throttle_seconds: float = 0.0
+        self.throttle_events: int = 0
+        # текущий rate лимитера метода (с учетом общего), запросов в секунду. None - ответов еще не было
+        self.rate_rps: Optional[float] = None
+        self.conversion_seconds: float = 0.0
+        self.insert_seconds: float = 0.0
+        self.load_seconds: float = 0.0
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        """
+        Оценка квантиля времени ответа - верхняя граница корзины, в которую он попадает
+        """
+        if not self.requests:
+            return None
+        rank: float = q * self.requests
+        seen: int = 0
+        for bound, count in zip((*LATENCY_BUCKETS, float('inf')), self.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'statuses': dict(sorted(self.statuses.items())),
+            'latency_seconds': round(self.latency_seconds, 3),
+            'latency_mean': round(self.latency_seconds / self.requests, 4) if self.requests else None,
+            'latency_p50': self.latency_quantile(0.5),
+            'latency_p95': self.latency_quantile(0.95),
+            'latency_buckets': dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'], self.latency_buckets)),
+            **{field: round(getattr(self, field), 3) for field in COUNTERS},
+            'rate_rps': round(self.rate_rps, 3) if self.rate_rps is not None else None,
+        }
+
+
+class RunMetrics:
+    """
+    Метрики загрузки RuData по методам: запросы, гистограмма времени ответа, байты, строки, повторы,
+    таймауты, ожидание лимитера, время конвертации и insert в ClickHouse.
+    В конце запуска write() пишет JSON отчет logs/rudata_metrics_<время>_<pid>.json и textfile
+    для Prometheus node_exporter <RUDATA_METRICS_TEXTFILE_DIR или logs>/<name>.prom.
+
+    metrics.request('EndOfDay', 200, 0.35, response_bytes=1024)
+    with metrics.timer('EndOfDay', 'insert_seconds'):
+        client.insert_df(...)
+    metrics.write(labels={'month': '2024-09'})
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+        self.started: float = time.time()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.endpoints = {}
+            self.started = time.time()
+
+    def _endpoint(self, endpoint: str) -> EndpointMetrics:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointMetrics()
+        return self.endpoints[endpoint]
+
+    def request(
+            self,
+            endpoint: str,
+            status: Union[int, str],
+            latency: float,
+            response_bytes: int = 0,
+    ) -> None:
+        with self._lock:
+            endpoint_metrics: EndpointMetrics = self._endpoint(endpoint)
+            endpoint_metrics.requests += 1
+            endpoint_metrics.statuses[str(status)] = endpoint_metrics.statuses.get(str(status), 0) + 1
+            endpoint_metrics.latency_buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            endpoint_metrics.latency_seconds += latency
+            endpoint_metrics.bytes += response_bytes
+            if status == 'timeout':
+                endpoint_metrics.timeouts += 1
+
+    def add(self, endpoint: Optional[str], field: str, value: float = 1) -> None:
+        if endpoint is None:
+            return
+        with self._lock:
+            endpoint_metrics: EndpointMetrics = self._endpoint(endpoint)
+            setattr(endpoint_metrics, field, getattr(endpoint_metrics, field) + value)
+
+    def throttled(self, endpoint: str, seconds: float) -> None:
+        """
+        Ожидание лимитера перед запросом. Меньше миллисекунды - запрос прошел без ожидания
+        """
+        if seconds >= 0.001:
+            with self._lock:
+                endpoint_metrics: EndpointMetrics = self._endpoint(endpoint)
+                endpoint_metrics.throttle_waits += 1
+                endpoint_metrics.throttle_seconds += seconds
+
+    def rate_limit(self, endpoint: str, rate: float, throttled: bool = False) -> None:
+        """
+        Rate лимитера после ответа, throttled - ответ снизил rate
+        """
+        with self._lock:
+            endpoint_metrics: EndpointMetrics = self._endpoint(endpoint)
+            endpoint_metrics.rate_rps = rate
+            if throttled:
+                endpoint_metrics.throttle_events += 1
+
+    @contextmanager
+    def timer(self, endpoint: Optional[str], field: str):
+        """
+        Время блока прибавляется к полю field метода endpoint, endpoint=None - не измеряется
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(endpoint, field, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        """
+        Отчет запуска: методы по убыванию времени загрузки (или суммарного времени ответов)
+        """
+        with self._lock:
+            endpoints = sorted(
+                self.endpoints.items(),
+                key=lambda item: (item[1].load_seconds, item[1].latency_seconds),
+                reverse=True,
+            )
+            return {
+                'started': dt.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'duration_seconds': round(time.time() - self.started, 3),
+                'pid': os.getpid(),
+                'endpoints': {name: endpoint_metrics.as_dict() for name, endpoint_metrics in endpoints},
+            }
+
+    def prometheus(self, labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        Метрики в текстовом формате Prometheus, labels добавляются ко всем рядам
+        """
+        def series(name: str, endpoint: str, value: float, **extra: str) -> str:
+            return f"{name}{_label_set({**(labels or {}), 'endpoint': endpoint, **extra})} {value:g}"
+
+        lines: List[str] = []
+        with self._lock:
+            endpoints: List[Tuple[str, EndpointMetrics]] = sorted(self.endpoints.items())
+            lines += [
+                '# HELP rudata_requests_total HTTP requests to RuData by status',
+                '# TYPE rudata_requests_total counter',
+            ]
+            lines += [
+                series('rudata_requests_total', name, count, status=status)
+                for name, endpoint_metrics in endpoints
+                for status, count in sorted(endpoint_metrics.statuses.items())
+            ]
+            lines += [
+                '# HELP rudata_request_duration_seconds RuData response time',
+                '# TYPE rudata_request_duration_seconds histogram',
+            ]
+            for name, endpoint_metrics in endpoints:
+                cumulative: int = 0
+                for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], endpoint_metrics.latency_buckets):
+                    cumulative += count
+                    lines.append(series('rudata_request_duration_seconds_bucket', name, cumulative, le=bound))
+                lines.append(series('rudata_request_duration_seconds_sum', name, endpoint_metrics.latency_seconds))
+                lines.append(series('rudata_request_duration_seconds_count', name, endpoint_metrics.requests))
+            for field, (metric, description) in COUNTERS.items():
+                lines += [f'# HELP {metric}_total {description}', f'# TYPE {metric}_total counter']
+                lines += [
+                    series(f'{metric}_total', name, getattr(endpoint_metrics, field))
+                    for name, endpoint_metrics in endpoints
+                ]
+            lines += [
+                '# HELP rudata_rate_limit_rps Current adaptive rate limit of the endpoint, requests per second',
+                '# TYPE rudata_rate_limit_rps gauge',
+            ]
+            lines += [
+                series('rudata_rate_limit_rps', name, endpoint_metrics.rate_rps)
+                for name, endpoint_metrics in endpoints if endpoint_metrics.rate_rps is not None
+            ]
+        lines += [
+            '# HELP rudata_run_timestamp_seconds Start of the run',
+            '# TYPE rudata_run_timestamp_seconds gauge',
+            f'rudata_run_timestamp_seconds{_label_set(labels)} {self.started:.0f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write(
+            self,
+            labels: Optional[Dict[str, str]] = None,
+            name: str = 'rudata_metrics',
+            directory: Optional[Path] = None,
+    ) -> Tuple[Path, Path]:
+        """
+        JSON отчет и textfile Prometheus. Textfile заменяется атомарно, как требует node_exporter.
+        Возвращает пути к файлам
+        """
+        directory = Path(directory or os.environ.get('RUDATA_METRICS_DIR', Path.joinpath(get_project_root(), 'logs')))
+        textfile_directory: Path = Path(os.environ.get('RUDATA_METRICS_TEXTFILE_DIR', directory))
+        directory.mkdir(parents=True, exist_ok=True)
+        textfile_directory.mkdir(parents=True, exist_ok=True)
+        report: Path = Path.joinpath(directory, f'{name}_{dt.now().strftime("%Y%m%d%H%M%S")}_{os.getpid()}.json')
+        report.write_text(json.dumps({'labels': labels or {}, **self.summary()}, indent=2, ensure_ascii=False))
+        textfile: Path = Path.joinpath(textfile_directory, f'{name}.prom')
+        tmp: Path = textfile.with_name(f'{textfile.name}.{os.getpid()}.tmp')
+        tmp.write_text(self.prometheus(labels))
+        tmp.replace(textfile)
+        return report, textfile
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_set(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+
+# метрики процесса
+metrics = RunMetrics()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime as dt
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from src.utils.path import get_project_root
+
+
+def _modes(value: str) -> Set[str]:
+    if value in ('', '0'):
+        return set()
+    if value == '1':
+        return {'cpu', 'memory'}
+    return {mode.strip() for mode in value.split(',') if mode.strip()}
+
+
+# RUDATA_PROFILE=1 (или cpu / memory / cpu,memory) - профилирование этапов. Читается при импорте:
+# выключенный profiled возвращает функцию без обертки, stage - пустой контекст
+MODES: Set[str] = _modes(os.environ.get('RUDATA_PROFILE', ''))
+ENABLED: bool = bool(MODES)
+# файлы, кадры которых считаются ожиданием потоков пула (не попадают в профиль, если поток не этапа)
+IDLE_FILES: tuple = ('threading.py', 'queue.py', 'thread.py')
+
+
+class Stage:
+    """
+    Один запуск этапа: время, CPU процесса, стеки (свернутые, для flamegraph) и пик памяти tracemalloc
+    """
+
+    def __init__(self, name: str, number: int):
+        self.name = name
+        self.number = number
+        self.thread: int = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.wall: float = time.perf_counter()
+        self.cpu: float = time.process_time()
+        self.memory_start: int = 0
+        self.memory_peak: int = 0
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+class Profiler:
+    """
+    Профилирование именованных этапов: CPU - выборка стеков всех потоков каждые interval секунд
+    (поток этапа - всегда, остальные - если они не ждут задач), память - tracemalloc (пик и места аллокаций).
+    Для каждого запуска этапа в каталоге <RUDATA_PROFILE_DIR или logs/profiles>/<время>_<pid>:
+    <nn>_<этап>.folded - свернутые стеки (flamegraph.pl, speedscope, inferno),
+    <nn>_<этап>.memory.txt - пик памяти и строки с наибольшим ростом аллокаций,
+    stages.jsonl - время, CPU, количество выборок и пик памяти этапов.
+    Этапы могут быть вложенными (RuDataDF.df -> send_requests). Одновременные этапы в одном event loop
+    получают общие выборки.
+    """
+
+    def __init__(
+            self,
+            modes: Set[str],
+            directory: Optional[Path] = None,
+            interval: float = 0.005,
+    ):
+        self.modes = modes
+        self.interval = interval
+        self.directory: Path = Path(directory or Path.joinpath(
+            Path(os.environ.get('RUDATA_PROFILE_DIR', Path.joinpath(get_project_root(), 'logs/profiles'))),
+            f'{dt.now().strftime("%Y%m%d%H%M%S")}_{os.getpid()}',
+        ))
+        self._lock = threading.Lock()
+        self._active: List[Stage] = []
+        self._count: int = 0
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._tracing: bool = False
+
+    def start(self, name: str) -> Stage:
+        with self._lock:
+            self._count += 1
+            stage: Stage = Stage(name, self._count)
+            if 'memory' in self.modes:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._tracing = True
+                # reset_peak обнуляет пик и для внешних этапов, поэтому сначала он сохраняется в них
+                self._update_peaks()
+                tracemalloc.reset_peak()
+                stage.memory_start = tracemalloc.get_traced_memory()[0]
+                stage.snapshot = tracemalloc.take_snapshot()
+            self._active.append(stage)
+            if 'cpu' in self.modes and self._sampler is None:
+                self._stop.clear()
+                self._sampler = threading.Thread(target=self._sample, name='Profiler', daemon=True)
+                self._sampler.start()
+        return stage
+
+    def finish(self, stage: Stage) -> None:
+        wall: float = time.perf_counter() - stage.wall
+        cpu: float = time.process_time() - stage.cpu
+        snapshot: Optional[tracemalloc.Snapshot] = None
+        with self._lock:
+            if 'memory' in self.modes:
+                self._update_peaks()
+            self._active.remove(stage)
+            if 'memory' in self.modes:
+                snapshot = tracemalloc.take_snapshot()
+                if not self._active and self._tracing:
+                    tracemalloc.stop()
+                    self._tracing = False
+            sampler: Optional[threading.Thread] = self._sampler if not self._active else None
+            if sampler is not None:
+                self._sampler = None
+                self._stop.set()
+        if sampler is not None:
+            sampler.join()
+        self._write(stage, wall, cpu, snapshot)
+
+    def _update_peaks(self) -> None:
+        peak: int = tracemalloc.get_traced_memory()[1]
+        for stage in self._active:
+            stage.memory_peak = max(stage.memory_peak, peak)
+
+    def _sample(self) -> None:
+        own: int = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+            with self._lock:
+                threads: Set[int] = {stage.thread for stage in self._active}
+            stacks: List[str] = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in threads and os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stacks.append(';'.join([names.get(ident, str(ident)), *reversed(stack)]))
+            with self._lock:
+                for stage in self._active:
+                    stage.samples.update(stacks)
+
+    def _write(self, stage: Stage, wall: float, cpu: float, snapshot: Optional[tracemalloc.Snapshot]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        prefix: str = f'{stage.number:03d}_' + re.sub(r'[^\w.-]+', '_', stage.name)
+        summary: dict = {'stage': stage.name, 'number': stage.number, 'wall_seconds': round(wall, 3),
+                         'cpu_seconds': round(cpu, 3)}
+        if 'cpu' in self.modes:
+            with open(Path.joinpath(self.directory, f'{prefix}.folded'), 'w') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in stage.samples.most_common())
+            summary['samples'] = sum(stage.samples.values())
+        if snapshot is not None:
+            summary['memory_peak_bytes'] = stage.memory_peak
+            summary['memory_peak_increase_bytes'] = stage.memory_peak - stage.memory_start
+            top = snapshot.compare_to(stage.snapshot, 'lineno')[:25]
+            with open(Path.joinpath(self.directory, f'{prefix}.memory.txt'), 'w') as f:
+                f.write(f"{stage.name}: peak {stage.memory_peak / 2 ** 20:.1f} MB, "
+                        f"+{(stage.memory_peak - stage.memory_start) / 2 ** 20:.1f} MB from stage start\n")
+                f.writelines(f'{statistic}\n' for statistic in top)
+        with open(Path.joinpath(self.directory, 'stages.jsonl'), 'a') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+
+
+_profiler: Optional[Profiler] = None
+if ENABLED:
+    # RUDATA_PROFILE_INTERVAL - период выборки стеков, секунд
+    _profiler = Profiler(MODES, interval=float(os.environ.get('RUDATA_PROFILE_INTERVAL', 0.005)))
+
+
+def stage(name: str):
+    """
+    Контекст этапа отчета:
+
+    with stage('stocks: transforms'):
+        ...
+    """
+    if _profiler is None:
+        return nullcontext()
+    return _profile(name)
+
+
+@contextmanager
+def _profile(name: str):
+    current: Stage = _profiler.start(name)
+    try:
+        yield current
+    finally:
+        _profiler.finish(current)
+
+
+def profiled(name: Optional[str] = None):
+    """
+    Декоратор этапа для функций и корутин. Имя этапа - name или <self.name>.<функция>.
+    Без RUDATA_PROFILE функция возвращается без изменений
+
+    @profiled()
+    async def send_requests(self, session=None): ...
+    """
+    def decorator(func):
+        if _profiler is None:
+            return func
+
+        def stage_name(args) -> str:
+            if name is not None:
+                return name
+            owner = getattr(args[0], 'name', None) if args else None
+            return f'{owner}.{func.__name__}' if isinstance(owner, str) else func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _profile(stage_name(args)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            with _profile(stage_name(args)):
+                return func(*args, **kwargs)
+        return sync_wrapper
+    return decorator
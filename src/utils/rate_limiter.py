@@ -0,0 +1,164 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+class RateLimiter:
+    """
+    Token bucket на rate запросов в секунду плюс не более max_in_flight одновременных запросов.
+    Скорость адаптивная: на 429/5xx rate уменьшается в decrease раз (не ниже min_rate),
+    на каждый успешный ответ растет на increase * max_rate, пока не вернется к max_rate.
+    parent - общий лимитер процесса, через который дополнительно проходит каждый запрос.
+
+    async with limiter:
+        response = await session.post(...)
+        limiter.feedback(response.status)
+    """
+
+    def __init__(
+            self,
+            name: str,
+            rate: float,
+            max_in_flight: int,
+            min_rate: float = 0.2,
+            increase: float = 0.02,
+            decrease: float = 0.5,
+            parent: Optional[RateLimiter] = None,
+    ):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.max_in_flight = max_in_flight
+        self.increase = increase
+        self.decrease = decrease
+        self.parent = parent
+        self._rate: float = rate
+        self._tokens: float = 1.0
+        self._stamp: float = time.monotonic()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.throttled: int = 0
+        self.waits: int = 0
+        self.waited: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def effective_rate(self) -> float:
+        """Скорость с учетом родительских лимитеров"""
+        return min(self._rate, self.parent.effective_rate) if self.parent is not None else self._rate
+
+    def _reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(1.0, self._tokens + (now - self._stamp) * self._rate)
+            self._stamp = now
+            self._tokens -= 1
+            delay = 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+            if delay:
+                self.waits += 1
+                self.waited += delay
+            return delay
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # asyncio примитивы привязаны к event loop, а notebooks вызывают asyncio.run на каждый метод
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._slots
+
+    async def __aenter__(self) -> RateLimiter:
+        if self.parent is not None:
+            await self.parent.__aenter__()
+        slots = self._semaphore()
+        try:
+            await slots.acquire()
+        except BaseException:
+            if self.parent is not None:
+                await self.parent.__aexit__(None, None, None)
+            raise
+        try:
+            delay = self._reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        except BaseException:
+            await self.__aexit__(None, None, None)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._slots.release()
+        if self.parent is not None:
+            await self.parent.__aexit__(exc_type, exc, tb)
+
+    def wait(self) -> None:
+        """Синхронный вариант для кода на requests"""
+        if self.parent is not None:
+            self.parent.wait()
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    def feedback(self, status: int, retry_after: Optional[float] = None) -> bool:
+        """Подстройка rate по статусу ответа. Возвращает True, если ответ снизил rate (429/5xx)"""
+        if self.parent is not None:
+            self.parent.feedback(status, retry_after)
+        with self._lock:
+            if status == 429 or status >= 500:
+                self.throttled += 1
+                self._rate = max(self.min_rate, self._rate * self.decrease)
+                # сервер попросил паузу - сдвигаем появление следующего токена
+                self._tokens = min(self._tokens, -(retry_after or 0) * self._rate)
+                return True
+            if status < 400:
+                self._rate = min(self.max_rate, self._rate + self.increase * self.max_rate)
+            return False
+
+    def rates(self) -> Dict[str, float]:
+        rates = self.parent.rates() if self.parent is not None else {}
+        rates[self.name] = round(self._rate, 3)
+        return rates
+
+    def __repr__(self) -> str:
+        return f"RateLimiter({self.name}, rate={self._rate:.2f}/s, max_in_flight={self.max_in_flight})"
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint: Optional[str] = None, rate: Optional[float] = None) -> RateLimiter:
+    """
+    Общий лимитер процесса (RUDATA_RPS запросов в секунду, RUDATA_MAX_IN_FLIGHT одновременных).
+    Для endpoint с собственным ограничением (аргумент rate или RUDATA_RPS_<ENDPOINT>)
+    создается дочерний лимитер, который проходит и через общий.
+    """
+    with _limiters_lock:
+        if 'default' not in _limiters:
+            _limiters['default'] = RateLimiter(
+                'default',
+                rate=float(os.environ.get('RUDATA_RPS', 5)),
+                max_in_flight=int(os.environ.get('RUDATA_MAX_IN_FLIGHT', 5)),
+            )
+        default = _limiters['default']
+        if endpoint is None:
+            return default
+        rate = float(os.environ.get(f'RUDATA_RPS_{endpoint.upper()}', rate or 0))
+        if not rate:
+            return default
+        if endpoint not in _limiters:
+            _limiters[endpoint] = RateLimiter(
+                endpoint,
+                rate=rate,
+                max_in_flight=default.max_in_flight,
+                parent=default,
+            )
+        return _limiters[endpoint]
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+from src.utils.path import get_project_root
+
+
+Payload = Union[dict, list, str, bytes, None]
+
+
+def cache_key(url: str, payload: Payload = None) -> str:
+    """
+    Ключ ответа: sha256 от URL и канонического payload (JSON с сортировкой ключей, строка или байты как есть)
+    """
+    if isinstance(payload, bytes):
+        canonical: bytes = payload
+    elif isinstance(payload, str):
+        canonical = payload.encode('utf-8')
+    else:
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    return hashlib.sha256(url.encode('utf-8') + b'\n' + canonical).hexdigest()
+
+
+class ResponseCache:
+    """
+    Кэш ответов HTTP на диске: файл <directory>/<ключ[:2]>/<ключ> - строка заголовка (url, время записи)
+    и сжатое zlib тело. Ответ старше ttl не возвращается. Время изменения файла обновляется при каждом
+    чтении, и при превышении max_bytes удаляются файлы, которые дольше всего не читались (LRU).
+
+    cache = get_response_cache()  # None, если кэш выключен (RUDATA_HTTP_CACHE)
+    body = cache.get(url, payload, ttl=86400)
+    if body is None:
+        body = ...
+        cache.put(url, payload, body)
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 512 * 2 ** 20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _path(self, key: str) -> Path:
+        return Path.joinpath(self.directory, key[:2], key)
+
+    def get(self, url: str, payload: Payload = None, ttl: Optional[float] = None) -> Optional[bytes]:
+        path: Path = self._path(cache_key(url, payload))
+        try:
+            with open(path, 'rb') as f:
+                header: dict = json.loads(f.readline())
+                if ttl is not None and time.time() - header['created'] > ttl:
+                    self.misses += 1
+                    return None
+                body: bytes = zlib.decompress(f.read())
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zlib.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    def put(self, url: str, payload: Payload, body: bytes) -> None:
+        path: Path = self._path(cache_key(url, payload))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data: bytes = json.dumps({'url': url, 'created': time.time()}).encode('utf-8') + b'\n' + zlib.compress(body, 6)
+        tmp: Path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(data)
+        tmp.replace(path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        return (path for path in self.directory.glob('??/*') if not path.name.endswith('.tmp'))
+
+    def _scan_size(self) -> int:
+        return sum(path.stat().st_size for path in self._files())
+
+    def _evict(self) -> None:
+        """
+        Удаление давно не читавшихся файлов, пока кэш не станет меньше 80% max_bytes
+        """
+        files = sorted(((path.stat().st_mtime, path.stat().st_size, path) for path in self._files()))
+        size: int = sum(file[1] for file in files)
+        for _, file_size, path in files:
+            if size <= 0.8 * self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= file_size
+        self._size = size
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self._files():
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+    def __repr__(self) -> str:
+        return f"ResponseCache({self.directory}, hits={self.hits}, misses={self.misses})"
+
+
+def cache_ttl(endpoint: str, default: Optional[float]) -> Optional[float]:
+    """
+    Время жизни ответов endpoint в секундах: RUDATA_CACHE_TTL_<ENDPOINT> или default. None или 0 - не кэшировать
+    """
+    value: Optional[str] = os.environ.get(f'RUDATA_CACHE_TTL_{endpoint.upper()}')
+    ttl: Optional[float] = float(value) if value else default
+    return ttl or None
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Кэш процесса, если он включен: RUDATA_HTTP_CACHE=1 (data/Cache/http) или путь к каталогу.
+    Размер - RUDATA_HTTP_CACHE_MB мегабайт, по умолчанию 512
+    """
+    setting: str = os.environ.get('RUDATA_HTTP_CACHE', '')
+    if setting in ('', '0'):
+        return None
+    directory: Path = Path.joinpath(get_project_root(), 'data/Cache/http') if setting == '1' else Path(setting)
+    return ResponseCache(directory, max_bytes=int(float(os.environ.get('RUDATA_HTTP_CACHE_MB', 512)) * 2 ** 20))
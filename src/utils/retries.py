@@ -1,15 +1,50 @@
+import random
 import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from functools import wraps
 from logging import Logger
 from typing import Callable, Optional, Union, Tuple, Type
 import asyncio
 
 
+class RetryableError(Exception):
+    """
+    Ошибка, после которой запрос можно повторить (429, 5xx).
+    retry_after - пауза в секундах, которую запросил сервер,
+    backoff=False - повторить сразу, без паузы: причина уже устранена (например, обновлен токен после 401)
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, backoff: bool = True):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.backoff = backoff
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    Значение заголовка Retry-After (секунды или HTTP дата) в секундах
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
 def retry(
         exceptions: Union[Type[Exception], Tuple[Type[Exception], ...]] = Exception,
         tries: int = 3,
         delay: float = 1,
         logger=None,
+        backoff: float = 1,
+        max_delay: Optional[float] = None,
+        jitter: bool = False,
 ):
     """
     Decorator to retry a function with specified parameters.
@@ -19,8 +54,25 @@ def retry(
         tries: Maximum number of attempts
         delay: Initial delay between attempts in seconds
         logger: Optional logs to log retry attempts (e.g., logging.warning)
+        backoff: Multiplier applied to the delay after each attempt
+        max_delay: Upper bound for the delay
+        jitter: Randomize each delay within [delay/2, delay] so parallel callers do not retry in lockstep
+    If the exception has a retry_after attribute (see RetryableError), the delay is at least retry_after.
+    If it has backoff=False, the next attempt starts at once and the delay does not grow.
     """
 
+    def next_delay(current_delay: float, e: Exception) -> float:
+        if not getattr(e, 'backoff', True):
+            return 0.0
+        wait = random.uniform(current_delay / 2, current_delay) if jitter else current_delay
+        return max(wait, getattr(e, 'retry_after', None) or 0)
+
+    def increase(current_delay: float, e: Exception) -> float:
+        if not getattr(e, 'backoff', True):
+            return current_delay
+        current_delay *= backoff
+        return min(current_delay, max_delay) if max_delay is not None else current_delay
+
     def decorator(func):
         if asyncio.iscoroutinefunction(func):
             @wraps(func)
@@ -32,12 +84,15 @@ def retry(
                         return res
                     except exceptions as e:
                         if attempt == remaining_tries:
-                            logger.info(f'attempt {attempt}, {remaining_tries}')
+                            if logger:
+                                logger.info(f'attempt {attempt}, {remaining_tries}')
                             raise
+                        wait = next_delay(current_delay, e)
                         if logger:
-                            logger.exception(f"Retrying {func.__name__} after {current_delay}s due to {type(e).__name__}: "
+                            logger.exception(f"Retrying {func.__name__} after {wait:.1f}s due to {type(e).__name__}: "
                                              f"{e} (attempt {attempt} of {tries})")
-                        await asyncio.sleep(current_delay)
+                        await asyncio.sleep(wait)
+                        current_delay = increase(current_delay, e)
                 return None
             return async_wrapper
         else:
@@ -52,10 +107,12 @@ def retry(
                     except exceptions as e:
                         if attempt == remaining_tries:
                             raise
+                        wait = next_delay(current_delay, e)
                         if logger:
-                            logger.exception(f"Retrying {func.__name__} after {current_delay}s due to {type(e).__name__}: "
+                            logger.exception(f"Retrying {func.__name__} after {wait:.1f}s due to {type(e).__name__}: "
                                              f"{e} (attempt {attempt} of {tries})")
-                        time.sleep(current_delay)
+                        time.sleep(wait)
+                        current_delay = increase(current_delay, e)
                 return None
             return sync_wrapper
     return decorator
\ No newline at end of file
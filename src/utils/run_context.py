@@ -0,0 +1,76 @@
+from __future__ import annotations
+from datetime import date, timedelta
+from typing import List, Optional
+import pandas as pd
+
+from src.utils import get_date
+
+
+class RunContext:
+    """
+    Отчетный месяц загрузки и производные даты. Передается в методы RuData вместо констант get_date,
+    поэтому в одном процессе (или в параллельных процессах backfill) можно загружать разные месяцы:
+
+    context = RunContext.for_month('2024-09')
+    RuDataScheduler([FintoolReferenceData, EndOfDay], context=context).run()
+    context.last_day_month_str  # '2024-09-30'
+    """
+
+    def __init__(self, first_day_month: Optional[date] = None):
+        # первый день месяца, следующего за отчетным (как get_date.first_day_month)
+        self.first_day_month: date = first_day_month or get_date.first_day_month
+
+    @classmethod
+    def for_month(cls, month: str) -> RunContext:
+        """
+        Контекст отчетного месяца 'YYYY-MM'
+        """
+        return cls(get_date.month_start(month))
+
+    @classmethod
+    def months(cls, start: str, end: str) -> List[RunContext]:
+        """
+        Контексты отчетных месяцев от start до end включительно, 'YYYY-MM'
+        """
+        return [cls.for_month(month.strftime('%Y-%m')) for month in pd.period_range(start, end, freq='M')]
+
+    @property
+    def first_day_month_str(self) -> str:
+        return self.first_day_month.strftime('%Y-%m-%d')
+
+    @property
+    def last_day_month(self) -> date:
+        return self.first_day_month - timedelta(days=1)
+
+    @property
+    def last_day_month_str(self) -> str:
+        return self.last_day_month.strftime('%Y-%m-%d')
+
+    @property
+    def last_work_date_month(self) -> date:
+        return get_date.last_work_date(self.last_day_month)
+
+    @property
+    def last_work_date_month_str(self) -> str:
+        return self.last_work_date_month.strftime('%Y-%m-%d')
+
+    @property
+    def report_date(self) -> pd.Timestamp:
+        return pd.to_datetime(self.last_day_month)
+
+    @property
+    def report_yearmonth(self) -> str:
+        return self.last_day_month.strftime('%Y%m')
+
+    @property
+    def month(self) -> str:
+        return self.last_day_month.strftime('%Y-%m')
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, RunContext) and self.first_day_month == other.first_day_month
+
+    def __hash__(self) -> int:
+        return hash(self.first_day_month)
+
+    def __repr__(self) -> str:
+        return f"RunContext({self.month})"
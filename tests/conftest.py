@@ -0,0 +1,128 @@
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+import pytest
+from aiohttp import web
+
+from benchmarks.fake_rudata import FakeRuData
+from tests.fake_clickhouse import FakeClickHouse
+
+
+_state = tempfile.TemporaryDirectory()
+_server: FakeRuData = FakeRuData(latency=0, jitter=0)
+
+
+def pytest_configure(config):
+    # адрес API, кэш токена и лимитер читаются при импорте src, поэтому задаются до сбора тестов
+    _server.start()
+    os.environ.update({
+        'RUDATA_BASE_URL': _server.base_url,
+        'RUDATA_TOKEN_CACHE': str(Path(_state.name, 'token.json')),
+        'RUDATA_RPS': '1000',
+        'RUDATA_MAX_IN_FLIGHT': '5',
+        'RUDATA_PROFILE': '',
+        'LOGIN': 'test',
+        'PASSWORD': 'test',
+    })
+
+
+def pytest_unconfigure(config):
+    _server.stop()
+    _state.cleanup()
+
+
+@pytest.fixture
+def server() -> FakeRuData:
+    _server.reset()
+    return _server
+
+
+@pytest.fixture(autouse=True)
+def environment(tmp_path, monkeypatch):
+    """
+    Журнал, состояние batcher, кэш и отчеты - во временном каталоге теста, инкрементальные режимы выключены
+    """
+    from src.utils import adaptive_batch
+    from src.sources.rudata.RuDataManifest import LoadManifest
+
+    monkeypatch.setenv('RUDATA_CHECKPOINT', 'file')
+    monkeypatch.setenv('RUDATA_CHECKPOINT_DIR', str(tmp_path / 'checkpoints'))
+    monkeypatch.setenv('RUDATA_BATCH_STATE', str(tmp_path / 'batch_sizes.json'))
+    monkeypatch.setenv('RUDATA_HTTP_CACHE', '0')
+    monkeypatch.setenv('RUDATA_INCREMENTAL', '0')
+    monkeypatch.setenv('RUDATA_DELTA', '0')
+    monkeypatch.setenv('RUDATA_METRICS_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(adaptive_batch, '_batchers', {})
+    monkeypatch.setattr(LoadManifest, '_created', False)
+
+
+@pytest.fixture
+def clickhouse() -> FakeClickHouse:
+    return FakeClickHouse()
+
+
+@pytest.fixture
+def authorized(server):
+    from src.sources.rudata.RuDataDF import RuDataDF
+    from src.sources.rudata.RuDataToken import token_manager
+
+    RuDataDF.set_headers({'Authorization': 'Bearer ' + token_manager.token()})
+
+
+@asynccontextmanager
+async def local_server(handler):
+    """
+    Сервер с одним обработчиком POST /{endpoint} в текущем event loop, возвращает адрес
+    """
+    app = web.Application()
+    app.router.add_post('/{endpoint:.+}', handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    try:
+        yield f'http://127.0.0.1:{runner.addresses[0][1]}'
+    finally:
+        await runner.cleanup()
+
+
+def paged_server(
+        rows: Union[List[dict], Callable[[dict], List[dict]]],
+        failing_page: Optional[int] = None,
+        status: int = 400,
+) -> Tuple[Callable, List[dict]]:
+    """
+    Обработчик постраничного метода для local_server: страница pageNum размера pageSize из rows
+    (список или функция payload -> строки), на failing_page - ответ с ошибкой status.
+    Возвращает (handler, requested), requested - полученные payloads
+    """
+    requested: List[dict] = []
+
+    async def handler(request: web.Request) -> web.Response:
+        payload: dict = await request.json()
+        requested.append(payload)
+        if payload['pageNum'] == failing_page:
+            return web.json_response({'message': 'bad request'}, status=status)
+        data: List[dict] = rows(payload) if callable(rows) else rows
+        start: int = (payload['pageNum'] - 1) * payload['pageSize']
+        return web.json_response(data[start:start + payload['pageSize']])
+    return handler, requested
+
+
+def serve(method, handler, action: str = 'load', client=None, **kwargs):
+    """
+    method.<action>(**kwargs) (load или send_requests) с запросами к local_server(handler)
+    и client вместо ClickHouse
+    """
+    from src.utils.http_session import run
+
+    async def scenario():
+        async with local_server(handler) as url:
+            method.url = f'{url}/{method.name}'
+            if client is not None:
+                method.client = client
+            return await getattr(method, action)(**kwargs)
+    return run(scenario())
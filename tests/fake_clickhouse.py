@@ -0,0 +1,248 @@
+from __future__ import annotations
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+class Result:
+    def __init__(self, rows: List[tuple]):
+        self.result_rows = rows
+
+    @property
+    def first_row(self) -> tuple:
+        return self.result_rows[0]
+
+
+class Table:
+    def __init__(
+            self,
+            types: Dict[str, str],
+            engine: str = 'MergeTree',
+            partition_column: Optional[str] = None,
+            order_by: Tuple[str, ...] = (),
+    ):
+        self.types = dict(types)
+        self.engine = engine
+        self.partition_column = partition_column
+        self.order_by = order_by
+        self.df: pd.DataFrame = pd.DataFrame(columns=list(types))
+
+    def copy_structure(self) -> Table:
+        return Table(self.types, self.engine, self.partition_column, self.order_by)
+
+    def partition_ids(self, df: Optional[pd.DataFrame] = None) -> pd.Series:
+        df = self.df if df is None else df
+        if self.partition_column is None:
+            return pd.Series('all', index=df.index)
+        return pd.to_datetime(df[self.partition_column]).dt.strftime('%Y%m')
+
+    def partition(self, partition_id: str) -> pd.DataFrame:
+        return self.df[self.partition_ids() == partition_id]
+
+    def drop_partition(self, partition_id: str) -> None:
+        self.df = self.df[self.partition_ids() != partition_id]
+
+    def append(self, df: pd.DataFrame) -> None:
+        self.df = df.copy() if self.df.empty else pd.concat([self.df, df], ignore_index=True)
+        self.df = self.df.reset_index(drop=True)
+
+    def final(self) -> pd.DataFrame:
+        if self.engine != 'ReplacingMergeTree' or not self.order_by:
+            return self.df
+        return self.df.drop_duplicates(list(self.order_by), keep='last')
+
+
+def _split(columns: str) -> List[str]:
+    """
+    Определения колонок CREATE TABLE через запятую без учета запятых в скобках типов
+    """
+    parts: List[str] = []
+    depth, start = 0, 0
+    for i, char in enumerate(columns):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(columns[start:i].strip())
+            start = i + 1
+    parts.append(columns[start:].strip())
+    return [part for part in parts if part]
+
+
+def _name(value: str) -> str:
+    return value.strip().strip('"`')
+
+
+class FakeClickHouse:
+    """
+    ClickHouse в памяти для тестов: подмножество SQL, которое выполняют RuDataDF, RuDataHistory, RuDataDelta,
+    LoadManifest и ClickHouseSink. Партиции - месяц колонки из PARTITION BY toYYYYMM(...), FINAL
+    в ReplacingMergeTree оставляет последнюю вставленную строку по ORDER BY. Неизвестный запрос - NotImplementedError.
+    commands - все выполненные запросы, в том числе REPLACE/ATTACH PARTITION
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, Table] = {}
+        self.commands: List[str] = []
+        self._lock = threading.RLock()
+
+    def table(self, name: str) -> pd.DataFrame:
+        return self.tables[name].df
+
+    def add_table(self, name: str, df: pd.DataFrame, partition_column: Optional[str] = 'report_date') -> None:
+        """
+        Таблица с данными, например таблица метода, из которой строятся payloads
+        """
+        table: Table = Table({column: 'String' for column in df.columns}, partition_column=partition_column)
+        table.append(df)
+        self.tables[name] = table
+
+    def command(self, sql: str, parameters: Optional[dict] = None, settings: Optional[dict] = None):
+        sql = ' '.join(sql.split())
+        parameters = parameters or {}
+        with self._lock:
+            self.commands.append(sql)
+            match = re.fullmatch(r'EXISTS TABLE "?(\w+)"?', sql)
+            if match:
+                return int(match.group(1) in self.tables)
+            match = re.fullmatch(r'CREATE TABLE IF NOT EXISTS "?(\w+)"? AS "?(\w+)"?', sql)
+            if match:
+                if match.group(1) not in self.tables:
+                    self.tables[match.group(1)] = self.tables[match.group(2)].copy_structure()
+                return None
+            match = re.match(r'CREATE TABLE IF NOT EXISTS "?(\w+)"? \((.*)\) ENGINE = (\w+)', sql)
+            if match:
+                return self._create(sql, match.group(1), match.group(2), match.group(3))
+            if sql.startswith('CREATE VIEW'):
+                return None
+            match = re.fullmatch(r'ALTER TABLE "?(\w+)"? DROP PARTITION ID \'(\w+)\'', sql)
+            if match:
+                self.tables[match.group(1)].drop_partition(match.group(2))
+                return None
+            match = re.fullmatch(r'ALTER TABLE "?(\w+)"? (REPLACE|ATTACH) PARTITION ID \'(\w+)\' FROM "?(\w+)"?', sql)
+            if match:
+                target, source = self.tables[match.group(1)], self.tables[match.group(4)]
+                if match.group(2) == 'REPLACE':
+                    target.drop_partition(match.group(3))
+                target.append(source.partition(match.group(3)))
+                return None
+            match = re.fullmatch(r'ALTER TABLE "?(\w+)"? ADD COLUMN IF NOT EXISTS `?(\w+)`? (\S+)(?: DEFAULT .*)?', sql)
+            if match:
+                table: Table = self.tables[match.group(1)]
+                if match.group(2) not in table.types:
+                    table.types[match.group(2)] = match.group(3)
+                    table.df[match.group(2)] = ''
+                return None
+            match = re.fullmatch(r'TRUNCATE TABLE (?:IF EXISTS )?"?(\w+)"?', sql)
+            if match:
+                if match.group(1) in self.tables:
+                    self.tables[match.group(1)].df = self.tables[match.group(1)].df.iloc[0:0]
+                return None
+            match = re.fullmatch(r'SELECT max\(`?(\w+)`?\) FROM "?(\w+)"?(?: WHERE .*)?', sql)
+            if match:
+                values = self.tables[match.group(2)].df[match.group(1)].dropna()
+                return values.max() if not values.empty else pd.Timestamp('1970-01-01')
+            match = re.fullmatch(r'SELECT count\(\) FROM "?(\w+)"? WHERE _partition_id = \'(\w+)\'', sql)
+            if match:
+                return len(self.tables[match.group(1)].partition(match.group(2)))
+            if re.fullmatch(r'SELECT sum\(rows\) FROM system\.parts WHERE .*', sql):
+                table = self.tables.get(parameters['table'])
+                return len(table.partition(parameters['partition'])) if table is not None else 0
+        raise NotImplementedError(sql)
+
+    def _create(self, sql: str, name: str, columns: str, engine: str) -> None:
+        if name in self.tables:
+            return None
+        types: Dict[str, str] = {}
+        for column in _split(columns):
+            match = re.fullmatch(r'`?(\w+)`? (.+?)(?: (?:CODEC|DEFAULT)\b.*)?', column)
+            types[match.group(1)] = match.group(2)
+        partition = re.search(r'PARTITION BY toYYYYMM\(`?(\w+)`?\)', sql)
+        order_by = re.search(r'ORDER BY \(([^)]*)\)', sql)
+        self.tables[name] = Table(
+            types,
+            engine=engine,
+            partition_column=partition.group(1) if partition else None,
+            order_by=tuple(_name(column) for column in order_by.group(1).split(',')) if order_by else (),
+        )
+        return None
+
+    def query(self, sql: str, parameters: Optional[dict] = None) -> Result:
+        sql = ' '.join(sql.split())
+        parameters = parameters or {}
+        with self._lock:
+            self.commands.append(sql)
+            match = re.fullmatch(r'DESCRIBE TABLE "?(\w+)"?', sql)
+            if match:
+                return Result(list(self.tables[match.group(1)].types.items()))
+            match = re.fullmatch(r'SELECT argMax\((\w+), completed_at\) FROM (\w+) WHERE (.*) GROUP BY .*', sql)
+            if match:
+                df: pd.DataFrame = self._where(self.tables[match.group(2)].df, match.group(3), parameters)
+                return Result([(df[match.group(1)].iloc[-1],)] if not df.empty else [])
+            match = re.fullmatch(r'SELECT DISTINCT partition_id FROM system\.parts WHERE .*', sql)
+            if match:
+                table: Optional[Table] = self.tables.get(parameters['table'])
+                ids: List[str] = sorted(table.partition_ids().unique()) if table is not None else []
+                return Result([(partition_id,) for partition_id in ids])
+        raise NotImplementedError(sql)
+
+    def query_df(self, sql: str, parameters: Optional[dict] = None) -> pd.DataFrame:
+        sql = ' '.join(sql.split())
+        parameters = parameters or {}
+        with self._lock:
+            self.commands.append(sql)
+            match = re.fullmatch(
+                r'SELECT (DISTINCT )?(.+?) FROM "?(\w+)"?( FINAL)? WHERE (.+?)'
+                r'(?: ORDER BY `?(\w+)`? DESC LIMIT 1 BY (.+))?',
+                sql,
+            )
+            if match is None:
+                raise NotImplementedError(sql)
+            table: Table = self.tables[match.group(3)]
+            df: pd.DataFrame = table.final() if match.group(4) else table.df
+            df = self._where(df, match.group(5), parameters, table)
+            if match.group(6):
+                df = df.sort_values(match.group(6), ascending=False, kind='stable')
+                df = df.drop_duplicates([_name(column) for column in match.group(7).split(',')])
+            if match.group(2) != '*':
+                df = df[[_name(column) for column in match.group(2).split(',')]]
+            if match.group(1):
+                df = df.drop_duplicates()
+            return df.reset_index(drop=True)
+
+    def _where(self, df: pd.DataFrame, where: str, parameters: dict, table: Optional[Table] = None) -> pd.DataFrame:
+        for condition in re.split(r' AND ', where):
+            match = re.fullmatch(r'_partition_id = \'(\w+)\'', condition)
+            if match:
+                df = df[table.partition_ids(df) == match.group(1)]
+                continue
+            match = re.fullmatch(r'[`"]?(\w+)[`"]? (=|<=|IN) %\((\w+)\)s', condition)
+            if match is None:
+                raise NotImplementedError(condition)
+            column, operator, value = match.group(1), match.group(2), parameters[match.group(3)]
+            if operator == 'IN':
+                df = df[df[column].isin(value)]
+            elif operator == '<=':
+                df = df[pd.to_datetime(df[column]) <= pd.Timestamp(value)]
+            else:
+                df = df[df[column] == value]
+        return df
+
+    def insert_df(self, table: str, df: pd.DataFrame, settings: Optional[dict] = None) -> None:
+        with self._lock:
+            self.tables[table].append(df)
+
+    def insert(self, table: str, data: List[list], column_names: List[str], settings: Optional[dict] = None) -> None:
+        with self._lock:
+            target: Table = self.tables[table]
+            df: pd.DataFrame = pd.DataFrame(data, columns=column_names)
+            for column in target.types:
+                if column not in df.columns:
+                    df[column] = ''
+            target.append(df[list(target.types)])
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,72 @@
+from aiohttp import web
+
+from src.utils.adaptive_batch import AdaptiveBatcher
+from src.utils.http_session import run
+from src.sources.rudata.RuDataDF import RuDataDF
+from tests.conftest import local_server
+
+
+def test_grows_on_fast_full_batches_and_stays_below_a_failed_size():
+    batcher = AdaptiveBatcher('Test', initial=100)
+    batcher.observe(100, latency=1.0)
+    assert batcher.size == 150
+    batcher.observe(150, latency=1.0, failed=True)
+    assert batcher.size == 75
+    for _ in range(10):
+        batcher.observe(batcher.size, latency=1.0)
+    # граница - 0.9 размера не выполненной пачки, поднимается на 1% после каждой полной пачки
+    assert 135 <= batcher.size < 150
+
+
+def test_shrinks_on_slow_responses_and_large_bodies():
+    batcher = AdaptiveBatcher('Test', initial=100, target_latency=10, max_response_bytes=1_000_000)
+    batcher.observe(100, latency=40)
+    assert batcher.size == 50
+    batcher.observe(50, latency=1.0, response_bytes=50 * 100_000)
+    assert batcher.size == 10
+
+
+def test_chunks_follow_the_current_size():
+    batcher = AdaptiveBatcher('Test', initial=2)
+    chunks = batcher.chunks(list(range(20)), 2)
+    assert next(chunks) == [[0, 1], [2, 3]]
+    batcher.observe(2, latency=1.0)
+    assert next(chunks) == [[4, 5, 6], [7, 8, 9]]
+    assert [i for chunk in chunks for part in chunk for i in part] == list(range(10, 20))
+
+
+def test_size_is_restored_from_state(tmp_path):
+    path = tmp_path / 'batch_sizes.json'
+    batcher = AdaptiveBatcher('Test', initial=100, state_path=path)
+    batcher.observe(100, latency=1.0)
+    batcher.save()
+    assert AdaptiveBatcher('Test', initial=10, state_path=path).size == 150
+
+
+def test_oversized_batch_is_split(authorized):
+    requested = []
+
+    async def handler(request: web.Request) -> web.Response:
+        ids: list = (await request.json())['ids']
+        requested.append(len(ids))
+        if len(ids) > 4:
+            return web.json_response({'message': 'payload too large'}, status=413)
+        return web.json_response([{'id': i} for i in ids])
+
+    class Batched(RuDataDF):
+        checkpoint = ''
+        batch_key = 'ids'
+        batch_size = 8
+
+        def payloads(self):
+            yield [{'ids': list(range(8))}]
+
+    async def scenario():
+        async with local_server(handler) as url:
+            method = Batched()
+            method.url = f'{url}/Batched'
+            return await method.send_requests()
+
+    df = run(scenario())
+    assert sorted(df['id']) == list(range(8))
+    assert requested[0] == 8 and max(requested[1:]) <= 4
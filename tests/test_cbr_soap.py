@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from pysimplesoap.client import SoapClient
+
+from src.sources.cbr import CBR_Soap as cbr_module
+from src.sources.cbr.CBR_Soap import CBR_Soap
+from src.utils.response_cache import ResponseCache
+
+
+# описания сервисов Банка России в формате .asmx (часть операций)
+FIXTURES = Path(__file__).parent / 'fixtures' / 'cbr'
+WSDL = {
+    CBR_Soap.wsdl_url_daily: FIXTURES / 'DailyInfo.wsdl',
+    CBR_Soap.wsdl_url_sec: FIXTURES / 'SecInfo.wsdl',
+}
+
+
+class Response:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class Session:
+    def __init__(self):
+        self.requested = []
+
+    def get(self, url: str) -> Response:
+        self.requested.append(url)
+        return Response(WSDL[url].read_bytes())
+
+
+@pytest.fixture
+def session(monkeypatch) -> Session:
+    session = Session()
+    monkeypatch.setattr(cbr_module.http_pool, 'requests_session', lambda: session)
+    monkeypatch.setattr(cbr_module, 'get_response_cache', lambda: None)
+    return session
+
+
+def operations(service: str, port: str, path: Path) -> dict:
+    """
+    Операции сервиса, как их разбирал SoapClient(wsdl=...) до кэширования XML
+    """
+    client = SoapClient(wsdl=path.as_uri(), namespace=CBR_Soap.cbr_namespace, trace=False)
+    return client.wsdl_parse(path.as_uri())[service]['ports'][port]['operations']
+
+
+def test_operations_are_parsed(session):
+    soap = CBR_Soap()
+    assert set(soap.wsdl_info) == {'KeyRate', 'KeyRateXML', 'EnumValutes', 'GetCursDynamic', 'IDRepoRUBXML'}
+    assert soap.wsdl_info['KeyRate']['url'] == CBR_Soap.url_daily
+    assert soap.wsdl_info['IDRepoRUBXML']['url'] == CBR_Soap.url_sec
+    assert soap.wsdl_info['KeyRate']['documentation'] == 'Ключевая ставка'
+    assert 'output' not in soap.wsdl_info['KeyRate']
+    params = soap.wsdl_info['GetCursDynamic']['input']['GetCursDynamic']
+    assert isinstance(params, OrderedDict)
+    assert list(params) == ['FromDate', 'ToDate', 'ValutaCode']
+    assert params['FromDate'] is datetime and soap.wsdl_info['EnumValutes']['input']['EnumValutes']['Seld'] is bool
+
+    soap.operation, soap.args = 'KeyRate', [datetime(2024, 9, 1), '2024-09-30']
+    soap.make_xml_param_string(soap.operation)
+    assert soap.param_string == '<web:fromDate>2024-09-01</web:fromDate><web:ToDate>2024-09-30</web:ToDate>'
+
+
+def test_same_operations_as_soap_client_with_wsdl_url(session):
+    soap = CBR_Soap()
+    expected = {
+        **operations('DailyInfo', 'DailyInfoSoap', WSDL[CBR_Soap.wsdl_url_daily]),
+        **operations('SecInfo', 'SecInfoSoap', WSDL[CBR_Soap.wsdl_url_sec]),
+    }
+    assert set(soap.wsdl_info) == set(expected)
+    for name, operation in expected.items():
+        assert soap.wsdl_info[name]['documentation'] == operation['documentation']
+        assert {key: dict(value) for key, value in soap.wsdl_info[name]['input'].items()} == \
+            {key: dict(value) for key, value in operation['input'].items()}
+
+
+def test_cache_keeps_raw_wsdl(session, tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path)
+    monkeypatch.setattr(cbr_module, 'get_response_cache', lambda: cache)
+    first = CBR_Soap()
+    assert sorted(session.requested) == sorted(WSDL)
+    assert cache.get('wsdl', CBR_Soap.wsdl_url_daily, 3600) == WSDL[CBR_Soap.wsdl_url_daily].read_bytes()
+
+    second = CBR_Soap()
+    assert len(session.requested) == 2
+    assert set(second.wsdl_info) == set(first.wsdl_info)
@@ -0,0 +1,154 @@
+import threading
+
+import pandas as pd
+import pytest
+from aiohttp import web
+
+from src.utils.run_context import RunContext
+from src.utils import clickhouse_client
+from src.sources.rudata.RuDataCheckpoint import FileCheckpoint, payload_key
+from src.sources.rudata.RuDataDF import RuDataPagesDF, UnexpectedStatusError
+from src.sources.rudata.RuDataMethod import AccruedInterestOnDate
+from tests.conftest import paged_server, serve
+
+
+class Pages(RuDataPagesDF):
+    checkpoint = 'file'
+    page_size = 10
+
+    def payload(self, page_num: int) -> dict:
+        return {'pageNum': page_num, 'pageSize': self.page_size}
+
+
+def rows(count: int) -> list:
+    return [{'id': i} for i in range(count)]
+
+
+def pages(requested: list) -> list:
+    return [payload['pageNum'] for payload in requested]
+
+
+def test_interrupted_load_resumes_from_journal(authorized):
+    handler, _ = paged_server(rows(95), failing_page=3)
+    with pytest.raises(UnexpectedStatusError):
+        serve(Pages(), handler, 'send_requests')
+    method = Pages()
+    keys = FileCheckpoint('Pages', method.report_yearmonth).keys()
+    journaled = {page for page in range(1, 11) if payload_key(method.payload(page)) in keys}
+    assert {1, 2} <= journaled and 3 not in journaled
+
+    handler, requested = paged_server(rows(95))
+    df = serve(Pages(), handler, 'send_requests')
+    assert sorted(df['id']) == list(range(95))
+    assert 3 in pages(requested)
+    assert not journaled & set(pages(requested))
+    assert len(set(pages(requested))) == len(requested)
+
+
+def test_journal_is_written_off_the_event_loop(authorized, monkeypatch):
+    threads = set()
+    save = FileCheckpoint.save
+
+    def recording_save(self, *args):
+        threads.add(threading.get_ident())
+        save(self, *args)
+
+    monkeypatch.setattr(FileCheckpoint, 'save', recording_save)
+    handler, _ = paged_server(rows(25))
+    serve(Pages(), handler, 'send_requests')
+    assert threads and threading.get_ident() not in threads
+
+
+def test_truncated_last_line_is_dropped(tmp_path):
+    journal = FileCheckpoint('Pages', '202401', directory=tmp_path)
+    journal.save('a', [{'id': 1}])
+    with open(journal.path, 'ab') as f:
+        f.write(b'{"key": "b", "bo')
+    restored = FileCheckpoint('Pages', '202401', directory=tmp_path)
+    assert restored.keys() == {'a'}
+    assert restored.body('a') == [{'id': 1}]
+
+
+def accrued_server(failing_id=None):
+    """
+    НКД по каждому id из fintoolIds. requested - списки id полученных запросов
+    """
+    requested = []
+
+    async def handler(request: web.Request) -> web.Response:
+        ids: list = (await request.json())['fintoolIds']
+        requested.append(ids)
+        if failing_id in ids:
+            return web.json_response({'message': 'bad request'}, status=400)
+        return web.json_response([{'fintoolid': i, 'ai': 1.5} for i in ids])
+    return handler, requested
+
+
+def accrued(batch_size: int) -> AccruedInterestOnDate:
+    method = AccruedInterestOnDate(context=RunContext.for_month('2024-09'))
+    method.batcher._size = batch_size
+    return method
+
+
+def test_resume_does_not_depend_on_batch_size(authorized, clickhouse):
+    clickhouse.add_table('FintoolReferenceData', pd.DataFrame({
+        'fintoolid': list(range(60)),
+        'report_date': pd.Timestamp('2024-09-30'),
+    }))
+    handler, _ = accrued_server(failing_id=30)
+    with pytest.raises(UnexpectedStatusError):
+        serve(accrued(4), handler, 'send_requests', client=clickhouse)
+    journaled = {
+        i for payload in FileCheckpoint('AccruedInterestOnDate', '202409').payloads().values()
+        for i in payload['fintoolIds']
+    }
+    assert set(range(20)) <= journaled and 30 not in journaled
+
+    # batcher подобрал другой размер: пачки не совпадают с прошлыми, но полученные id не запрашиваются
+    handler, requested = accrued_server()
+    df = serve(accrued(7), handler, 'send_requests', client=clickhouse)
+    ids = [i for part in requested for i in part]
+    assert 30 in ids
+    assert journaled.isdisjoint(ids)
+    assert len(ids) == len(set(ids))
+    assert sorted(df['fintoolid']) == list(range(60))
+
+
+class Connection:
+    """
+    Подключение журнала ClickHouse: пустой журнал, записи не сохраняются
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def command(self, sql: str, parameters=None, settings=None) -> int:
+        return 0
+
+    def query(self, sql: str, parameters=None):
+        return type('Result', (), {'result_rows': []})()
+
+    def insert(self, *args, **kwargs) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_clickhouse_journal_connection_is_closed(authorized, clickhouse, monkeypatch):
+    connections = []
+
+    def connect() -> Connection:
+        connections.append(Connection())
+        return connections[-1]
+
+    class Journaled(Pages):
+        checkpoint = 'clickhouse'
+
+    monkeypatch.setattr(clickhouse_client, 'connect', connect)
+    handler, _ = paged_server(rows(25), failing_page=2)
+    with pytest.raises(UnexpectedStatusError):
+        serve(Journaled(), handler, client=clickhouse)
+    handler, _ = paged_server(rows(25))
+    assert len(serve(Journaled(), handler, client=clickhouse)) == 25
+    assert len(connections) == 2 and all(connection.closed for connection in connections)
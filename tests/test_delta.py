@@ -0,0 +1,100 @@
+import pytest
+
+from src.utils.run_context import RunContext
+from src.sources.rudata.RuDataDF import RuDataPagesDF, UnexpectedStatusError
+from src.sources.rudata.RuDataDelta import RuDataDelta
+from src.sources.rudata.RuDataManifest import LoadManifest
+from tests.conftest import paged_server, serve
+
+
+class Refs(RuDataDelta, RuDataPagesDF):
+    delta = True
+    page_size = 5
+
+    def payload(self, page_num: int) -> dict:
+        return {'pageNum': page_num, 'pageSize': self.page_size, 'filter': self.delta_filter()}
+
+
+def refs(ids: range, updated: str) -> list:
+    return [{'fintoolid': i, 'name': f'bond {i} {updated}', 'update_date': updated} for i in ids]
+
+
+def changed_since(records: list):
+    """
+    Строки ответа: записи с update_date не раньше даты из filter
+    """
+    def rows(payload: dict) -> list:
+        since: str = payload['filter'].split("'")[1] if payload['filter'] else ''
+        return [record for record in records if record['update_date'] >= since]
+    return rows
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """
+    Срез строится в ClickHouse параметризованным представлением, здесь - только отметка о публикации
+    """
+    months = []
+
+    def publish_snapshot(self) -> int:
+        months.append(self.report_yearmonth)
+        return len(self.client.table(self.versions_table))
+
+    monkeypatch.setattr(Refs, '_publish_snapshot', publish_snapshot)
+    return months
+
+
+def load(clickhouse, handler, month: str, reload: bool = False) -> None:
+    serve(Refs(context=RunContext.for_month(month)), handler, client=clickhouse, read=False, reload=reload)
+
+
+def test_partial_failure_keeps_since_for_the_retry(authorized, clickhouse, published):
+    handler, requested = paged_server(changed_since(refs(range(12), '2024-09-10')))
+    load(clickhouse, handler, '2024-09')
+    assert requested[0]['filter'] == ''
+    assert LoadManifest(clickhouse).watermark('RefsVersions') == '2024-09-10T00:00:00'
+
+    # изменения за октябрь, новые первыми: вторая страница падает, в таблице версий уже есть строки
+    # за 2024-10-20, но изменения за 2024-10-05 еще не получены
+    records = refs(range(5), '2024-10-20') + refs(range(5, 12), '2024-10-05') + refs(range(12), '2024-09-10')
+    handler, requested = paged_server(changed_since(records), failing_page=2)
+    with pytest.raises(UnexpectedStatusError):
+        load(clickhouse, handler, '2024-10')
+    assert published == ['202409']
+    assert LoadManifest(clickhouse).watermark('RefsVersions') == '2024-09-10T00:00:00'
+    first_filter: str = requested[0]['filter']
+    assert first_filter == "update_date >= '2024-09-10'"
+
+    # повтор с тем же since: те же payloads, первая страница берется из журнала
+    handler, requested = paged_server(changed_since(records))
+    load(clickhouse, handler, '2024-10')
+    assert {payload['filter'] for payload in requested} == {first_filter}
+    assert 1 not in {payload['pageNum'] for payload in requested}
+    assert published == ['202409', '202410']
+    assert LoadManifest(clickhouse).watermark('RefsVersions') == '2024-10-20T00:00:00'
+    versions = clickhouse.table('RefsVersions')
+    october = versions[versions['update_date'] > '2024-10']
+    assert sorted(october['fintoolid'].drop_duplicates()) == list(range(12))
+
+
+def test_reload_requests_everything(authorized, clickhouse, published):
+    handler, _ = paged_server(changed_since(refs(range(12), '2024-09-10')))
+    load(clickhouse, handler, '2024-09')
+    handler, requested = paged_server(changed_since(refs(range(12), '2024-09-10')))
+    load(clickhouse, handler, '2024-09', reload=True)
+    assert requested and {payload['filter'] for payload in requested} == {''}
+    assert published == ['202409', '202409']
+    assert LoadManifest(clickhouse).watermark('RefsVersions') == '2024-09-10T00:00:00'
+
+
+def test_earlier_month_after_a_later_one_is_loaded_in_full(authorized, clickhouse, published):
+    handler, _ = paged_server(changed_since(refs(range(12), '2024-10-20')))
+    load(clickhouse, handler, '2024-10')
+    assert LoadManifest(clickhouse).watermark('RefsVersions') == '2024-10-20T00:00:00'
+
+    # изменения после 2024-10-20 не покрывают сентябрь
+    handler, requested = paged_server(changed_since(refs(range(12), '2024-10-20')))
+    load(clickhouse, handler, '2024-09')
+    assert requested and {payload['filter'] for payload in requested} == {''}
+    assert published == ['202410', '202409']
+    assert LoadManifest(clickhouse).watermark('RefsVersions') == '2024-10-20T00:00:00'
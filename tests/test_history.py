@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+from typing import Tuple
+
+import pandas as pd
+import pytest
+
+from src.utils.run_context import RunContext
+from src.sources.rudata.RuDataDF import RuDataPagesDF, UnexpectedStatusError
+from src.sources.rudata.RuDataHistory import RuDataHistory
+from src.sources.rudata.RuDataManifest import LoadManifest
+from tests.conftest import paged_server, serve
+
+
+ISINS = ('RU0001', 'RU0002', 'RU0003')
+
+
+class Prices(RuDataHistory, RuDataPagesDF):
+    incremental = True
+    page_size = 5
+    history_date = 'date'
+    history_key = ('isin',)
+    history_days = 5
+
+    def history_period(self) -> Tuple[date, date]:
+        return self.context.last_day_month - timedelta(days=self.history_days), self.context.last_day_month
+
+    def payload(self, page_num: int) -> dict:
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'dateFrom': self.date_from.strftime('%Y-%m-%d'),
+            'dateTo': self.date_to.strftime('%Y-%m-%d'),
+        }
+
+
+def prices(payload: dict) -> list:
+    """
+    Цена на каждый день dateFrom - dateTo по каждому ISIN
+    """
+    days = pd.date_range(payload['dateFrom'], payload['dateTo'])
+    return [{'isin': isin, 'date': day.strftime('%Y-%m-%d'), 'close': 100 + day.day} for day in days for isin in ISINS]
+
+
+def load(clickhouse, handler, month: str = '2024-09') -> pd.DataFrame:
+    return serve(Prices(context=RunContext.for_month(month)), handler, client=clickhouse)
+
+
+def test_partial_failure_does_not_move_the_watermark(authorized, clickhouse):
+    handler, requested = paged_server(prices, failing_page=3)
+    with pytest.raises(UnexpectedStatusError):
+        load(clickhouse, handler)
+    # строки упавшей загрузки остались в staging, дневная таблица и watermark не изменились
+    assert 'PricesDaily' not in clickhouse.tables
+    assert LoadManifest(clickhouse).watermark('PricesDaily') is None
+    first_from: str = requested[0]['dateFrom']
+
+    handler, requested = paged_server(prices)
+    df = load(clickhouse, handler)
+    assert {payload['dateFrom'] for payload in requested} == {first_from}
+    # полученные до ошибки страницы взяты из журнала
+    assert 3 in {payload['pageNum'] for payload in requested}
+    assert {1, 2}.isdisjoint(payload['pageNum'] for payload in requested)
+    daily = clickhouse.table('PricesDaily')
+    assert len(daily) == 6 * len(ISINS)
+    assert not daily.duplicated(['isin', 'date']).any()
+    assert LoadManifest(clickhouse).watermark('PricesDaily') == '2024-09-30'
+    assert sorted(df['isin']) == list(ISINS)
+    assert set(pd.to_datetime(df['date'])) == {pd.Timestamp('2024-09-30')}
+
+
+def test_next_load_starts_after_the_watermark(authorized, clickhouse):
+    handler, _ = paged_server(prices)
+    load(clickhouse, handler, '2024-09')
+    handler, requested = paged_server(prices)
+    load(clickhouse, handler, '2024-10')
+    assert {payload['dateFrom'] for payload in requested} == {'2024-10-01'}
+    assert LoadManifest(clickhouse).watermark('PricesDaily') == '2024-10-31'
+    assert len(clickhouse.table('PricesDaily')) == (6 + 31) * len(ISINS)
+
+    # окно раньше watermark не запрашивается и не сдвигает его назад
+    handler, requested = paged_server(prices)
+    load(clickhouse, handler, '2024-09')
+    assert requested == []
+    assert LoadManifest(clickhouse).watermark('PricesDaily') == '2024-10-31'
@@ -0,0 +1,29 @@
+import pytest
+
+from src.sources.rudata.RuDataDF import RuDataPagesDF, UnexpectedStatusError
+from tests.conftest import paged_server, serve
+
+
+class Pages(RuDataPagesDF):
+    checkpoint = ''
+    page_size = 10
+
+    def payload(self, page_num: int) -> dict:
+        return {'pageNum': page_num, 'pageSize': self.page_size}
+
+
+def rows(count: int) -> list:
+    return [{'id': i} for i in range(count)]
+
+
+def test_stops_at_first_short_page(authorized):
+    handler, requested = paged_server(rows(35))
+    df = serve(Pages(), handler, 'send_requests')
+    assert df['id'].tolist() == list(range(35))
+    assert 4 in {payload['pageNum'] for payload in requested}
+
+
+def test_error_status_fails_instead_of_truncating(authorized):
+    handler, _ = paged_server(rows(100), failing_page=3)
+    with pytest.raises(UnexpectedStatusError, match='HTTP 400'):
+        serve(Pages(), handler, 'send_requests')
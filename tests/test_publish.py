@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+from src.utils.run_context import RunContext
+from src.sources.rudata.RuDataDF import RuDataPagesDF, UnexpectedStatusError
+from src.sources.rudata.RuDataManifest import LoadManifest, COMPLETE
+from tests.conftest import paged_server, serve
+
+
+class Quotes(RuDataPagesDF):
+    page_size = 10
+
+    def payload(self, page_num: int) -> dict:
+        return {'pageNum': page_num, 'pageSize': self.page_size, 'date': self.context.last_day_month_str}
+
+
+def quotes(count: int, version: str) -> list:
+    return [{'id': i, 'version': version} for i in range(count)]
+
+
+def load(clickhouse, handler, month: str, reload: bool = False) -> pd.DataFrame:
+    return serve(Quotes(context=RunContext.for_month(month)), handler, client=clickhouse, reload=reload)
+
+
+def partition(clickhouse, month: str) -> pd.DataFrame:
+    table = clickhouse.tables['Quotes']
+    return table.partition(month.replace('-', ''))
+
+
+def test_reload_replaces_only_its_partition(authorized, clickhouse):
+    load(clickhouse, paged_server(quotes(25, 'v1'))[0], '2024-09')
+    load(clickhouse, paged_server(quotes(15, 'v1'))[0], '2024-08')
+    assert len(partition(clickhouse, '2024-09')) == 25
+    assert LoadManifest(clickhouse).status('Quotes', '202409') == COMPLETE
+
+    # упавшая перезагрузка не трогает опубликованную партицию
+    handler, _ = paged_server(quotes(30, 'v2'), failing_page=2)
+    with pytest.raises(UnexpectedStatusError):
+        load(clickhouse, handler, '2024-09', reload=True)
+    assert set(partition(clickhouse, '2024-09')['version']) == {'v1'}
+    assert len(partition(clickhouse, '2024-09')) == 25
+
+    handler, _ = paged_server(quotes(30, 'v2'))
+    df = load(clickhouse, handler, '2024-09', reload=True)
+    assert len(df) == 30
+    september = partition(clickhouse, '2024-09')
+    assert len(september) == 30 and set(september['version']) == {'v2'}
+    assert len(partition(clickhouse, '2024-08')) == 15
+    assert clickhouse.tables['QuotesStaging'].df.empty
+    assert any(
+        command.startswith('ALTER TABLE "Quotes" REPLACE PARTITION ID \'202409\'') for command in clickhouse.commands
+    )
+
+    # загруженный месяц читается из ClickHouse без запросов
+    handler, requested = paged_server(quotes(30, 'v3'))
+    df = load(clickhouse, handler, '2024-09')
+    assert requested == []
+    assert set(df['version']) == {'v2'}
+
+
+def test_empty_reload_keeps_the_partition(authorized, clickhouse):
+    load(clickhouse, paged_server(quotes(25, 'v1'))[0], '2024-09')
+    commands: int = len(clickhouse.commands)
+
+    df = load(clickhouse, paged_server([])[0], '2024-09', reload=True)
+    assert len(df) == 25 and set(df['version']) == {'v1'}
+    assert len(partition(clickhouse, '2024-09')) == 25
+    assert LoadManifest(clickhouse).status('Quotes', '202409') == COMPLETE
+    assert not any('REPLACE PARTITION' in command for command in clickhouse.commands[commands:])
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from src.utils.metrics import metrics
+from src.utils.rate_limiter import RateLimiter
+from src.sources.rudata.RuDataDF import RuDataDF
+from tests.conftest import serve
+
+
+def test_in_flight_requests_are_bounded():
+    limiter = RateLimiter('Test', rate=1000, max_in_flight=2)
+    active, peak = 0, 0
+
+    async def request():
+        nonlocal active, peak
+        async with limiter:
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def scenario():
+        await asyncio.gather(*(request() for _ in range(8)))
+
+    asyncio.run(scenario())
+    assert peak == 2
+
+
+def test_requests_are_spaced_by_rate():
+    limiter = RateLimiter('Test', rate=20, max_in_flight=5)
+
+    async def scenario():
+        start: float = time.monotonic()
+        for _ in range(5):
+            async with limiter:
+                pass
+        return time.monotonic() - start
+
+    # первый токен сразу, следующие четыре - через 1/20 с
+    assert asyncio.run(scenario()) >= 0.18
+
+
+def test_rate_backs_off_on_throttling_and_recovers():
+    limiter = RateLimiter('Test', rate=10, max_in_flight=5, min_rate=2, increase=0.1)
+    limiter.feedback(429)
+    assert limiter.rate == 5
+    limiter.feedback(503)
+    limiter.feedback(503)
+    assert limiter.rate == 2
+    for _ in range(20):
+        limiter.feedback(200)
+    assert limiter.rate == 10
+    assert limiter.throttled == 3
+
+
+def test_retry_after_delays_the_next_request():
+    limiter = RateLimiter('Test', rate=100, max_in_flight=5)
+
+    async def scenario():
+        async with limiter:
+            pass
+        limiter.feedback(429, retry_after=0.2)
+        start: float = time.monotonic()
+        async with limiter:
+            pass
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.2
+
+
+def test_parent_limits_children():
+    parent = RateLimiter('RuData', rate=1000, max_in_flight=1)
+    children = [RateLimiter(name, rate=1000, max_in_flight=5, parent=parent) for name in ('A', 'B')]
+    active, peak = 0, 0
+
+    async def request(limiter: RateLimiter):
+        nonlocal active, peak
+        async with limiter:
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def scenario():
+        await asyncio.gather(*(request(child) for child in children for _ in range(3)))
+
+    asyncio.run(scenario())
+    assert peak == 1
+    children[0].feedback(429)
+    assert parent.rate == 500 and children[1].rate == 1000
+
+
+def test_rate_and_throttling_are_written_to_metrics(authorized):
+    handled = []
+
+    async def handler(request: web.Request) -> web.Response:
+        handled.append(request)
+        if len(handled) == 1:
+            return web.json_response({'message': 'Too Many Requests'}, status=429)
+        return web.json_response([{'id': 1}])
+
+    class Throttled(RuDataDF):
+        checkpoint = ''
+
+        def payloads(self):
+            yield [{}]
+
+    metrics.reset()
+    method = Throttled()
+    assert serve(method, handler, 'send_requests')['id'].tolist() == [1]
+    endpoint_metrics = metrics.endpoints['Throttled']
+    assert endpoint_metrics.throttle_events == 1
+    assert endpoint_metrics.rate_rps == method.limiter.effective_rate < method.limiter.max_rate
+    assert metrics.summary()['endpoints']['Throttled']['rate_rps'] == round(endpoint_metrics.rate_rps, 3)
+    text: str = metrics.prometheus()
+    assert f'rudata_rate_limit_rps{{endpoint="Throttled"}} {endpoint_metrics.rate_rps:g}' in text
+    assert 'rudata_throttle_events_total{endpoint="Throttled"} 1' in text
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from benchmarks.fake_rudata import FakeRuData
+from src.utils import retries
+from src.utils.http_session import run
+from src.utils.retries import retry, RetryableError
+from src.sources.rudata.RuDataDF import RuDataDF
+from tests.conftest import local_server
+
+
+def failing(errors):
+    """
+    Функция, которая поднимает ошибки errors по очереди, затем возвращает 'ok'
+    """
+    errors = list(errors)
+
+    @retry(exceptions=RetryableError, tries=4, delay=1, backoff=2)
+    async def call():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+    return call
+
+
+def test_backoff_and_retry_after(monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(retries.asyncio, 'sleep', sleep)
+    call = failing([RetryableError('429'), RetryableError('503', retry_after=5), RetryableError('429')])
+    assert asyncio.run(call()) == 'ok'
+    assert waits == [1, 5, 4]
+
+
+def test_retry_without_backoff_keeps_the_delay(monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(retries.asyncio, 'sleep', sleep)
+    call = failing([RetryableError('429'), RetryableError('401', backoff=False), RetryableError('429')])
+    assert asyncio.run(call()) == 'ok'
+    assert waits == [1, 0, 2]
+
+
+def test_refreshed_token_is_used_at_once(authorized):
+    tokens = []
+
+    async def handler(request: web.Request) -> web.Response:
+        tokens.append(request.headers['Authorization'])
+        if len(tokens) == 1:
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        return web.json_response([{'id': 1}])
+
+    class Method(RuDataDF):
+        checkpoint = ''
+
+        def payloads(self):
+            yield [{}]
+
+    async def scenario():
+        async with local_server(handler) as url:
+            method = Method()
+            method.url = f'{url}/Method'
+            start: float = time.monotonic()
+            df = await method.send_requests()
+            return df, time.monotonic() - start
+
+    df, elapsed = run(scenario())
+    assert df['id'].tolist() == [1]
+    assert len(tokens) == 2 and tokens[0] != tokens[1]
+    # пауза retry (не меньше 0.5 с) не нужна: новый токен действует сразу
+    assert elapsed < 0.5
+
+
+def test_injected_errors_do_not_depend_on_request_order():
+    payloads = [{'pageNum': page, 'pageSize': 100} for page in range(1, 41)]
+
+    def attempts(server: FakeRuData, order) -> dict:
+        result = {}
+        for payload in order:
+            statuses = []
+            while (status := server.injected_error('Info/Emitents', payload)) is not None:
+                statuses.append(status)
+            result[payload['pageNum']] = statuses
+        return result
+
+    forward = attempts(FakeRuData(error_rate=0.5, seed=7), payloads)
+    backward = attempts(FakeRuData(error_rate=0.5, seed=7), reversed(payloads))
+    assert forward == backward
+    assert any(forward.values())
+    assert max(len(statuses) for statuses in forward.values()) <= 2
+    assert attempts(FakeRuData(error_rate=0.5, seed=8), payloads) != forward
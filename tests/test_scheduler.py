@@ -0,0 +1,112 @@
+import time
+from datetime import date, timedelta
+from typing import List, Tuple
+
+import pandas as pd
+import pytest
+
+from src.sources.rudata import RuDataScheduler as scheduler_module
+from src.sources.rudata.RuData import BASE_URL
+from src.sources.rudata.RuDataDF import RuDataPagesDF
+from src.sources.rudata.RuDataHistory import RuDataHistory
+from src.sources.rudata.RuDataManifest import LoadManifest
+from src.sources.rudata.RuDataScheduler import RuDataScheduler
+from src.utils.run_context import RunContext
+
+
+CONTEXT = RunContext.for_month('2024-09')
+
+
+@pytest.fixture
+def connections(clickhouse, monkeypatch):
+    """
+    Подключения, которые scheduler открывает для методов, - общий FakeClickHouse, закрытия считаются
+    """
+    closed = []
+    monkeypatch.setattr(clickhouse, 'close', lambda: closed.append(True))
+    monkeypatch.setattr(scheduler_module, 'connect', lambda: clickhouse)
+    return closed
+
+
+class PriceHistory(RuDataHistory, RuDataPagesDF):
+    """
+    Как RUPriceHistory, но по строкам FakeRuData: инструмент - _key, дата - dateTo запроса
+    """
+    url = f'{BASE_URL}/RUPrice/History'
+    page_size = 10
+    history_date = 'date'
+    history_key = ('_key',)
+    history_days = 5
+    date_from_requested: List[str] = []
+
+    def history_period(self) -> Tuple[date, date]:
+        return self.context.last_day_month - timedelta(days=self.history_days), self.context.last_day_month
+
+    def payload(self, page_num: int) -> dict:
+        self.date_from_requested.append(self.date_from.strftime('%Y-%m-%d'))
+        return {
+            'pageNum': page_num,
+            'pageSize': self.page_size,
+            'dateFrom': self.date_from.strftime('%Y-%m-%d'),
+            'dateTo': self.date_to.strftime('%Y-%m-%d'),
+        }
+
+
+def fintools(clickhouse, count: int = 30) -> None:
+    clickhouse.add_table('FintoolReferenceData', pd.DataFrame({
+        'fintoolid': [str(i) for i in range(count)],
+        'report_date': pd.Timestamp('2024-09-30'),
+    }))
+
+
+def test_id_query_does_not_block_other_methods(server, authorized, clickhouse, connections, monkeypatch):
+    fintools(clickhouse)
+    query_df = clickhouse.query_df
+    overlapped = []
+
+    def slow_query_df(sql, parameters=None):
+        if 'DISTINCT fintoolid' in sql:
+            # запросы AffiliateTypes доходят до сервера, только пока event loop не занят этим запросом
+            deadline: float = time.monotonic() + 5
+            while 'Affiliate/types' not in server.stats and time.monotonic() < deadline:
+                time.sleep(0.01)
+            overlapped.append('Affiliate/types' in server.stats)
+        return query_df(sql, parameters)
+
+    monkeypatch.setattr(clickhouse, 'query_df', slow_query_df)
+    frames = RuDataScheduler(
+        ['AccruedInterestOnDate', 'AffiliateTypes'], include_dependencies=False, context=CONTEXT
+    ).run()
+    assert overlapped == [True]
+    assert len(frames['AccruedInterestOnDate']) == 30
+    assert len(connections) == 2
+
+
+def test_connections_are_closed_when_a_method_fails(server, authorized, clickhouse, connections):
+    with pytest.raises(RuntimeError, match='AccruedInterestOnDate'):
+        # таблицы FintoolReferenceData нет - payloads падает
+        RuDataScheduler(['AccruedInterestOnDate'], include_dependencies=False, context=CONTEXT).run()
+    assert len(connections) == 1
+
+
+def test_incremental_history_through_scheduler(server, authorized, clickhouse, connections, monkeypatch):
+    monkeypatch.setenv('RUDATA_INCREMENTAL', '1')
+    monkeypatch.setattr(server, 'rows', 25)
+    monkeypatch.setattr(PriceHistory, 'date_from_requested', [])
+    frames = RuDataScheduler(['PriceHistory'], context=CONTEXT).run()
+    assert len(frames['PriceHistory']) == 25
+    assert set(PriceHistory.date_from_requested) == {'2024-09-25'}
+
+    # окно уже загружено: запросов нет
+    PriceHistory.date_from_requested.clear()
+    frames = RuDataScheduler(['PriceHistory'], context=CONTEXT).run()
+    assert PriceHistory.date_from_requested == []
+    assert len(frames['PriceHistory']) == 25
+
+    # reload запрашивает окно заново, строки с тем же ключом и датой заменяются
+    frames = RuDataScheduler(['PriceHistory'], context=CONTEXT, reload=True).run()
+    assert set(PriceHistory.date_from_requested) == {'2024-09-25'}
+    assert len(frames['PriceHistory']) == 25
+    assert len(clickhouse.tables['PriceHistoryDaily'].final()) == 25
+    assert LoadManifest(clickhouse).watermark('PriceHistoryDaily') == '2024-09-30'
+    assert len(connections) == 3